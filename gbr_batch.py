@@ -0,0 +1,51 @@
+# Go board recognition project
+# Headless batch processing
+# (c) kol, 2019-2023
+
+import sys
+import logging
+from argparse import ArgumentParser
+
+from gr.batch import run_batch
+
+def main():
+    parser = ArgumentParser(description = 'Recognize all board images in a directory')
+    parser.add_argument('path', help = 'Directory with images or a single image file')
+    parser.add_argument('-o', '--out', default = 'out',
+        help = 'Output directory (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type = int, default = 0,
+        help = 'Number of worker processes (default: number of CPUs)')
+    parser.add_argument('-r', '--recursive', action = 'store_true',
+        help = 'Process subdirectories too')
+    parser.add_argument('--no-sgf', action = 'store_true',
+        help = 'Do not save SGF files')
+    parser.add_argument('-t', '--transform', action = 'store_true',
+        help = 'Detect board corners and transform images with no transformation defined')
+    parser.add_argument('-v', '--verbose', action = 'store_true',
+        help = 'Print every processed image')
+    args = parser.parse_args()
+
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    logging.basicConfig(level = log_level, format = '%(levelname)s: %(message)s')
+
+    def _print_result(r):
+        if 'error' in r:
+            print('{}: ERROR {}'.format(r['file'], r['error']))
+        elif args.verbose:
+            print('{}: {} black, {} white stones ({:.3f} sec)'.format(
+                r['file'], len(r['black']), len(r['white']), r['time']))
+
+    summary = run_batch(args.path, args.out,
+                        workers = args.workers,
+                        recursive = args.recursive,
+                        f_sgf = not args.no_sgf,
+                        f_transform = args.transform,
+                        log_level = log_level,
+                        callback = _print_result)
+
+    print('{images} images processed by {workers} workers in {time} sec, '
+          '{images_per_sec} images/sec, {errors} errors'.format(**summary))
+    return 1 if summary['errors'] > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
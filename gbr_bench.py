@@ -0,0 +1,96 @@
+# Go board recognition project
+# Recognition benchmark
+# (c) kol, 2019-2023
+
+import sys
+import logging
+from fnmatch import fnmatch
+from argparse import ArgumentParser
+
+from gr.grdef import *
+from gr.batch import find_images
+from gr.bench import run_bench, save_report, load_report, compare_reports
+from gr.bench import DEF_THRESHOLD, DEF_MIN_TIME
+
+def run(args):
+    files = find_images(args.path)
+    if args.glob:
+        files = [f for f in files if fnmatch(f.name, args.glob)]
+    if args.limit > 0:
+        files = files[:args.limit]
+
+    def _print_result(r):
+        if 'error' in r:
+            print('{}: ERROR {}'.format(r['file'], r['error']))
+        else:
+            print('{}: {:.4f} sec, {} black, {} white stones'.format(
+                r['file'], r['time'], r['black'], r['white']))
+
+    debug = {'none': DEBUG_NONE, 'lazy': DEBUG_LAZY, 'full': DEBUG_FULL}[args.debug]
+    report = run_bench(files, repeat = args.repeat, debug = debug,
+                       f_memory = not args.no_memory,
+                       callback = _print_result if args.verbose else None)
+    save_report(report, args.out)
+
+    s = report['summary']
+    print('{} images, {} errors, {:.3f} sec, {:.2f} images/sec, peak memory {:.1f} MB'.format(
+        s['images'], s['errors'], s['time'], s['images_per_sec'], s['peak_mem'] / 1024 / 1024))
+    for k in sorted(s['stages'], key = lambda k: -s['stages'][k]['total']):
+        print('  {:<20} {:>10.4f} sec total {:>10.4f} sec mean'.format(
+            k, s['stages'][k]['total'], s['stages'][k]['mean']))
+    print('Report saved to {}'.format(args.out))
+    return 0
+
+def compare(args):
+    diff = compare_reports(load_report(args.old), load_report(args.new),
+                           threshold = args.threshold / 100.0, min_time = args.min_time)
+    n_reg = 0
+    for d in diff:
+        if d['regression']: n_reg += 1
+        print('{:<20} {:>10.4f} {:>10.4f} {:>+8.1f}% {}'.format(
+            d['stage'], d['old'], d['new'], d['change'] * 100,
+            'REGRESSION' if d['regression'] else ''))
+    print('{} regressions found'.format(n_reg))
+    return 1 if n_reg > 0 else 0
+
+def main():
+    parser = ArgumentParser(description = 'Board recognition benchmark')
+    sub = parser.add_subparsers(dest = 'cmd')
+    sub.required = True
+
+    p = sub.add_parser('run', help = 'Run benchmark and save a report')
+    p.add_argument('path', nargs = '?', default = 'img',
+        help = 'Directory with images or a single image file (default: %(default)s)')
+    p.add_argument('-o', '--out', default = 'bench.json',
+        help = 'Report file (default: %(default)s)')
+    p.add_argument('-g', '--glob', help = 'Process only files matching the pattern')
+    p.add_argument('-n', '--limit', type = int, default = 0,
+        help = 'Maximum number of images to process')
+    p.add_argument('-r', '--repeat', type = int, default = 1,
+        help = 'Number of runs per image, minimal time is taken (default: %(default)s)')
+    p.add_argument('-d', '--debug', choices = ['none', 'lazy', 'full'], default = 'none',
+        help = 'Debug images generation level (default: %(default)s)')
+    p.add_argument('--no-memory', action = 'store_true',
+        help = 'Do not measure memory usage')
+    p.add_argument('-v', '--verbose', action = 'store_true',
+        help = 'Print every processed image')
+    p.set_defaults(fn = run)
+
+    p = sub.add_parser('compare', help = 'Compare two reports')
+    p.add_argument('old', help = 'Baseline report')
+    p.add_argument('new', help = 'New report')
+    p.add_argument('-t', '--threshold', type = float, default = DEF_THRESHOLD * 100,
+        help = 'Stage time increase (in percent) treated as regression (default: %(default)s)')
+    p.add_argument('-m', '--min-time', type = float, default = DEF_MIN_TIME,
+        help = 'Minimal stage time increase (sec) treated as regression (default: %(default)s)')
+    p.set_defaults(fn = compare)
+
+    args = parser.parse_args()
+
+    # Recognition reports errors for every misplaced stone, they are not needed here
+    logging.basicConfig(level = logging.WARNING if getattr(args, 'verbose', False) else logging.CRITICAL,
+        format = '%(levelname)s: %(message)s')
+    return args.fn(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# Go board recognition project
+# Headless batch processing of image directories
+# (c) kol, 2019-2023
+
+import os
+import cv2
+import json
+import time
+import logging
+import multiprocessing as mp
+from pathlib import Path
+
+from .grdef import *
+from .board import GrBoard
+
+IMAGE_EXT = ['.png', '.jpg', '.jpeg', '.bmp']   # image file extensions to process
+RESULTS_FILE = 'results.jsonl'                  # name of per-image results file
+
+def find_images(path, recursive = False):
+    """Returns a sorted list of image files in given directory.
+    If path points to a file, a list with that single file is returned"""
+    path = Path(path)
+    if path.is_file():
+        return [path]
+
+    files = path.rglob('*') if recursive else path.glob('*')
+    return sorted([f for f in files if f.is_file() and f.suffix.lower() in IMAGE_EXT])
+
+def sgf_names(files):
+    """Returns SGF file names for given image files.
+    Normally, an SGF file is named after the image, but if several images share the same
+    name with different extensions, an extension is appended to keep all results"""
+    stems = [f.stem for f in files]
+    return [f.stem + '.sgf' if stems.count(f.stem) < 2 else f.stem + '_' + f.suffix[1:] + '.sgf'
+            for f in files]
+
+def _stones_tolist(stones):
+    """Represents list of stones as plain list of ints suitable for JSON"""
+    return [[int(x) for x in s[0:GR_BW]] for s in stones]
+
+def process_file(job):
+    """Process single image file.
+
+    Parameters:
+        job     A tuple of (image file name, SGF file name or None, auto transform flag).
+                If auto transform flag is set and no transformation is defined in
+                image parameters, board corners are detected and the image is
+                transformed to them (see GrBoard.detect_transform())
+
+    Returns:
+        Dictionary of processing results, which is to be saved as a JSON line
+    """
+    filename, sgf_file, f_transform = job
+    t = time.perf_counter()
+    r = {'file': str(filename)}
+
+    try:
+        board = GrBoard(f_compact = True)
+        r['params'] = board.load_image(filename, f_with_params = True, f_process = False)
+        if f_transform and board.param_transform_rect is None:
+            corners, confidence = board.detect_transform()
+            r['transform_confidence'] = round(confidence, 3)
+            if board.param_transform_rect is not None:
+                r['transform'] = corners
+        board.process(f_cache = False, debug = DEBUG_NONE)
+
+        if board.results is None:
+            r['error'] = 'Board could not be recognized'
+        else:
+            r['board_size'] = int(board.board_size)
+            r['edges'] = [[int(x) for x in e] for e in board.board_edges]
+            r['spacing'] = [round(float(x), 2) for x in board.results[GR_SPACING]]
+            r['black'] = _stones_tolist(board.black_stones)
+            r['white'] = _stones_tolist(board.white_stones)
+            if sgf_file is not None:
+                r['sgf'] = str(board.save_sgf(str(sgf_file)))
+    except Exception as e:
+        logging.exception('Error processing {}'.format(filename))
+        r['error'] = str(e)
+
+    r['time'] = round(time.perf_counter() - t, 4)
+    return r
+
+def _init_worker(log_level):
+    """Worker process initialization"""
+    # Spawned workers do not inherit logging configuration of the main process
+    logging.basicConfig(format = '%(levelname)s: %(message)s')
+    logging.getLogger().setLevel(log_level)
+
+    # Each worker is given a core, so OpenCV should not spawn its own threads
+    cv2.setNumThreads(1)
+
+def run_batch(path, out_dir, workers = None, recursive = False, f_sgf = True,
+              f_transform = False, log_level = logging.WARNING, callback = None):
+    """Process all images in a directory.
+
+    Images are processed in a pool of worker processes. Each image is loaded
+    with its recognition parameters (.gpar file) as GrBoard.load_image() does.
+    Results are streamed to out_dir as they become available: an SGF file per
+    image and a JSON line per image in results.jsonl. Results are written in
+    the order of the file list regardless of which worker finished first.
+
+    Parameters:
+        path        Directory or a single image file to process
+        out_dir     Output directory
+        workers     Number of worker processes (None - number of CPUs)
+        recursive   If True, subdirectories are scanned too
+        f_sgf       If True, SGF files are saved
+        f_transform If True, images with no transformation defined are transformed
+                    to automatically detected board corners
+        log_level   Logging level in worker processes
+        callback    A function called with each result dictionary
+
+    Returns:
+        Summary dictionary (number of images, errors, elapsed time and images per second)
+    """
+    files = find_images(path, recursive)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents = True, exist_ok = True)
+
+    if f_sgf:
+        jobs = [(f, out_dir.joinpath(s), f_transform) for f, s in zip(files, sgf_names(files))]
+    else:
+        jobs = [(f, None, f_transform) for f in files]
+
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+    logging.info('Processing {} images with {} workers'.format(len(jobs), workers))
+
+    t = time.perf_counter()
+    n_errors = 0
+    with open(str(out_dir.joinpath(RESULTS_FILE)), 'w') as f:
+        with mp.Pool(workers, initializer = _init_worker, initargs = (log_level,)) as pool:
+            # imap keeps results ordered while workers pick up new images
+            # as soon as they are done, so all cores are kept busy
+            for r in pool.imap(process_file, jobs, chunksize = 1):
+                if 'error' in r: n_errors += 1
+                f.write(json.dumps(r) + '\n')
+                f.flush()
+                if callback is not None: callback(r)
+
+    elapsed = time.perf_counter() - t
+    return {
+        'images': len(jobs),
+        'errors': n_errors,
+        'workers': workers,
+        'time': round(elapsed, 3),
+        'images_per_sec': round(len(jobs) / elapsed, 2) if elapsed > 0 else 0.0
+    }
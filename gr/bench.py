@@ -0,0 +1,191 @@
+# Go board recognition project
+# Recognition benchmark
+# (c) kol, 2019-2023
+
+import cv2
+import sys
+import json
+import time
+import logging
+import platform
+import tracemalloc
+import numpy as np
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from .grdef import *
+from .board import GrBoard
+from .gr import process_img
+from .hooks import GrStageTimings
+
+DEF_THRESHOLD = 0.1         # default relative stage time increase treated as regression
+DEF_MIN_TIME = 0.0005       # default minimal absolute stage time increase (sec) treated as regression
+
+def bench_file(filename, repeat = 1, debug = DEBUG_NONE, f_memory = True):
+    """Benchmark recognition of single image.
+
+    Parameters:
+        filename    Image file name. Recognition parameters are loaded from .gpar file, if one exists.
+        repeat      Number of runs. Minimal time of all runs is taken for every stage.
+        debug       Debug level (see gr.process_img())
+        f_memory    If True, peak memory allocated by recognition is measured (tracemalloc).
+                    Tracing slows down Python code, so memory is measured in a separate run.
+
+    Returns:
+        A dictionary with image info, stage timings and results summary
+    """
+    r = {'file': str(filename)}
+    try:
+        board = GrBoard(f_compact = True)
+        board.load_image(filename, f_with_params = True, f_process = False)
+        img, params = board.image, board.params
+        r['shape'] = list(img.shape)
+
+        stages = dict()
+        total = None
+        for n in range(max(repeat, 1)):
+            hook = GrStageTimings()
+            t = time.perf_counter()
+            res = process_img(img, params, debug = debug, hook = hook)
+            t = time.perf_counter() - t
+
+            total = t if total is None else min(total, t)
+            timings = hook.timings
+            for k in timings:
+                stages[k] = timings[k] if k not in stages else min(stages[k], timings[k])
+
+        if f_memory:
+            tracemalloc.start()
+            process_img(img, params, debug = debug)
+            r['peak_mem'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        r['time'] = total
+        r['stages'] = stages
+        if res is None:
+            r['error'] = 'Board could not be recognized'
+        else:
+            r['board_size'] = int(res[GR_BOARD_SIZE])
+            r['black'] = len(res[GR_STONES_B]) if res[GR_STONES_B] is not None else 0
+            r['white'] = len(res[GR_STONES_W]) if res[GR_STONES_W] is not None else 0
+
+    except Exception as e:
+        logging.exception('Error processing {}'.format(filename))
+        r['error'] = str(e)
+
+    return r
+
+def summarize(images):
+    """Summarize per-image benchmark results"""
+    stages = dict()
+    for r in images:
+        for k, t in r.get('stages', {}).items():
+            s = stages.setdefault(k, {'count': 0, 'total': 0.0})
+            s['count'] += 1
+            s['total'] += t
+    for s in stages.values():
+        s['mean'] = s['total'] / s['count']
+
+    ok = [r for r in images if 'error' not in r]
+    total = sum([r['time'] for r in ok])
+    return {
+        'images': len(images),
+        'errors': len(images) - len(ok),
+        'time': total,
+        'images_per_sec': len(ok) / total if total > 0 else 0.0,
+        'peak_mem': max([r.get('peak_mem', 0) for r in images], default = 0),
+        'black': sum([r['black'] for r in ok]),
+        'white': sum([r['white'] for r in ok]),
+        'stages': stages
+    }
+
+def run_bench(files, repeat = 1, debug = DEBUG_NONE, f_memory = True, callback = None):
+    """Run benchmark on given image files.
+
+    Parameters:
+        files       List of image files
+        repeat      Number of runs for every image (minimal time is taken)
+        debug       Debug level (see gr.process_img())
+        f_memory    If True, peak memory allocated by recognition is measured
+        callback    A function called with each image result
+
+    Returns:
+        Benchmark report (a dictionary which could be saved as JSON)
+    """
+    images = []
+    for f in files:
+        r = bench_file(f, repeat, debug, f_memory)
+        images.append(r)
+        if callback is not None: callback(r)
+
+    return {
+        'info': {
+            'date': datetime.now().isoformat(timespec = 'seconds'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'repeat': repeat,
+            'debug': debug,
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * \
+                (1 if sys.platform == 'darwin' else 1024) if resource is not None else None
+        },
+        'summary': summarize(images),
+        'images': images
+    }
+
+def save_report(report, filename):
+    """Save benchmark report to JSON file"""
+    with open(str(filename), 'w') as f:
+        json.dump(report, f, indent = 4)
+
+def load_report(filename):
+    """Load benchmark report from JSON file"""
+    with open(str(filename)) as f:
+        return json.load(f)
+
+def compare_reports(old, new, threshold = DEF_THRESHOLD, min_time = DEF_MIN_TIME):
+    """Compare two benchmark reports.
+    Stage mean times are compared for stages present in both reports.
+    Images processed in only one of the reports are ignored.
+
+    Parameters:
+        old, new    Benchmark reports (see run_bench())
+        threshold   Relative time increase treated as regression (0.1 means 10%)
+        min_time    Minimal absolute time increase treated as regression (sec)
+
+    Returns:
+        A list of dictionaries with stage name, old and new mean times,
+        relative change and regression flag
+    """
+    def _stages(report, files):
+        images = [r for r in report['images'] if r['file'] in files and 'error' not in r]
+        s = summarize(images)['stages']
+        s['TOTAL'] = {'mean': np.mean([r['time'] for r in images]) if images else 0.0}
+        return s
+
+    files = set([r['file'] for r in old['images']]) & set([r['file'] for r in new['images']])
+    s_old = _stages(old, files)
+    s_new = _stages(new, files)
+
+    ret = []
+    for k in s_old:
+        if k not in s_new:
+            continue
+        t_old = s_old[k]['mean']
+        t_new = s_new[k]['mean']
+        change = (t_new - t_old) / t_old if t_old > 0 else 0.0
+        ret.append({
+            'stage': k,
+            'old': t_old,
+            'new': t_new,
+            'change': change,
+            'regression': change > threshold and t_new - t_old > min_time
+        })
+    return ret
@@ -7,29 +7,34 @@ import json
 import logging
 import numpy as np
 from pathlib import Path
-from imutils.perspective import four_point_transform
 from sgfmill import sgf
 
 from .grdef import *
-from .gr import process_img, detect_board, generate_board
+from .gr import process_img, detect_board, generate_board, move_grid, find_board_corners
 from .utils import resize, resize2
 from .params import GrParams
-from .stones import GrStones
+from .stones import GrStones, GrArrayStones, GrBoardState
+from .cache import GrStageCache
+from .transform import warp_image, unwarp_stones
 
 BOARD_PARAM_EXT = '.gpar'  # extension for board parameters file
 
 class GrBoard:
     """ Go board """
-    def __init__(self, image_file=None, board_shape=None):
+    def __init__(self, image_file=None, board_shape=None, f_compact=False):
         """ Create new instance either for image file or by generation
 
         Parameters:
             image_file       Name of image file to load
             board_shape      Generated board shape, if no image file is provided
+            f_compact        If True, stones are stored in arrays (GrArrayStones)
+                             rather than in GrStone objects (GrStones)
 
         """
         self._params = GrParams()
-        self._stones = GrStones()
+        self._stones = GrArrayStones() if f_compact else GrStones()
+        self._state = None
+        self._cache = GrStageCache()
         self._res = None
         self._img = None
         self._img_file = None
@@ -67,6 +72,7 @@ class GrBoard:
         self._img = img
         self._src_img = img.copy()
         self._res = None
+        self._cache.clear()
 
         # Load params, if requested and file exists
         f_params_loaded = False
@@ -194,19 +200,32 @@ class GrBoard:
         self._params['BOARD_SIZE'] = size
         return edges, size
 
-    def process(self):
-        """Perform recognition of board image"""
+    def process(self, f_parallel = False, f_cache = True, debug = DEBUG_FULL, hook = None):
+        """Perform recognition of board image
+
+        Parameters:
+            f_parallel      If True, black and white stones are detected concurrently
+            f_cache         If True, results of recognition stages are cached, so
+                            when parameters change, only affected stages are rerun
+            debug           Debug images generation level (DEBUG_NONE, DEBUG_LAZY, DEBUG_FULL),
+                            see gr.process_img()
+            hook            A function called on start and end of every recognition stage,
+                            see gr.process_img() and hooks.GrStageEvent
+        """
         if self._img is None or self._gen_board:
             self._res = None
             self._stones.clear()
         else:
-            self._res = process_img(self._img, self._params)
+            self._res = process_img(self._img, self._params, f_parallel = f_parallel,
+                                    cache = self._cache if f_cache else None,
+                                    debug = debug, hook = hook)
             self._stones.clear(with_forced = False)
             if self._res is not None:
                 self._stones.add_ext(self._res[GR_STONES_B], STONE_BLACK, with_forced=False,
                                      mark_forced=False, mark_added=False)
                 self._stones.add_ext(self._res[GR_STONES_W], STONE_WHITE, with_forced=False,
                                      mark_forced=False, mark_added=False)
+        self._update_state()
 
     def show_board(self, f_black=True, f_white=True, f_det=False, show_state=None):
         """Generates a new board image of given shape and returns it.
@@ -262,6 +281,8 @@ class GrBoard:
                                         self._res[GR_EDGES][0][1] * scale[1]), \
                                         (self._res[GR_EDGES][1][0] * scale[0], \
                                         self._res[GR_EDGES][1][1] * scale[1]))
+            if self._res.get(GR_GRID) is not None:
+                self._res[GR_GRID] = move_grid(self._res[GR_GRID], [0, 0], scale)
             self._stones.clear()
             self._stones.add(self._res[GR_STONES_B], STONE_BLACK)
             self._stones.add(self._res[GR_STONES_W], STONE_WHITE)
@@ -383,6 +404,19 @@ class GrBoard:
         """Stones object"""
         return self._stones
 
+    @property
+    def state(self):
+        """Board state (GrBoardState) of all stones including forced ones.
+        The state is rebuilt when stones collection changes"""
+        if self._state is None or self._state[0] != self._stones.version or \
+            self._state[1].size != self.board_size:
+            self._update_state()
+        return self._state[1]
+
+    def _update_state(self):
+        """Rebuild board state from stones collection"""
+        self._state = (self._stones.version, GrBoardState.from_stones(self.board_size, self._stones))
+
     @property
     def all_stones(self):
         """All stones on a board.
@@ -416,7 +450,10 @@ class GrBoard:
         else:
             r = dict()
             for key in self._res:
-                if key.find("IMG_") >= 0: r[key] = self._res[key]
+                if key.find("IMG_") >= 0:
+                    # Debug images could be stored as functions rendering them on demand
+                    if callable(self._res[key]): self._res[key] = self._res[key]()
+                    r[key] = self._res[key]
             return r
 
     @property
@@ -453,12 +490,49 @@ class GrBoard:
             return self._res[GR_EDGES]
 
     def transform_image(self, transform_rect):
-        """Performs a perspective transformation"""
+        """Performs a perspective transformation.
+        Transformation maps are cached (see transform.GrTransformCache), so repeated
+        transformations of images of the same shape to the same rectangle are fast"""
         if not transform_rect is None and len(transform_rect) == 4:
             logging.info('Transforming: {}'.format(transform_rect))
-            self._img = four_point_transform(self._img, np.array(transform_rect))
+            self._img = warp_image(self._img, transform_rect)
             self._params['TRANSFORM'] = transform_rect
 
+    def stones_to_source(self, stones):
+        """Maps stones (X, Y, A, B, R) found on transformed image back to source image.
+        If the image was not transformed, stones are returned as is"""
+        rect = self.param_transform_rect
+        if rect is None or len(rect) != 4 or self._src_img is None:
+            return stones
+        return unwarp_stones(stones, rect, self._src_img.shape)
+
+    def detect_transform(self, min_confidence = CORNERS_MIN_CONFIDENCE):
+        """Detects board corners on source image and, if detection confidence is high enough,
+        transforms the image to them (see transform_image()). Board edges and area mask
+        defined for the source image are reset.
+
+        Parameters:
+            min_confidence  Min detection confidence to transform the image
+
+        Returns:
+            corners     Board corners list (TL, TR, BR, BL) or None if board was not found
+            confidence  Detection confidence (see gr.find_board_corners())
+        """
+        if self._src_img is None or self._gen_board:
+            return None, 0.0
+
+        corners, confidence = find_board_corners(self._src_img)
+        if corners is None:
+            return None, confidence
+
+        corners = np.rint(corners).astype(int).tolist()
+        if confidence >= min_confidence:
+            self._img = self._src_img
+            self.transform_image(corners)
+            self._params['BOARD_EDGES'] = None
+            self._params['AREA_MASK'] = None
+        return corners, confidence
+
     def reset_image(self):
         """Revert image to original after a transformation"""
         self._img = self._src_img
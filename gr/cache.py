@@ -0,0 +1,170 @@
+# Go board recognition project
+# Recognition stage cache
+# (c) kol, 2019-2023
+
+import weakref
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+
+DEF_CACHE_SIZE = 512 * 1024 * 1024      # default cache size limit (bytes)
+
+def freeze(value):
+    """Convert a parameter value to hashable form"""
+    if isinstance(value, np.ndarray):
+        return freeze(value.tolist())
+    elif isinstance(value, (list, tuple)):
+        return tuple(freeze(x) for x in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, freeze(value[k])) for k in value))
+    else:
+        return value
+
+def isolate(value):
+    """Make a private copy of stage output.
+    Containers are copied, while numpy arrays are shared, but made read-only
+    to make sure they won't be changed in place by the code which gets them"""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+        return value
+    elif isinstance(value, list):
+        return [isolate(x) for x in value]
+    elif isinstance(value, tuple):
+        return tuple(isolate(x) for x in value)
+    elif isinstance(value, dict):
+        return {k: isolate(value[k]) for k in value}
+    else:
+        return value
+
+def _nbytes(value):
+    """Approximate size of stage output"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, (list, tuple)):
+        return sum(_nbytes(x) for x in value)
+    elif isinstance(value, dict):
+        return sum(_nbytes(value[k]) for k in value)
+    else:
+        return 0
+
+class GrStageCache(object):
+    """Cache of recognition stages results.
+
+    Every recognition stage (area mask, board detection, stone filters) declares
+    parameters it depends on. Stage output is memoized under a key built from
+    values of these parameters and a key of previous stage, which starts from
+    the image identity. Therefore, if a parameter changes, only stages which
+    depend on it and stages running after them are recalculated.
+
+    Stages may also store debug images and other info in results dictionary,
+    these entries are memoized together with stage output.
+    """
+
+    def __init__(self, max_size = DEF_CACHE_SIZE):
+        """Constructor
+
+        Parameters:
+            max_size    Cache size limit in bytes. Least recently used entries
+                        are removed when the limit is exceeded.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+        self.__img_ref = None
+        self.__img_key = None
+
+    def image_key(self, img):
+        """Returns identity key of an image (hash of image contents).
+        Key of last image is kept, so it is not recalculated when the same image is processed again"""
+        with self.__lock:
+            if self.__img_ref is not None and self.__img_ref() is img:
+                return self.__img_key
+
+        h = hashlib.blake2b(np.ascontiguousarray(img).data, digest_size = 16)
+        key = (img.shape, str(img.dtype), h.hexdigest())
+
+        with self.__lock:
+            self.__img_ref = weakref.ref(img)
+            self.__img_key = key
+        return key
+
+    def stage_key(self, prev_key, stage, params, keys):
+        """Build a key for a stage.
+
+        Parameters:
+            prev_key    Key of previous stage or an image key
+            stage       Stage name
+            params      Recognition parameters
+            keys        List of parameter keys the stage depends on
+        """
+        return (prev_key, stage, tuple(freeze(params.get(k)) for k in keys))
+
+    def run(self, key, res, fn, *args, on_hit = None):
+        """Returns memoized stage output or runs the stage and memoizes its output.
+
+        Parameters:
+            key         Stage key (see stage_key())
+            res         Results dictionary. Entries stored by the stage are memoized
+                        and restored from cache when stage output is taken from it.
+            fn          Stage function
+            args        Stage function arguments
+            on_hit      A function called with stage output when it is taken from cache
+
+        Returns:
+            Stage function output
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+
+        if entry is not None:
+            out, updates, _ = entry
+            res.update(isolate(updates))
+            out = isolate(out)
+            if on_hit is not None: on_hit(out)
+            return out
+
+        before = dict(res)
+        out = fn(*args)
+        updates = {k: res[k] for k in res if k not in before or res[k] is not before[k]}
+        size = _nbytes(out) + _nbytes(updates)
+
+        with self.__lock:
+            self.misses += 1
+            if key not in self.__entries:
+                self.__entries[key] = (isolate(out), isolate(updates), size)
+                self.__size += size
+                while self.__size > self.max_size and len(self.__entries) > 1:
+                    _, (_, _, n) = self.__entries.popitem(last = False)
+                    self.__size -= n
+        return out
+
+    def clear(self):
+        """Clear the cache"""
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+            self.__img_ref = None
+            self.__img_key = None
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def size(self):
+        """Size of cached data in bytes"""
+        return self.__size
+
+def run_stage(cache, key, res, fn, *args, on_hit = None):
+    """Run a recognition stage taking its output from cache, if one is provided.
+    on_hit is called with stage output when it is taken from cache"""
+    if cache is None:
+        return fn(*args)
+    else:
+        return cache.run(key, res, fn, *args, on_hit = on_hit)
@@ -5,11 +5,15 @@
 import cv2
 import numpy as np
 import logging
+from scipy.ndimage import find_objects
+
+from .utils import morph_kernel
 
 # Apply watershed transformation
 # The algorithm derived from OpenCV's publication 'Image Segmentation with Watershed Algorithm'
 # and adopted to use stone coordinations as an indicators of peaks instead of original "max peak value" method
-def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
+def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False, f_img = True,
+                    max_r = 20.0):
     """Apply watershed transformation to given board image.
 
     gray        source image (either gray or one of channels)
@@ -18,12 +22,15 @@ def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
     f_bw        either B for black stones or W for white
     n_morph     number of iterations of morphological transformation (0 if not needed)
     f_debug     if True, debug images are to be shown with cv2.imshow() call
+    f_img       if True, a debug image with stones plotted is generated
+                (see watershed_img() to make it later)
+    max_r       markers with larger enclosing circle radius are ignored
 
-    Returns     array of stones in X,Y,R format and a debug image with stones plotted
+    Returns     array of stones in X,Y,R format and a debug image with stones plotted (or None)
     """
 
     # Preprocess image
-    kernel = np.ones((3, 3), dtype = np.uint8)
+    kernel = morph_kernel(cv2.MORPH_RECT, 3)
     if f_bw == 'B':
        # To have watershed properly determine black stones, board dividers have to be removed
        # Therefore, dilate() is applied n_morph+1 times
@@ -48,33 +55,7 @@ def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
     #stones = stones[b].reshape(1, stones.shape[1])
 
     # Prepare peaks map
-    peaks = np.zeros(thresh.shape, dtype = np.uint8)
-    for i in range(len(stones)):
-        x = int(stones[i,0])
-        y = int(stones[i,1])
-
-        if x >= 0 and y >= 0 and x < thresh.shape[1] and y < thresh.shape[0] and thresh[y,x] > 0:
-           #cv2.circle(peaks, (x,y), 1, (i+1), -1)
-           peaks[y,x] = (i+1)
-        else:
-           # Circle center falls to a black point
-           # Look around to find a white point within small radius
-           r = 5
-           r2 = r*2
-           f = False
-           for dy in range(r2+1):
-               for dx in range(r2+1):
-                   vy = y+r-dy
-                   vx = x+r-dx
-                   if vx >= 0 and vy >= 0 and vx < thresh.shape[1] and vy < thresh.shape[0] and thresh[vy, vx] > 0:
-                      f = True
-                      #cv2.circle(peaks, (x+r2-dx,y+r2-dy), 1, (i+1), -1)
-                      peaks[vy, vx] = (i+1)
-                      break
-               if f: break
-           if not f:
-              # No white found. Ignore the stone, but save a warning
-              logging.warning('WATERSHED: Cannot find peak for stone ({},{},{})'.format(x,y,r))
+    peaks = _find_peaks(thresh, stones)
 
     if f_debug:
        m = np.zeros((thresh.shape[0],thresh.shape[1],3), dtype = np.uint8)
@@ -121,7 +102,7 @@ def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
 ##    cv2.watershed(img3, markers)
 
     # Apply watershed
-    markers = peaks.astype(np.int32)
+    markers = peaks
     img3 = np.empty((gray.shape[0], gray.shape[1], 3), dtype=np.uint8)
     for i in range(3): img3[:,:,i] = thresh
     cv2.watershed(img3, markers)
@@ -135,26 +116,31 @@ def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
        cv2.imshow('Borders', m)
 
     # Collect results
-    dst = np.zeros(gray.shape, dtype=np.uint8)
+    # Bounding boxes of all markers are found in one pass and contours
+    # are looked up within marker's box only. Boxes are extended by one pixel
+    # to have contours traced exactly as on the whole image.
     rt = []
-    for c in np.unique(markers):
-        if c <= 0: continue
-        mask = np.zeros(markers.shape, dtype=np.uint8)
-        mask[markers == c] = 255
+    h, w = markers.shape[:2]
+    boxes = find_objects(np.maximum(markers, 0))
+    for n, box in enumerate(boxes):
+        if box is None: continue
+        c = n + 1
+        y0, y1 = max(box[0].start - 1, 0), min(box[0].stop + 1, h)
+        x0, x1 = max(box[1].start - 1, 0), min(box[1].stop + 1, w)
+        mask = np.uint8(markers[y0:y1, x0:x1] == c) * 255
         if cv2.__version__.startswith('3'):
-            cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[1]
+            cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset = (x0, y0))[1]
         else:
-            cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+            cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset = (x0, y0))[0]
         cm = max(cnts, key=cv2.contourArea)
         ((x, y), r) = cv2.minEnclosingCircle(cm)
         if f_debug: logging.info("CV2_WATERSHED: marker {}: ({}, {}, {})".format(c,x,y,r))
 
-        if r > 20.0:
+        if r > max_r:
             logging.info("WATERSHED: Ignoring marker {}: ({}, {}, {})".format(c,x,y,r))
         else:
            # Increase radius to number of pixels removed with erode/dilate
            rt.append ([int(x), int(y), int(r + n_morph)])
-           cv2.circle(dst, (int(x), int(y)), int(r), (255,255,255), -1)
 
     # Filter out outlied R's
 ##    if len(rt) > 0:
@@ -168,7 +154,72 @@ def apply_watershed(gray, stones, n_thresh, f_bw, n_morph = 0, f_debug = False):
 ##
 ##        rt = rt2
 
-    dst = cv2.bitwise_not(dst)
-    if f_debug: cv2.imshow('Result', dst)
+    rt = np.array(rt)
+    dst = None
+    if f_img or f_debug:
+        dst = _draw_stones(gray.shape, rt, n_morph)
+        if f_debug: cv2.imshow('Result', dst)
+
+    return rt, dst
+
+# Internal function: make watershed peaks map
+def _find_peaks(thresh, stones, r = 5):
+    """Put stone markers (1-based stone index) at stone centers.
+    If a center falls to a black point, first white point found within a square
+    of 2*r+1 size is used instead, scanning from bottom-right corner.
+    If several stones share a point, the last one is used.
+    Markers are int32 as cv2.watershed() requires, so any number of stones is labelled."""
+
+    peaks = np.zeros(thresh.shape, dtype = np.int32)
+    if stones is None or len(stones) == 0:
+        return peaks
+
+    h, w = thresh.shape[:2]
+    xy = np.asarray(stones)[:, 0:2].astype(np.intp)
+    x, y = xy[:, 0], xy[:, 1]
+
+    # Candidate points of every stone: the center, then the square around it
+    d = np.arange(r, -r-1, -1)
+    dy, dx = np.repeat(d, len(d)), np.tile(d, len(d))
+    vx = np.column_stack([x, x[:, None] + dx])
+    vy = np.column_stack([y, y[:, None] + dy])
+
+    inside = (vx >= 0) & (vy >= 0) & (vx < w) & (vy < h)
+    white = np.zeros(vx.shape, dtype = bool)
+    white[inside] = thresh[vy[inside], vx[inside]] > 0
+    found = white.any(axis = 1)
+    first = white.argmax(axis = 1)
+
+    for i in np.flatnonzero(~found):
+        # No white found. Ignore the stone, but save a warning
+        logging.warning('WATERSHED: Cannot find peak for stone ({},{},{})'.format(x[i],y[i],r))
+
+    # Markers are set in stones order, so the last stone at a point wins
+    idx = np.flatnonzero(found)
+    px, py = vx[idx, first[idx]], vy[idx, first[idx]]
+    _, last = np.unique((py * w + px)[::-1], return_index = True)
+    idx = idx[len(idx) - 1 - last]
+    peaks[py[len(px) - 1 - last], px[len(px) - 1 - last]] = idx + 1
+    return peaks
+
+# Internal function: draw stones found by watershed
+def _draw_stones(shape, stones, n_morph):
+    dst = np.zeros(shape[:2], dtype=np.uint8)
+    for x, y, r in stones:
+        # Radius was increased by number of morphing iterations
+        cv2.circle(dst, (int(x), int(y)), int(r - n_morph), (255,255,255), -1)
+    return cv2.bitwise_not(dst)
+
+def watershed_img(shape, stones, f_bw, n_morph = 0):
+    """Make a debug image for stones returned by apply_watershed() called with f_img = False.
+
+    shape       image shape
+    stones      array of stones in X,Y,R format returned by apply_watershed()
+    f_bw        either B for black stones or W for white
+    n_morph     number of iterations of morphological transformation
 
-    return np.array(rt), dst
+    Returns     debug image with stones plotted
+    """
+    # apply_watershed() adds one more dilation for black stones
+    if f_bw == 'B': n_morph += 1
+    return _draw_stones(shape, stones, n_morph)
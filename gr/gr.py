@@ -5,12 +5,25 @@
 import cv2
 import numpy as np
 import logging
+import threading
 from itertools import accumulate
 from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 
 from .grdef import *
 from .utils import *
-from .cv2_watershed import apply_watershed
+from .cv2_watershed import apply_watershed, watershed_img
+from .cache import run_stage
+from .hooks import GrHookStage, hook_cached
+from .planes import GrImagePlanes
+
+# Parameters board detection depends on
+FIND_BOARD_KEYS = ['CANNY_MINVAL', 'CANNY_MAXVAL', 'CANNY_APERTURE', 'HL_RHO', 'HL_THETA',
+    'HL_THRESHOLD', 'HL_MINLEN', 'HL_RHO2', 'HL_THETA2', 'HL_THRESHOLD2', 'BOARD_SIZE', 'BOARD_ENGINE',
+    'HL_AUTO_THRESHOLD']
+BOARD_PARAMS_KEYS = ['BOARD_EDGES', 'BOARD_SIZE']
+SAMPLE_STONES_KEYS = []     # sampling thresholds are derived from the board itself
+FIND_GRID_KEYS = ['CANNY_MINVAL', 'CANNY_MAXVAL', 'CANNY_APERTURE', 'HL_RHO2']
 
 # Internal function: draw a board grid
 def draw_board_grid(img, edges, board_size, space_x, space_y, color = COLOR_BLACK):
@@ -28,6 +41,23 @@ def draw_board_grid(img, edges, board_size, space_x, space_y, color = COLOR_BLAC
         y2 = y1
         cv2.line(img, (x1,y1), (x2,y2), color, 1)
 
+# Internal function: store a debug image in results dictionary
+def store_debug_img(res, key, render, debug):
+    """Stores a debug image according to debug level.
+    render is either an image made by processing itself, which is stored as is
+    for DEBUG_FULL and DEBUG_LAZY levels, or a function without parameters rendering
+    an image: it is called immediately for DEBUG_FULL level, stored in res for DEBUG_LAZY.
+    Both are ignored for DEBUG_NONE"""
+    if debug == DEBUG_NONE:
+        return
+    if debug == DEBUG_FULL and callable(render):
+        res[key] = render()
+    else:
+        res[key] = render
+
+
+# Buffers of stones detection filters, reused when results are not retained
+_filter_buffers = GrBufferPool()
 
 # Find stones on a board
 # Takes an image, recognition param dictionary, results dictionary and
@@ -36,7 +66,8 @@ def draw_board_grid(img, edges, board_size, space_x, space_y, color = COLOR_BLAC
 # where (X,Y) are image coordinates, (A,B) - stone position, R - radius in pixels
 # Several analysis parameters are also stored in the results dict
 # The array is stored in the results dictionary (res)
-def find_stones(src_img, params, res, f_bw):
+def find_stones(src_img, params, res, f_bw, cache = None, cache_key = None, debug = DEBUG_FULL,
+                hook = None, planes = None):
     """Find stones on a board
 
        Parameters:
@@ -44,20 +75,42 @@ def find_stones(src_img, params, res, f_bw):
            params     Recognition parameters (see grdef.DEF_GR_PARAMS)
            res        Results dictionary (see grdef.GR_xxx)
            f_bw       Either B or W for black and white stones
+           cache      Stage cache (GrStageCache) or None
+           cache_key  Key of a stage preceding stones detection, required if cache is provided
+           debug      Debug level (DEBUG_NONE, DEBUG_LAZY or DEBUG_FULL)
+           hook       Stage events hook (see process_img()) or None
+           planes     Image conversions cache (GrImagePlanes) shared with other passes
+                      over the same image or None
        Returns:
             list of stones in form of (X, Y, A, B, R)
     """
 
+    # Filter outputs are written to pooled buffers unless they are to be kept
+    # in the stage cache or as debug images
+    pool = _filter_buffers if cache is None and debug == DEBUG_NONE else None
+    if planes is None:
+        planes = GrImagePlanes(pool)
+
+    def _dst(name, img):
+        if pool is None: return None
+        return pool.like((f_bw, name), img)
+
     # Pre-filter: pyramid filtering
     def _apply_pmf(img, params, f_bw):
         n_pmf = params['PYRAMID_' + f_bw]
-        if n_pmf == 0:
+        if n_pmf == PMF_OFF:
            logging.info("Filter skipped")
            return img
+        elif n_pmf == PMF_FAST:
+            # Filter board area scaled down to fixed spacing
+            roi = board_area(img, res)
+            scale = min(PMF_FAST_SPACING / min(res[GR_SPACING]), 1.0)
+            pmf = planes.pmf_fast(img, roi, scale)
         else:
-            pmf = cv2.pyrMeanShiftFiltering(img, 21, 51)
-            res['IMG_PMF_' + f_bw] = pmf
-            return pmf
+            pmf = planes.pmf(img)
+
+        store_debug_img(res, 'IMG_PMF_' + f_bw, pmf, debug)
+        return pmf
 
     # Pre-filter: gray out
     def _apply_gray(img, params, f_bw):
@@ -65,11 +118,8 @@ def find_stones(src_img, params, res, f_bw):
 
     # Pre-filter: extract channel
     def _apply_channel_mask(img, params, f_bw):
-        b,g,r = cv2.split(img)
-        if f_bw == 'B':
-           return r
-        else:
-           return b
+        # Red channel for black stones, blue for white
+        return planes.channel(img, 2 if f_bw == 'B' else 0)
 
     # Pre-filter: thresholding
     def _apply_thresh(img, params, f_bw):
@@ -77,8 +127,8 @@ def find_stones(src_img, params, res, f_bw):
         n_maxval = params['STONES_MAXVAL_' + f_bw]
         method = cv2.THRESH_BINARY if f_bw == 'B' else cv2.THRESH_BINARY_INV
 
-        _, thresh = cv2.threshold(img, n_thresh, n_maxval, method)
-        res['IMG_THRESH_' + f_bw] = thresh
+        _, thresh = cv2.threshold(img, n_thresh, n_maxval, method, dst = _dst('THRESH', img))
+        store_debug_img(res, 'IMG_THRESH_' + f_bw, thresh, debug)
         return thresh
 
     # Pre-filter: dilation
@@ -89,9 +139,8 @@ def find_stones(src_img, params, res, f_bw):
            logging.info("Filter skipped")
            return img
         else:
-           kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(n_mask, n_mask))
-        #    kernel = cv2.resize(kernel, (n_mask,n_mask))
-           return cv2.dilate(img, kernel,
+           kernel = morph_kernel(cv2.MORPH_ELLIPSE, n_mask)
+           return cv2.dilate(img, kernel, dst = _dst('STONES_DILATE', img),
                                   iterations=n_iter,
                                   borderType = cv2.BORDER_CONSTANT,
                                   borderValue = COLOR_BLACK)
@@ -105,9 +154,8 @@ def find_stones(src_img, params, res, f_bw):
            logging.info("Filter skipped")
            return img
         else:
-           kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(100,100))
-           kernel = cv2.resize(kernel, (n_mask,n_mask))
-           return cv2.erode(img, kernel,
+           kernel = morph_kernel(cv2.MORPH_ELLIPSE, n_mask, base_size = 100)
+           return cv2.erode(img, kernel, dst = _dst('STONES_ERODE', img),
                                   iterations=n_iter,
                                   borderType = cv2.BORDER_CONSTANT,
                                   borderValue = COLOR_BLACK)
@@ -119,7 +167,7 @@ def find_stones(src_img, params, res, f_bw):
            logging.info("Filter skipped")
            return img
         else:
-            return cv2.blur(img, (n_blur, n_blur))
+            return cv2.blur(img, (n_blur, n_blur), dst = _dst('BLUR_MASK', img))
 
     # Pre-filter: luminosity equaliztion
     def _apply_clahe(img, params, f_bw):
@@ -128,20 +176,8 @@ def find_stones(src_img, params, res, f_bw):
             logging.info("Filter skipped")
             return img
         else:
-            # Convert to LAB color space
-            lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-
-            # Split channels
-            l, a, b = cv2.split(lab)
-
-            # Apply CLAHE to l_channel
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-            cl = clahe.apply(l)
-
-            # Merge back and convert to RGB color space
-            merged = cv2.merge((cl,a,b))
-            final = cv2.cvtColor(merged, cv2.COLOR_LAB2BGR)
-            return final
+            # CLAHE is applied to L channel in LAB color space
+            return planes.equalized(img)
 
     # Post-filter: houghCircle
     def _apply_houghc(img, filtered_img, params, f_bw, prev_stones):
@@ -170,9 +206,14 @@ def find_stones(src_img, params, res, f_bw):
            n_morph = params['WS_MORPH_' + f_bw]
 
            ws_stones, ws_img = apply_watershed(gray = gray, stones = prev_stones, \
-                      n_thresh = n_thresh, f_bw = f_bw, n_morph = n_morph)
-
-           res['IMG_WATERSHED_' + f_bw] = ws_img
+                      n_thresh = n_thresh, f_bw = f_bw, n_morph = n_morph,
+                      f_img = debug == DEBUG_FULL, max_r = params['WS_MAXRADIUS'])
+
+           if debug == DEBUG_FULL:
+              res['IMG_WATERSHED_' + f_bw] = ws_img
+           else:
+              store_debug_img(res, 'IMG_WATERSHED_' + f_bw,
+                  lambda: watershed_img(gray.shape, ws_stones, f_bw, n_morph), debug)
            return ws_stones
 
     # Utility: combine stones from two arrays
@@ -182,73 +223,95 @@ def find_stones(src_img, params, res, f_bw):
         if prev_stones is None or len(prev_stones) == 0:
            return new_stones
 
-        st_res = []
-        min_r = sum([i[4] for i in new_stones]) / float(len(new_stones) * 2)
-        for s1 in prev_stones:
-            found = False
-            for s2 in new_stones:
-                if s1[GR_A] == s2[GR_A] and s1[GR_B] == s2[GR_B] and s2[GR_R] >= min_r:
-                   st_res.append(s2)
-                   found = True
-                   break
-            if not found:
-                st_res.append(s1)
+        # Previous stones are replaced by new ones found at the same positions,
+        # unless new stones are too small
+        size = res[GR_BOARD_SIZE]
+        min_r = new_stones[:, GR_R].sum() / float(len(new_stones) * 2)
+        idx = np.flatnonzero(new_stones[:, GR_R] >= min_r)
+
+        lookup = np.full(size * size, -1, dtype = np.intp)
+        lookup[stone_index(new_stones[idx[::-1]], size)] = idx[::-1]
+        found = lookup[stone_index(prev_stones, size)]
 
-        return np.array(st_res)
+        return np.where((found >= 0)[:, None], new_stones[found], prev_stones)
+
+    # Utility: run post-filter and merge its results
+    def _run_post_filter(f, fn, filtered_img, stones):
+        with GrHookStage(hook, f, f_bw, filtered_img) as st:
+            new_stones = fn(src_img, filtered_img, params, f_bw, stones)
+            if new_stones is not None and len(new_stones.shape) == 3: new_stones = new_stones[0]
+            st.done(new_stones, len(new_stones) if new_stones is not None else 0)
+        if new_stones is None:
+           logging.info("No new stones found, stopping")
+           return stones
+        else:
+           logging.info("Filter found {} stones".format(len(new_stones)))
+
+           with GrHookStage(hook, 'CONVERT_XY', f_bw, new_stones) as st:
+               conv_stones = convert_xy(new_stones, res)
+               stones = _combine_stones(stones, conv_stones)
+               return st.done(stones, len(stones) if stones is not None else 0)
 
     # Initialize filters
+    # Each filter is provided with a list of parameters it depends on
     def _init():
         return ({
-            "PMF": _apply_pmf,
-            'LUM_EQ': _apply_clahe,
-            "CHANNEL": _apply_channel_mask,
-            #"GRAY": _apply_gray,
-            "THRESH": _apply_thresh,
-            "STONES_DILATE": _apply_dilate,
-            "STONES_ERODE": _apply_erode,
-            "BLUR_MASK": _apply_blur
+            "PMF": (_apply_pmf, ['PYRAMID_' + f_bw]),
+            'LUM_EQ': (_apply_clahe, ['LUM_EQ']),
+            "CHANNEL": (_apply_channel_mask, []),
+            #"GRAY": (_apply_gray, []),
+            "THRESH": (_apply_thresh, ['STONES_THRESHOLD_' + f_bw, 'STONES_MAXVAL_' + f_bw]),
+            "STONES_DILATE": (_apply_dilate, ['STONES_DILATE_' + f_bw, 'HC_MASK_' + f_bw]),
+            "STONES_ERODE": (_apply_erode, ['STONES_ERODE_' + f_bw, 'HC_MASK_' + f_bw]),
+            "BLUR_MASK": (_apply_blur, ['BLUR_MASK_' + f_bw])
         },
         {
-            "HOUGH_C": _apply_houghc,
-            "WATERSHED": _apply_watershed
+            "HOUGH_C": (_apply_houghc, ['HC_MINDIST', 'HC_MAXRADIUS', 'HC_SENSITIVITY_' + f_bw]),
+            "WATERSHED": (_apply_watershed, ['WATERSHED_' + f_bw, 'WS_MORPH_' + f_bw, 'WS_MAXRADIUS'])
         })
 
     # Set up filters list
     (pre_filters, post_filters) = _init()
 
+    # Stage keys are chained, so any filter is rerun if its own parameters or
+    # parameters of any filter before it have been changed
+    key = (cache_key, f_bw)
+
     # Process image with pre-filters
-    filtered_img = src_img.copy()
+    # Filters never change their input, so source image is not copied
+    filtered_img = src_img
     for f in pre_filters:
         logging.info("Applying pre-filter {} for color {}".format(f, f_bw))
-        filtered_img = pre_filters[f](filtered_img, params, f_bw)
-    res['IMG_MORPH_' + f_bw] = filtered_img
+        fn, keys = pre_filters[f]
+        if cache is not None: key = cache.stage_key(key, f, params, keys)
+        with GrHookStage(hook, f, f_bw, filtered_img) as st:
+            filtered_img = run_stage(cache, key, res, fn, filtered_img, params, f_bw, on_hit = st.cached)
+    store_debug_img(res, 'IMG_MORPH_' + f_bw, filtered_img, debug)
 
     # Process image with post-filters
     stones = None
     for f in post_filters:
         logging.info("Applying post-filter {} for color {}".format(f, f_bw))
-        new_stones = post_filters[f](src_img, filtered_img, params, f_bw, stones)
-        if new_stones is None:
-           logging.info("No new stones found, stopping")
-        else:
-           if len(new_stones.shape) == 3: new_stones = new_stones[0]
-           logging.info("Filter found {} stones".format(len(new_stones)))
-
-           conv_stones = convert_xy(new_stones, res)
-           stones = _combine_stones(stones, conv_stones)
+        fn, keys = post_filters[f]
+        if cache is not None: key = cache.stage_key(key, f, params, keys)
+        # Post-filter reports its own events, so when its output is taken from cache,
+        # a single cached event is sent instead
+        stones = run_stage(cache, key, res, _run_post_filter, f, fn, filtered_img, stones,
+            on_hit = lambda out: hook_cached(hook, f, f_bw, filtered_img, len(out) if out is not None else 0))
 
     n_stones = stones.shape[0] if stones is not None else 0
     logging.info("Stones found: {} of color {}".format(n_stones, f_bw))
     return stones
 
 # Find board edges, spacing and size
-def find_board(img, params, res):
+def find_board(img, params, res, debug = DEBUG_FULL):
     """Determine board parameters
 
        Parameters
            img         An image
            params      Recognition parameters (see grdef.DEF_GR_PARAMS)
            res         Results dictionary (see grdef.GR_xxx)
+           debug       Debug level (DEBUG_NONE, DEBUG_LAZY or DEBUG_FULL)
        Returns
            edges list of lists [[x1,y1], [x2,y2]]
            size integer
@@ -283,6 +346,13 @@ def find_board(img, params, res):
                 ret.append(((x1,y1),(x2,y2)))
         return np.array(ret)
 
+    def pitch_size(profile, first, last):
+        """Number of lines of a grid with estimated pitch between board edges"""
+        pitch, phase = grid_pitch(profile, MIN_LINE_SPACE)
+        if pitch is None: return None
+        tol = PITCH_EDGE_TOLERANCE * pitch
+        return int(np.floor((last + tol - phase) / pitch) - np.ceil((first - tol - phase) / pitch)) + 1
+
     def unique_lines(a, delta = 10):
         """Return lines which are far from each other by more than a given distance"""
         if a is None: return None
@@ -297,55 +367,87 @@ def find_board(img, params, res):
 
     # Prepare gray image
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    res[GR_IMG_GRAY] = gray
+    store_debug_img(res, GR_IMG_GRAY, gray, debug)
 
     # Find edges
     n_minval = params['CANNY_MINVAL']
     n_maxval = params['CANNY_MAXVAL']
     n_apsize = params['CANNY_APERTURE']
-    edges = cv2.Canny(gray, n_minval, n_maxval, apertureSize = n_apsize)
-    res[GR_IMG_EDGES] = edges
+    edges_img = cv2.Canny(gray, n_minval, n_maxval, apertureSize = n_apsize)
+    store_debug_img(res, GR_IMG_EDGES, edges_img, debug)
 
     # Run HoughLinesP, if its parameters are set
     # HoughLinesP detects line segments and may split a single line to multiple segments
     # The goal of running it is to remove small lines (less than minlen) which are,
     # for example, labels on board positions
     # If HoughLines is to run, its results will be used for further recognition as input
-    img_detect = edges
+    img_detect = edges_img
     n_rho = params['HL_RHO']
     n_theta = params['HL_THETA'] * np.pi / 180
     n_thresh = params['HL_THRESHOLD']
     n_minlen = params['HL_MINLEN']
     if n_thresh > 0 and n_minlen > 0:
-       lines = cv2.HoughLinesP(edges, n_rho, n_theta, n_thresh, minLineLength = n_minlen)
+       lines = cv2.HoughLinesP(edges_img, n_rho, n_theta, n_thresh, minLineLength = n_minlen)
        lines = houghp_to_lines(lines)
-       img_detect = make_lines_img(edges.shape, lines)
-       res[GR_IMG_LINES] = img_detect
-       img_detect = cv2.bitwise_not(img_detect)
-
-    # Detect lines with HoughLines
-    n_rho = params['HL_RHO2']
-    n_theta = params['HL_THETA2'] * np.pi / 180
-    n_thresh = params['HL_THRESHOLD2']
-    if n_thresh < 10: n_thresh = 90       #w/a for backward compt
-
-    # HoughLines doesn't determine coordinates, but only direction (theta) and
-    # distance from (0,0) point (rho)
-    lines = cv2.HoughLines(img_detect, n_rho, n_theta, n_thresh)
-    lines = sorted(lines, key = lambda f: f[0][0])
-
-    # Find vertical/horizontal lines
-    lines_v = [e for e in lines if e[0][1] == 0.0 if e[0][0] > 1]
-    p = round(np.pi/2 * 100, 0)
-    lines_h = [e for e in lines if round(e[0][1]*100,0) == p if e[0][0] > 1]
-
-    # Remove duplicates (lines too close to each other)
-    unique_v = unique_lines(lines_v)
-    unique_h = unique_lines(lines_h)
+       lines_img = make_lines_img(edges_img.shape, lines)
+       store_debug_img(res, GR_IMG_LINES, lines_img, debug)
+       img_detect = cv2.bitwise_not(lines_img)
+
+    if params.get('BOARD_ENGINE') == BOARD_ENGINE_PROFILE:
+        # Find lines as equally spaced peaks of edges projection profiles
+        # (see profile_grid())
+        xs, ys = profile_grid(img_detect, params.get('BOARD_SIZE'), MIN_LINE_SPACE)
+        if xs is None:
+            logging.error("Cannot find board grid lines, check params")
+            return None, None
+
+        # Make coordinate-based lines the same way hough_to_lines() does
+        h, w = img.shape[:2]
+        lines_v = np.array([((x, h), (x, -h)) for x in np.rint(xs).astype(int)])
+        lines_h = np.array([((-w, y), (w, y)) for y in np.rint(ys).astype(int)])
+    else:
+        # Detect lines with HoughLines
+        n_rho = params['HL_RHO2']
+        n_theta = params['HL_THETA2'] * np.pi / 180
+        n_thresh = params['HL_THRESHOLD2']
+        if n_thresh < 10: n_thresh = 90       #w/a for backward compt
+
+        # HoughLines doesn't determine coordinates, but only direction (theta) and
+        # distance from (0,0) point (rho)
+        # Only vertical and horizontal lines are used, so HoughLines is run
+        # for these directions only (see hough_axis_lines())
+        if not params.get('HL_AUTO_THRESHOLD'):
+            lines = hough_axis_lines(img_detect.shape, n_rho, n_theta, n_thresh, np.nonzero(img_detect))
+        else:
+            # Votes are counted once, then thresholds for vertical and horizontal lines
+            # are searched to make lines count match board size (see hough_auto_threshold())
+            size = params.get('BOARD_SIZE')
+            pitch = None if size else \
+                [grid_pitch(np.count_nonzero(img_detect, axis = a), MIN_LINE_SPACE)[0] for a in (0, 1)]
+            peaks = hough_axis_peaks(img_detect.shape, n_rho, n_theta, np.nonzero(img_detect))
+            thresh = hough_auto_threshold(peaks, size, MIN_LINE_SPACE, pitch)
+            if thresh is None:
+                logging.warning("Cannot find HoughLines threshold, using {}".format(n_thresh))
+                thresh = [n_thresh, n_thresh]
+            else:
+                logging.info("HoughLines thresholds: {}".format(thresh))
+            is_v = peaks[:, 1] == 0.0
+            lines = peaks[np.where(is_v, peaks[:, 2] > thresh[0], peaks[:, 2] > thresh[1]), None, :2]
+        lines = sorted(lines, key = lambda f: f[0][0])
+
+        # Find vertical/horizontal lines
+        lines_v = [e for e in lines if e[0][1] == 0.0 if e[0][0] > 1]
+        p = round(np.pi/2 * 100, 0)
+        lines_h = [e for e in lines if round(e[0][1]*100,0) == p if e[0][0] > 1]
+
+        # Remove duplicates (lines too close to each other)
+        unique_v = unique_lines(lines_v)
+        unique_h = unique_lines(lines_h)
+
+        # Convert from (rho, theta) to coordinate-based lines
+        lines_v = hough_to_lines(unique_v, img.shape)
+        lines_h = hough_to_lines(unique_h, img.shape)
 
-    # Convert from (rho, theta) to coordinate-based lines
-    lines_v = hough_to_lines(unique_v, img.shape)
-    lines_h = hough_to_lines(unique_h, img.shape)
     vcross = len(lines_v)
     hcross = len(lines_h)
     res[GR_NUM_CROSS_H] = hcross
@@ -367,10 +469,12 @@ def find_board(img, params, res):
     logging.info("Board edges: {}".format(edges))
 
     # Draw a lines grid over gray image for debugging
-    line_img = img1_to_img3(gray)
-    line_img = make_lines_img(gray.shape, lines_v, width = 2, color = COLOR_RED, img = line_img)
-    line_img = make_lines_img(gray.shape, lines_h, width = 2, color = COLOR_RED, img = line_img)
-    res[GR_IMG_LINES2] = line_img
+    def _draw_lines():
+        line_img = img1_to_img3(gray)
+        line_img = make_lines_img(gray.shape, lines_v, width = 2, color = COLOR_RED, img = line_img)
+        line_img = make_lines_img(gray.shape, lines_h, width = 2, color = COLOR_RED, img = line_img)
+        return line_img
+    store_debug_img(res, GR_IMG_LINES2, _draw_lines, debug)
 
     # Determine board size
     # Check board size is probided in params
@@ -383,6 +487,16 @@ def find_board(img, params, res):
                 size = n
                 break
 
+    # Cross-check lines count with grid periodicity: missing or duplicate lines
+    # don't change pitch, so number of grid lines between edges is counted
+    if size is None:
+        nx = pitch_size(np.count_nonzero(img_detect, axis = 0), top_left[0], bottom_right[0] - 1)
+        ny = pitch_size(np.count_nonzero(img_detect, axis = 1), top_left[1], bottom_right[1] - 1)
+        sizes = set(n for n in DEF_AVAIL_SIZES for m in (nx, ny) if m is not None and abs(m-n) < 2)
+        if len(sizes) == 1:
+            size = sizes.pop()
+            logging.info("Board size {} estimated by grid pitch ({} x {} lines)".format(size, nx, ny))
+
     # Repeat but now check only one side
     if size is None:
         for n in DEF_AVAIL_SIZES:
@@ -415,8 +529,556 @@ def find_board(img, params, res):
 
     return edges, size
 
+# HoughLines restricted to vertical and horizontal lines
+def hough_axis_lines(shape, rho, theta, threshold, points):
+    """Find vertical and horizontal lines exactly as cv2.HoughLines finds them.
+
+    Board detection uses vertical (angle 0) and horizontal (angle pi/2) lines only,
+    so votes are counted for these angles and angles next to them (required to check
+    for local maximums) instead of all angles. Vote counting, rounding, local
+    maximums check and resulting line parameters follow cv2.HoughLines.
+
+    Parameters:
+        shape       Image shape
+        rho, theta, threshold   HoughLines parameters
+        points      (Y, X) coordinates of edge points (as np.nonzero() returns)
+
+    Returns:
+        Lines in HoughLines format or None if no lines found
+    """
+    peaks = hough_axis_peaks(shape, rho, theta, points)
+    lines = peaks[peaks[:, 2] > threshold, None, :2]
+    return lines if len(lines) > 0 else None
+
+def hough_axis_peaks(shape, rho, theta, points):
+    """Find votes of all vertical and horizontal lines cv2.HoughLines may find.
+
+    Lines are local maximums of HoughLines accumulator (see hough_axis_lines()),
+    HoughLines returns ones with votes above its threshold. So peaks are found
+    once and then lines for any threshold are taken from them.
+
+    Parameters:
+        shape       Image shape
+        rho, theta  HoughLines parameters
+        points      (Y, X) coordinates of edge points (as np.nonzero() returns)
+
+    Returns:
+        Array of (rho, theta, votes) rows
+    """
+    h, w = shape[:2]
+    rho, theta = np.float32(rho), np.float32(theta)
+    irho = np.float32(1) / rho
+    num_rho = int(np.rint(np.float32((w + h) * 2 + 1) / rho))
+    num_angle = int(np.floor(np.pi / theta)) + 1
+    if num_angle > 1 and abs(np.pi - (num_angle - 1) * float(theta)) < theta / 2:
+        num_angle -= 1
+
+    # Angles are calculated in float, the same way HoughLines does
+    angles = np.arange(num_angle, dtype = np.float32) * theta
+    p_h = round(np.pi/2 * 100, 0)
+    angles_v = [n for n in range(num_angle) if angles[n] == 0.0]
+    angles_h = [n for n in range(num_angle) if round(float(angles[n])*100, 0) == p_h]
+
+    def _trig(n):
+        ang = np.float32(0)
+        for _ in range(n): ang = np.float32(ang + theta)
+        return np.float32(np.sin(np.float64(ang)) * irho), np.float32(np.cos(np.float64(ang)) * irho)
+
+    def _votes(n):
+        # Votes with zero padding at both ends, angles out of range have no votes
+        if n < 0 or n >= num_angle:
+            return np.zeros(num_rho + 2, dtype = np.intp)
+        tab_sin, tab_cos = _trig(n)
+        ys, xs = points
+        r = np.rint(xs.astype(np.float32) * tab_cos + ys.astype(np.float32) * tab_sin).astype(np.intp)
+        return np.bincount(r + (num_rho - 1) // 2 + 1, minlength = num_rho + 2)
+
+    ret = []
+    for n in angles_v + angles_h:
+        v, v_prev, v_next = _votes(n), _votes(n-1), _votes(n+1)
+        a = v[1:-1]
+        peaks = np.flatnonzero((a > v[:-2]) & (a >= v[2:]) & \
+                               (a > v_prev[1:-1]) & (a >= v_next[1:-1]))
+        l_rho = (peaks.astype(np.float32) - np.float32(num_rho - 1) * np.float32(0.5)) * rho
+        ret.append(np.column_stack([l_rho, np.full(len(peaks), angles[n]), a[peaks]]))
+
+    return np.float32(np.concatenate(ret)) if len(ret) > 0 else np.zeros((0, 3), dtype = np.float32)
+
+# HoughLines threshold search
+def hough_auto_threshold(peaks, size = None, delta = 10, pitch = None):
+    """Find HoughLines thresholds for vertical and horizontal lines by bisection.
+
+    For every probed threshold lines are taken from votes counted once (see
+    hough_axis_peaks()) and lines closer than delta to each other are removed,
+    as find_board() does. Threshold is bisected until number of lines equals board
+    size (or differs by 1 line, if exact number is not reachable).
+
+    If board size is not known, search is done for all standard sizes. Lines count
+    may settle on several sizes, so the size with lines spacing closest to grid
+    pitch (see grid_pitch()) is taken, or the largest one if pitch is not known.
+
+    Parameters:
+        peaks       HoughLines peaks (see hough_axis_peaks())
+        size        Board size or None
+        delta       Minimal distance between lines
+        pitch       Grid pitch along X and Y axes (elements can be None) or None
+
+    Returns:
+        Thresholds for vertical and horizontal lines or None if lines count doesn't settle
+    """
+    p = round(np.pi/2 * 100, 0)
+    axes = [peaks[(peaks[:, 1] == 0.0) & (peaks[:, 0] > 1)],
+            peaks[(np.round(peaks[:, 1] * 100) == p) & (peaks[:, 0] > 1)]]
+    axes = [a[np.argsort(a[:, 0], kind = 'stable')] for a in axes]
+
+    def _lines(lines, t):
+        ret = []
+        for r in lines[lines[:, 2] > t, 0]:
+            if len(ret) == 0 or r - ret[-1] >= delta:
+                ret.append(r)
+        return ret
+
+    def _bisect(lines, n):
+        lo, hi, found = 0, int(lines[:, 2].max()) if len(lines) > 0 else 0, None
+        while lo <= hi:
+            t = (lo + hi) // 2
+            c = len(_lines(lines, t))
+            if c == n:
+                return t
+            if abs(c - n) < 2 and found is None:
+                found = t
+            if c > n:
+                lo = t + 1
+            else:
+                hi = t - 1
+        return found
+
+    def _pitch_error(thresh, n):
+        err = 0.0
+        for lines, t, s in zip(axes, thresh, pitch):
+            if s is not None:
+                r = _lines(lines, t)
+                err += abs((r[-1] - r[0]) / (n - 1) - s) / s
+        return err
+
+    found = []
+    for n in ([size] if size else sorted(DEF_AVAIL_SIZES, reverse = True)):
+        thresh = [_bisect(lines, n) for lines in axes]
+        if not None in thresh:
+            found.append((n, thresh))
+
+    if len(found) == 0:
+        return None
+    if pitch is None or len(found) == 1:
+        return found[0][1]
+    return min(found, key = lambda f: _pitch_error(f[1], f[0]))[1]
+
+# Board grid lines detection by projection profile
+def profile_grid_lines(profile, size, min_spacing = 10):
+    """Find equally spaced board lines in a projection profile of edges image.
+
+    Every board line adds edge points to the profile (number of edge points in
+    every column or row of the image) at its position, so board lines make a comb
+    of equally spaced peaks. The comb is fitted by trying all spacings (with coarse
+    and then fine step) and offsets at profile peaks and taking the one with maximum
+    sum of profile values at lines positions. No threshold is required.
+
+    Parameters:
+        profile     Projection profile
+        size        Number of lines (board size)
+        min_spacing Minimal spacing of lines
+
+    Returns:
+        Positions of lines (float array) and score (mean profile value at lines)
+        or None, None if lines cannot be found
+    """
+    n = len(profile)
+    max_spacing = (n - 1) / (size - 1)
+    if max_spacing < min_spacing:
+        return None, None
+
+    def _dilate(a, width):
+        return cv2.dilate(a.reshape(1, -1), np.ones((1, width), np.uint8)).ravel()
+
+    # Canny makes two edges of a line, they are joined to a single peak
+    # Lines positions are allowed to be 1 pixel away from comb teeth
+    q = np.convolve(np.float32(profile), np.ones(3, dtype = np.float32), mode = 'same')
+    p = _dilate(q, 3)
+    offsets = np.flatnonzero((q >= p) & (q > q.mean())).astype(np.float32)
+    if len(offsets) == 0:
+        return None, None
+
+    def _best(p, spacings):
+        # Comb teeth positions for every spacing and offset
+        last = np.float32(n - 1) - spacings * np.float32(size - 1)
+        pos = offsets[None, :, None] + spacings[:, None, None] * np.arange(size, dtype = np.float32)
+        score = p[np.minimum(np.rint(pos).astype(np.intp), n - 1)].sum(axis = 2)
+        score[offsets[None, :] > last[:, None]] = -1
+        i, j = np.unravel_index(np.argmax(score), score.shape)
+        return spacings[i], offsets[j], score[i, j]
+
+    # Coarse step errors are summed up along the comb, so coarse search runs on wider peaks
+    s, _, _ = _best(_dilate(q, 5), np.arange(min_spacing, max_spacing + 0.01, 0.5, dtype = np.float32))
+    s, x, score = _best(p, np.arange(max(s - 0.5, min_spacing), min(s + 0.5, max_spacing) + 0.01, 0.25,
+                                     dtype = np.float32))
+    if score < 0:
+        return None, None
+
+    return x + s * np.arange(size, dtype = np.float32), score / size
+
+def profile_grid(img, size = None, min_spacing = 10):
+    """Find board grid lines in an edges image by projection profiles.
+
+    If board size is not known, lines are searched for all standard board sizes
+    and the largest size scoring close to the best one is taken.
+
+    Parameters:
+        img         Edges image
+        size        Board size or None
+        min_spacing Minimal spacing of lines
+
+    Returns:
+        X coordinates of vertical lines and Y coordinates of horizontal lines
+        or None, None if lines cannot be found
+    """
+    cols = np.count_nonzero(img, axis = 0)
+    rows = np.count_nonzero(img, axis = 1)
+
+    grids = []
+    for n in ([size] if size else DEF_AVAIL_SIZES):
+        xs, x_score = profile_grid_lines(cols, n, min_spacing)
+        ys, y_score = profile_grid_lines(rows, n, min_spacing)
+        if xs is not None and ys is not None:
+            grids.append((xs, ys, (x_score + y_score) / 2))
+
+    if len(grids) == 0:
+        return None, None
+
+    best = max(g[2] for g in grids)
+    xs, ys, _ = [g for g in grids if g[2] >= best * PROFILE_SIZE_LEVEL][-1]
+    return xs, ys
+
+# Board grid periodicity estimation
+def grid_pitch(profile, min_spacing = 10):
+    """Estimate spacing (pitch) and phase of board lines in a projection profile of edges image.
+
+    Board lines make a periodic component of the profile. Its period is taken from
+    the first strong peak of profile autocorrelation, which is computed through Fourier
+    transform in a single pass and refined to subpixel by parabolic interpolation.
+    Phase comes from the Fourier component of the profile at the found period.
+
+    Parameters:
+        profile     Projection profile
+        min_spacing Minimal spacing of lines
+
+    Returns:
+        Pitch and phase (position of a line modulo pitch) or None, None
+    """
+    n = len(profile)
+    max_spacing = int((n - 1) / (DEF_AVAIL_SIZES[0] - 1))
+    if max_spacing <= min_spacing:
+        return None, None
+
+    q = np.convolve(np.float32(profile), np.ones(3, dtype = np.float32), mode = 'same')
+    q -= q.mean()
+    n_fft = cv2.getOptimalDFTSize(2 * n)
+    f = np.fft.rfft(q, n_fft)
+    ac = np.fft.irfft(f.real ** 2 + f.imag ** 2, n_fft)[:max_spacing + 2]
+
+    # Autocorrelation peaks within allowed spacings
+    lags = np.arange(min_spacing, max_spacing + 1)
+    a = ac[lags]
+    peaks = lags[(a > ac[lags - 1]) & (a >= ac[lags + 1]) & (a > 0)]
+    if len(peaks) == 0:
+        return None, None
+
+    # Multiples of the pitch make peaks too, so the first peak close to the highest one is taken
+    k = peaks[ac[peaks] >= PITCH_PEAK_LEVEL * ac[peaks].max()][0]
+    d = ac[k - 1] - 2 * ac[k] + ac[k + 1]
+    pitch = k + (0.5 * (ac[k - 1] - ac[k + 1]) / d if d != 0 else 0.0)
+
+    phase = np.angle(np.sum(q * np.exp(-2j * np.pi * np.arange(n) / pitch)))
+    return float(pitch), float((-phase / (2 * np.pi) * pitch) % pitch)
+
+# Fit board grid as a homography
+def find_grid(img, params, res, debug = DEBUG_FULL):
+    """Fit board grid as a homography mapping grid positions to image coordinates.
+
+    Unlike find_board(), lines of any direction within GRID_MAX_ANGLE degrees
+    from vertical or horizontal are detected, so perspective-distorted boards
+    are described without transforming the image.
+
+    The grid is grown from a single board cell, taking cells which match the most
+    of intersections around them. Intersections of lines of different directions
+    are labeled with the nearest grid positions the current grid maps them to,
+    and the homography is fitted to labeled intersections with RANSAC. Area where
+    intersections are labeled is extended on every pass, so the grid follows
+    perspective distortion. Finally, grid positions are shifted to place the board
+    where grid lines are supported by image edges the most.
+
+    Board edges, size and spacing must be set in results dictionary. On success,
+    the grid is stored in results (GR_GRID key) and edges and spacing
+    are updated to match it.
+
+    Parameters:
+        img         An image
+        params      Recognition parameters (see grdef.DEF_GR_PARAMS)
+        res         Results dictionary (see grdef.GR_xxx)
+        debug       Debug level (DEBUG_NONE, DEBUG_LAZY or DEBUG_FULL)
+
+    Returns:
+        3x3 homography matrix mapping grid coordinates (column, row) to image coordinates or None
+    """
+    edges = res[GR_EDGES]
+    size = res[GR_BOARD_SIZE]
+    spacing = min(res[GR_SPACING])
+    n = size - 1
+
+    # Find lines
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    edges_img = cv2.Canny(gray, params['CANNY_MINVAL'], params['CANNY_MAXVAL'],
+                          apertureSize = params['CANNY_APERTURE'])
+    threshold = max(int(GRID_LINE_LEVEL * spacing * n), 10)
+    lines = cv2.HoughLines(edges_img, params['HL_RHO2'], GRID_THETA * np.pi / 180, threshold)
+    if lines is None:
+        logging.warning("Cannot find board grid lines")
+        return None
+
+    lines = lines[:, 0]
+    max_angle = GRID_MAX_ANGLE * np.pi / 180
+    is_v = (lines[:, 1] < max_angle) | (lines[:, 1] > np.pi - max_angle)
+    is_h = np.abs(lines[:, 1] - np.pi / 2) < max_angle
+    delta = GRID_LINE_DISTANCE * spacing
+    lines_v = grid_family(lines[is_v], img.shape, 0, delta, size + GRID_EXTRA_LINES)
+    lines_h = grid_family(lines[is_h], img.shape, 1, delta, size + GRID_EXTRA_LINES)
+    if len(lines_v) < 2 or len(lines_h) < 2:
+        logging.warning("Not enough board grid lines: {} vertical, {} horizontal".format(len(lines_v), len(lines_h)))
+        return None
+
+    # Intersections of every vertical line with every horizontal one
+    points = line_intersections(lines_v, lines_h).reshape(len(lines_v), len(lines_h), 2)
+
+    def _label(grid, radius = None):
+        """Intersections near grid positions, within radius from the grid origin"""
+        if np.linalg.det(grid) == 0:
+            return None, np.zeros(points.shape[0] * points.shape[1], dtype = bool)
+        pos = image_to_grid(grid, points.reshape(-1, 2))
+        labels = np.round(pos)
+        near = np.all(np.abs(pos - labels) < GRID_LABEL_TOLERANCE, axis = 1)
+        if radius is not None:
+            near &= np.all(np.abs(labels) <= radius, axis = 1)
+        return labels, near
+
+    def _fit(grid, radius = None):
+        """Fit a grid to labeled intersections, returns the grid and number of grid positions
+        matched by inliers (a degenerated grid maps many intersections to the same position)"""
+        labels, near = _label(grid, radius)
+        if np.count_nonzero(near) < 4:
+            return None, 0
+        fit, mask = cv2.findHomography(labels[near], points.reshape(-1, 2)[near], cv2.RANSAC,
+                                       GRID_RANSAC_THRESHOLD * spacing)
+        if fit is None:
+            return None, 0
+        return fit, len(np.unique(labels[near][mask.ravel() > 0], axis = 0))
+
+    def _valid(grid):
+        """Grid doesn't cross the horizon within board size from its origin,
+        and has spacing near the spacing of board edges"""
+        box = np.array([[-n, -n], [n, -n], [n, n], [-n, n]])
+        w = box @ grid[2, :2] + grid[2, 2]
+        if not (np.all(w > 0) or np.all(w < 0)):
+            return False
+        cell = grid_to_image(grid, unit)
+        sides = np.linalg.norm(cell - np.roll(cell, 1, axis = 0), axis = 1)
+        return np.all((sides > spacing / GRID_SPACING_RATIO) & (sides < spacing * GRID_SPACING_RATIO))
+
+    # Every cell made by an intersection and the next lines nearest to board spacing
+    # away from it is a grid hypothesis. Hypotheses are scored by number of intersections
+    # matched around the cell, with the cell taken as affine grid
+    # Local grid spacing is checked, as lines made by stone edges might form a grid of half spacing
+    nv, nh = len(lines_v), len(lines_h)
+    dx = np.linalg.norm(points[None, :, :] - points[:, None, :], axis = 3)
+    dx[np.tril_indices(nv)] = np.inf
+    i2 = np.argmin(np.abs(dx - spacing), axis = 1)
+    dy = np.linalg.norm(points[:, None, :] - points[:, :, None], axis = 3)
+    dy[:, np.tril_indices(nh)[0], np.tril_indices(nh)[1]] = np.inf
+    j2 = np.argmin(np.abs(dy - spacing), axis = 2)
+
+    i, j = np.mgrid[0:nv-1, 0:nh-1]
+    i, j = i.ravel(), j.ravel()
+    i2, j2 = i2[i, j], j2[i, j]
+    p0 = points[i, j]
+    m = np.stack([points[i2, j] - p0, points[i, j2] - p0], axis = 2)
+    sides = np.linalg.norm(m, axis = 1)
+    ok = np.all((sides > spacing / GRID_SPACING_RATIO) & (sides < spacing * GRID_SPACING_RATIO), axis = 1) & \
+         (np.abs(np.linalg.det(m)) > 0)
+    if not np.any(ok):
+        logging.warning("Cannot find board grid cells")
+        return None
+    i, j, i2, j2, p0, m = i[ok], j[ok], i2[ok], j2[ok], p0[ok], m[ok]
+
+    pos = (points.reshape(1, -1, 2) - p0[:, None, :]) @ np.linalg.inv(m).transpose(0, 2, 1)
+    labels = np.round(pos)
+    near = np.all((np.abs(pos - labels) < GRID_LABEL_TOLERANCE) & (np.abs(labels) <= GRID_SEED_RADIUS), axis = 2)
+    score = np.count_nonzero(near, axis = 1)
+
+    # Grow grids from best scored cells, ties are resolved by distance to board edges center
+    center = np.mean(edges, axis = 0)
+    order = np.lexsort((np.linalg.norm(p0 - center, axis = 1), -score))
+    unit = np.float32([[0, 0], [1, 0], [1, 1], [0, 1]])
+    best, best_count = None, 0
+    for k in order[:GRID_SEEDS]:
+        cell = points[[i[k], i2[k], i2[k], i[k]], [j[k], j[k], j2[k], j2[k]]]
+        grid = cv2.getPerspectiveTransform(unit, np.float32(cell))
+        radius = GRID_SEED_RADIUS
+        while grid is not None and radius < n:
+            radius = int(np.ceil(radius * GRID_GROWTH))
+            grid, count = _fit(grid, radius)
+            if grid is not None and not _valid(grid): grid = None
+        for _ in range(GRID_FIT_PASSES):
+            if grid is None: break
+            grid, count = _fit(grid)
+            if grid is not None and not _valid(grid): grid = None
+        if grid is not None and count > best_count:
+            best, best_count = grid, count
+
+    if best is None:
+        logging.warning("Cannot fit board grid")
+        return None
+
+    # Lines are infinite, so lines outside the board (its frame, labels) cross as many lines
+    # as board lines do. Board is placed where the grid lines are supported by edges the most:
+    # edge pixels are sampled along every grid line matched by intersections
+    labels, near = _label(best)
+    lo, hi = labels[near].min(axis = 0).astype(int), labels[near].max(axis = 0).astype(int)
+    edges_img = cv2.dilate(edges_img, np.ones((3, 3), dtype = np.uint8))
+    shift = [0, 0]
+    for a in (0, 1):
+        # Sample points (column, row) along the lines
+        values = np.arange(lo[a], hi[a] + 1)
+        t = np.linspace(lo[1-a], hi[1-a], GRID_SUPPORT_SAMPLES)
+        pos = np.empty((len(values), len(t), 2))
+        pos[:, :, a], pos[:, :, 1-a] = values[:, None], t[None, :]
+        xy = np.round(grid_to_image(best, pos.reshape(-1, 2))).astype(np.intp)
+        inside = (xy[:, 0] >= 0) & (xy[:, 0] < img.shape[CV_WIDTH]) & \
+                 (xy[:, 1] >= 0) & (xy[:, 1] < img.shape[CV_HEIGTH])
+        on_edge = np.zeros(len(xy), dtype = bool)
+        on_edge[inside] = edges_img[xy[inside, 1], xy[inside, 0]] > 0
+        support = on_edge.reshape(len(values), len(t)).mean(axis = 1)
+
+        # Window of board size with the most support, the nearest to board edges center
+        starts = np.arange(min(lo[a], hi[a] - n), max(lo[a], hi[a] - n) + 1)
+        scores = np.array([support[(values >= s) & (values <= s + n)].sum() for s in starts])
+        candidates = starts[scores >= scores.max() - 1e-6]
+        mid = image_to_grid(best, center)[0, a] - n / 2
+        shift[a] = candidates[np.argmin(np.abs(candidates - mid))]
+
+    best = best @ np.array([[1, 0, shift[0]], [0, 1, shift[1]], [0, 0, 1]], dtype = np.float64)
+    labels, near = _label(best)
+    near &= np.all((labels >= 0) & (labels <= n), axis = 1)
+    if np.count_nonzero(near) < GRID_MIN_MATCH * size * size:
+        logging.warning("Cannot fit board grid ({} intersections matched)".format(np.count_nonzero(near)))
+        return None
+
+    logging.info("Board grid fitted on {} of {} intersections".format(np.count_nonzero(near), near.size))
+    res[GR_GRID] = best
+
+    # Edges are top-left and bottom-right intersections
+    top_left, bottom_right = grid_to_image(best, [[0, 0], [n, n]]).tolist()
+    res[GR_EDGES] = [top_left, bottom_right]
+    res[GR_SPACING] = list(board_spacing(res[GR_EDGES], size))
+
+    def _draw_grid():
+        debug_img = img.copy()
+        for i in range(size):
+            for ends in ([[i, 0], [i, n]], [[0, i], [n, i]]):
+                p1, p2 = np.rint(grid_to_image(best, ends)).astype(int).tolist()
+                cv2.line(debug_img, p1, p2, COLOR_RED, 1)
+        return debug_img
+    store_debug_img(res, 'IMG_GRID', _draw_grid, debug)
+
+    return best
+
+# Internal function: unique lines of a grid family
+def grid_family(lines, shape, axis, delta, max_count):
+    """Returns up to max_count lines (rho, theta) of one direction which are far from
+    each other by more than delta pixels at image center, strongest lines first.
+
+    Directions of grid lines change gradually, so lines which direction differs from
+    directions of their neighbours by more than GRID_ANGLE_TOLERANCE are dropped.
+
+    Lines are sorted by the coordinate (X for vertical lines, Y for horizontal ones) at image center"""
+    if len(lines) == 0:
+        return lines
+
+    c = np.cos(lines[:, 1])
+    s = np.sin(lines[:, 1])
+    if axis == 0:
+        coord = (lines[:, 0] - shape[CV_HEIGTH] / 2 * s) / c
+        angle = np.where(lines[:, 1] > np.pi / 2, lines[:, 1] - np.pi, lines[:, 1])
+    else:
+        coord = (lines[:, 0] - shape[CV_WIDTH] / 2 * c) / s
+        angle = lines[:, 1]
+
+    # Median direction of neighbour lines
+    order = np.argsort(coord)
+    k = GRID_ANGLE_NEIGHBOURS
+    window = np.lib.stride_tricks.sliding_window_view(np.pad(angle[order], k, mode = 'edge'), 2 * k + 1)
+    median = np.empty_like(angle)
+    median[order] = np.median(window, axis = 1)
+    valid = np.abs(angle - median) <= GRID_ANGLE_TOLERANCE * np.pi / 180
+
+    # HoughLines returns lines ordered by votes, so the strongest lines are taken
+    keep = []
+    for i in np.flatnonzero(valid):
+        if len(keep) >= max_count:
+            break
+        if len(keep) == 0 or np.min(np.abs(coord[keep] - coord[i])) > delta:
+            keep.append(i)
+    keep = sorted(keep, key = lambda i: coord[i])
+    return lines[keep]
+
+# Internal function: lines intersections
+def line_intersections(lines1, lines2):
+    """Returns (N1 * N2, 2) array of intersections of every line (rho, theta) of lines1
+    with every line of lines2"""
+    r1, t1 = lines1[:, 0, None], lines1[:, 1, None]
+    r2, t2 = lines2[None, :, 0], lines2[None, :, 1]
+    c1, s1, c2, s2 = np.cos(t1), np.sin(t1), np.cos(t2), np.sin(t2)
+    det = c1 * s2 - s1 * c2
+    x = (r1 * s2 - s1 * r2) / det
+    y = (c1 * r2 - r1 * c2) / det
+    return np.stack([x.ravel(), y.ravel()], axis = 1)
+
+# Board grid from edges
+def grid_from_edges(edges, size):
+    """Returns grid homography of a board with given edges and size"""
+    space_x, space_y = board_spacing(edges, size)
+    return np.array([[space_x, 0, edges[0][0]], [0, space_y, edges[0][1]], [0, 0, 1]], dtype = np.float64)
+
+# Map grid coordinates to image
+def grid_to_image(grid, pos):
+    """Returns image coordinates (X, Y) of grid coordinates (column, row) array"""
+    pos = np.asarray(pos, dtype = np.float64).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(pos, grid).reshape(-1, 2)
+
+# Map image coordinates to grid
+def image_to_grid(grid, xy):
+    """Returns grid coordinates (column, row) of image coordinates (X, Y) array"""
+    xy = np.asarray(xy, dtype = np.float64).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(xy, np.linalg.inv(grid)).reshape(-1, 2)
+
+# Internal function: move grid to specified origin and scale
+def move_grid(grid, origin, scale = 1.0):
+    """Returns grid homography for image coordinates (X - origin) * scale.
+    Scale might be a number or a pair of (X, Y) scale factors"""
+    if grid is None: return None
+    sx, sy = np.broadcast_to(scale, 2)
+    m = np.array([[sx, 0, -origin[0] * sx], [0, sy, -origin[1] * sy], [0, 0, 1]])
+    return m @ grid
+
 # Define board as provided in parameters
-def get_board_from_params(img, params, res):
+def get_board_from_params(img, params, res, debug = DEBUG_FULL):
     """Transforms board edges and size provided in params to result and calculate spacing"""
 
     # Edges
@@ -456,20 +1118,31 @@ def get_board_from_params(img, params, res):
     logging.info("Detected spacing: {}".format(spacing))
 
     # Debug images
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    res[GR_IMG_GRAY] = gray
-    debug_img = img1_to_img3(gray)
-    draw_board_grid(debug_img, edges, size, space_x, space_y, color = COLOR_RED)
-    res[GR_IMG_LINES2] = debug_img
+    if debug != DEBUG_NONE:
+        grid_edges = deepcopy(edges)
+
+        def _draw_grid():
+            debug_img = img1_to_img3(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+            draw_board_grid(debug_img, grid_edges, size, space_x, space_y, color = COLOR_RED)
+            return debug_img
+
+        store_debug_img(res, GR_IMG_GRAY, lambda: cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), debug)
+        store_debug_img(res, GR_IMG_LINES2, _draw_grid, debug)
 
     return edges, size
 
+# Internal function: flat index of stone positions
+def stone_index(stones, size = MAX_BOARD_SIZE):
+    """Returns flat board index (A-1) * size + (B-1) of every stone in stones array"""
+    return (stones[:, GR_A] - 1) * size + stones[:, GR_B] - 1
+
 # Converts stone coordinates to stone positions
 def convert_xy(coord, res):
     """Convert stone coordinates to board positions.
     Parameters:
         coord   Numpy array or list of stone coordinates (X, Y, R)
-        res     Results dictionary (edges, size and spacing must be set)
+        res     Results dictionary (edges, size and spacing must be set).
+                If board grid is set, positions are found with it (see find_grid())
     Returns:
         numpy array (X, Y, A, B, R) or None
     """
@@ -481,33 +1154,39 @@ def convert_xy(coord, res):
     size = res[GR_BOARD_SIZE]
     space_x, space_y = res[GR_SPACING]
 
-    # Loop through converting board coordinates to stone positions
+    # Convert board coordinates to stone positions
     # Positions start at 1 and have to be within board's edges
-    stones = []
-    for c in coord:
-        x = int(round(c[0],0))
-        y = int(round(c[1],0))
-        r = int(round(c[2], 0))
+    coord = np.asarray(coord)
+    if len(coord) == 0:
+        return None
 
-        a = int(round((c[0] - edges[0][0]) / space_x, 0)) + 1
-        b = size - int(round((c[1] - edges[0][1]) / space_y, 0))
+    stones = np.empty((len(coord), 5), dtype = np.int64)
+    stones[:, [GR_X, GR_Y, GR_R]] = np.round(coord[:, 0:3])
+    grid = res.get(GR_GRID)
+    if grid is None:
+        stones[:, GR_A] = np.round((coord[:, 0] - edges[0][0]) / space_x) + 1
+        stones[:, GR_B] = size - np.round((coord[:, 1] - edges[0][1]) / space_y)
+    else:
+        pos = np.round(image_to_grid(grid, coord[:, 0:2]))
+        stones[:, GR_A] = pos[:, 0] + 1
+        stones[:, GR_B] = size - pos[:, 1]
 
-        if a <= 0 or a > size or b <= 0 or b > size:
-            logging.error("A stone at ({}, {}) is outside the board space".format(a, b))
-        else:
-            stones.extend([[x, y, a, b, r]])
+    a, b = stones[:, GR_A], stones[:, GR_B]
+    inside = (a > 0) & (a <= size) & (b > 0) & (b <= size)
+    for pos in stones[~inside, GR_A:GR_B+1]:
+        logging.error("A stone at ({}, {}) is outside the board space".format(pos[0], pos[1]))
 
+    stones = stones[inside]
     if len(stones) == 0:
         return None
 
     # Remove duplicates
-    # In case when several stones are at the same place, maximum radius is taken
-    s = np.array(sorted(stones, key = lambda x: [x[2], x[3]]))
-    u, c = np.unique(np.take(s, [2, 3], axis = 1), axis = 0, return_counts = True)
-    g = np.split(s, np.cumsum(c)[:-1])
-    stones_u = np.array([np.max(x, axis = 0) for x in g])
+    # In case when several stones are at the same place, maximum of every value is taken
+    idx = stone_index(stones, size)
+    board = np.full((size * size, 5), np.iinfo(np.int64).min, dtype = np.int64)
+    np.maximum.at(board, idx, stones)
 
-    return stones_u
+    return board[np.unique(idx)]
 
 # Internal function: apply area mask
 def apply_area_mask(img, params):
@@ -525,6 +1204,74 @@ def apply_area_mask(img, params):
 
     return get_image_area(img, m), [m[0], m[1]]
 
+# Internal function: board area
+def board_area(img, res):
+    """Returns board area with one spacing margin (x0, y0, x1, y1) clipped to image size"""
+    edges = res[GR_EDGES]
+    space_x, space_y = res[GR_SPACING]
+    h, w = img.shape[:2]
+    if res.get(GR_GRID) is not None:
+        # Bounding box of board corners
+        n = res[GR_BOARD_SIZE] - 1
+        corners = grid_to_image(res[GR_GRID], [[0, 0], [n, 0], [n, n], [0, n]])
+        edges = [corners.min(axis = 0).tolist(), corners.max(axis = 0).tolist()]
+    return [max(int(edges[0][0] - space_x), 0), max(int(edges[0][1] - space_y), 0),
+            min(int(edges[1][0] + space_x) + 1, w), min(int(edges[1][1] + space_y) + 1, h)]
+
+# Scale board area to working resolution
+def make_work_area(img, params, res):
+    """Cut board area out of an image and scale it so board spacing becomes
+    WORK_SPACING pixels.
+
+    Parameters:
+        img         An image
+        params      Recognition parameters (see grdef.DEF_GR_PARAMS)
+        res         Results dictionary (edges and spacing must be set)
+
+    Returns:
+        scaled image, top-left corner of the area in source image and scale factor
+    """
+    x0, y0, x1, y1 = board_area(img, res)
+    scale = params['WORK_SPACING'] / min(res[GR_SPACING])
+    logging.info("Board area {} scaled by {:.3f}".format([x0, y0, x1, y1], scale))
+
+    interp = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+    work_img = cv2.resize(img[y0:y1, x0:x1], None, fx = scale, fy = scale, interpolation = interp)
+    return work_img, [x0, y0], scale
+
+# Internal function: board geometry at working resolution
+def work_results(res, origin, scale):
+    """Returns a copy of results dictionary with edges and spacing
+    moved to the working area and scaled"""
+    edges = res[GR_EDGES]
+    space_x, space_y = res[GR_SPACING]
+
+    work_res = dict(res)
+    work_res[GR_EDGES] = [[(edges[i][0] - origin[0]) * scale, (edges[i][1] - origin[1]) * scale] for i in (0, 1)]
+    work_res[GR_SPACING] = [space_x * scale, space_y * scale]
+    if res.get(GR_GRID) is not None:
+        work_res[GR_GRID] = move_grid(res[GR_GRID], origin, scale)
+    return work_res
+
+# Internal function: stones detection parameters at working resolution
+def work_params(params):
+    """Returns a copy of parameters with stone radius limits derived from WORK_SPACING.
+    Other pixel-sized parameters (HC_MASK, BLUR_MASK, morphology, HC_MINDIST) are
+    deliberately not scaled: they apply to working resolution pixels as they are,
+    so the same parameters give the same detection whatever the image resolution is"""
+    p = dict(params)
+    p['HC_MAXRADIUS'] = p['WS_MAXRADIUS'] = int(round(params['WORK_SPACING'] * WORK_MAX_RADIUS))
+    return p
+
+# Internal function: map stones from working area back to source image
+def unscale_stones(stones, origin, scale):
+    if stones is None: return None
+    stones = np.array(stones)
+    stones[:, GR_X] = np.round(stones[:, GR_X] / scale + origin[0])
+    stones[:, GR_Y] = np.round(stones[:, GR_Y] / scale + origin[1])
+    stones[:, GR_R] = np.round(stones[:, GR_R] / scale)
+    return stones
+
 # Internal function: move edges to specified offset
 def offset_edges(edges, offset):
     if edges is None: return None
@@ -537,9 +1284,8 @@ def offset_edges(edges, offset):
 # Internal function: move stones to specified offset
 def offset_stones(stones, offset):
     if stones is None: return None
-    for st in stones:
-        st[GR_X] += offset[0]
-        st[GR_Y] += offset[1]
+    stones[:, GR_X] += offset[0]
+    stones[:, GR_Y] += offset[1]
     return stones
 
 
@@ -549,22 +1295,197 @@ def eliminate_duplicates(bs, ws):
         return bs, ws
 
     # Priority for white stones
-    for st in ws:
-        px = st[GR_A]
-        py = st[GR_B]
-        for i in range(len(bs)):
-            if px == bs[i,GR_A] and py == bs[i, GR_B]:
-                bs = np.delete(bs, i, axis = 0)
-                break;
+    taken = np.isin(stone_index(bs), stone_index(ws))
+    if np.any(taken):
+        bs = bs[~taken]
     return bs, ws
 
+# Find stones by sampling board intersections
+def sample_stones(img, params, res, debug = DEBUG_FULL):
+    """Find stones by sampling board intersections.
+
+    A disc around every intersection is sampled at once in HSV color space.
+    Thresholds are relative to board color, which is estimated as median of
+    the most saturated intersections (SAMPLE_BOARD_PART of them), so empty
+    intersections are found without any tuning as long as at least that part
+    of the board is empty. Every intersection is then classified by median
+    brightness and saturation of its disc (SAMPLE_RADIUS part of spacing):
+    it is occupied by a black stone if it is darker than SAMPLE_BLACK_LEVEL
+    of board brightness, otherwise by a white stone if its saturation is below
+    SAMPLE_WHITE_SATURATION of board saturation. Boards which saturation is
+    below SAMPLE_MIN_SATURATION (monochrome images) have white stones told by
+    brightness instead (see SAMPLE_WHITE_LEVEL).
+
+    Stone radius is measured as radius of a circle of the same area as stone
+    pixels within half of board spacing around the intersection.
+
+    Limitations: stones detection parameters are not used; boards which color
+    is close to white stones color, boards covered by stones for the most part
+    and uneven lighting which makes part of the board twice darker than the rest
+    are not handled, filter-based detection should be used there.
+
+    Board edges, size and spacing must be set in results dictionary.
+    If board grid is set there, intersections are placed with it (see find_grid()).
+
+    Parameters:
+        img         An image to process
+        params      Recognition parameters (see grdef.DEF_GR_PARAMS)
+        res         Results dictionary (see grdef.GR_xxx)
+        debug       Debug level (DEBUG_NONE, DEBUG_LAZY or DEBUG_FULL)
+
+    Returns:
+        black and white stones arrays in form of (X, Y, A, B, R) or None
+    """
+    edges = res[GR_EDGES]
+    size = res[GR_BOARD_SIZE]
+    space_x, space_y = res[GR_SPACING]
+
+    # Intersection centers, board positions are (A, B) = (col + 1, size - row)
+    rows, cols = np.mgrid[0:size, 0:size]
+    rows, cols = rows.ravel(), cols.ravel()
+    if res.get(GR_GRID) is None:
+        cx = np.round(edges[0][0] + cols * space_x).astype(np.intp)
+        cy = np.round(edges[0][1] + rows * space_y).astype(np.intp)
+    else:
+        cx, cy = np.round(grid_to_image(res[GR_GRID], np.stack([cols, rows], axis = 1))).astype(np.intp).T
+
+    # Disc offsets: stones are measured within half of spacing, classified by inner disc
+    max_r = max(int(min(space_x, space_y) / 2), 1)
+    r = max(int(min(space_x, space_y) * SAMPLE_RADIUS), 1)
+    dy, dx = np.mgrid[-max_r:max_r+1, -max_r:max_r+1]
+    d2 = dx*dx + dy*dy
+    disc = d2 <= max_r*max_r
+    inner = d2[disc] <= r*r
+    dx, dy = dx[disc], dy[disc]
+
+    # Sample all discs in a single pass, pixels out of image are clipped
+    xs = np.clip(cx[:, None] + dx[None, :], 0, img.shape[CV_WIDTH] - 1)
+    ys = np.clip(cy[:, None] + dy[None, :], 0, img.shape[CV_HEIGTH] - 1)
+    samples = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)[ys, xs]
+    sat, val = samples[:, :, 1], samples[:, :, 2]
+    disc_sat = np.median(sat[:, inner], axis = 1)
+    disc_val = np.median(val[:, inner], axis = 1)
+
+    # Board color taken on the most saturated intersections
+    board = disc_sat >= np.percentile(disc_sat, 100 * (1 - SAMPLE_BOARD_PART))
+    board_sat, board_val = np.median(disc_sat[board]), np.median(disc_val[board])
+    logging.info("Board brightness {}, saturation {}".format(board_val, board_sat))
+
+    # Thresholds are applied to disc medians for classification and
+    # to every pixel for radius measurement
+    black_level = board_val * SAMPLE_BLACK_LEVEL
+    if board_sat >= SAMPLE_MIN_SATURATION:
+        def _is_white(s, v): return (s < board_sat * SAMPLE_WHITE_SATURATION) & (v >= black_level)
+    else:
+        white_level = board_val + (255 - board_val) * SAMPLE_WHITE_LEVEL
+        def _is_white(s, v): return v > white_level
+
+    # Black test goes first, so every intersection gets a single class
+    black = disc_val < black_level
+    white = ~black & _is_white(disc_sat, disc_val)
+
+    stone_px = np.where(black[:, None], val < black_level, _is_white(sat, val))
+    radius = np.maximum(np.round(np.sqrt(np.count_nonzero(stone_px, axis = 1) / np.pi)), 1).astype(np.intp)
+
+    stones = np.stack([cx, cy, cols + 1, size - rows, radius], axis = 1)
+    black_stones = stones[black] if np.any(black) else None
+    white_stones = stones[white] if np.any(white) else None
+
+    def _draw_samples():
+        debug_img = img.copy()
+        for x, y, rs, c in zip(cx, cy, radius, np.where(black, 1, np.where(white, 2, 0))):
+            cv2.circle(debug_img, (int(x), int(y)), int(rs) if c else r, (COLOR_RED, COLOR_BLACK, COLOR_WHITE)[c], 1)
+        return debug_img
+    store_debug_img(res, 'IMG_SAMPLES', _draw_samples, debug)
+
+    logging.info("Stones found: {} black, {} white".format(np.count_nonzero(black), np.count_nonzero(white)))
+    return black_stones, white_stones
+
+# Thread pool to run black and white stones detection concurrently
+_stones_pool = None
+_stones_pool_lock = threading.Lock()
+
+# Internal function: thread pool to run black and white stones detection
+def stones_pool():
+    """Returns the thread pool, creating it on first call"""
+    global _stones_pool
+    with _stones_pool_lock:
+        if _stones_pool is None:
+            _stones_pool = ThreadPoolExecutor(max_workers = 2, thread_name_prefix = 'find_stones')
+        return _stones_pool
+
+# Internal function: find black and white stones
+def find_stones_bw(img, params, res, f_parallel = False, cache = None, cache_key = None,
+                   debug = DEBUG_FULL, hook = None):
+    """Find black and white stones.
+    If f_parallel is True, both colors are processed on a thread pool (OpenCV releases the GIL).
+    Every color then gets its own results dictionary which are merged into res
+    after both passes are complete.
+
+    Both passes share image conversions (see GrImagePlanes). Pooled buffers are
+    thread-local, while pool threads are shared by all images processed at the
+    same time, so conversions made on the pool are not placed to pooled buffers.
+
+    Returns black and white stones arrays"""
+    pool = _filter_buffers if cache is None and debug == DEBUG_NONE and not f_parallel else None
+    planes = GrImagePlanes(pool)
+
+    if not f_parallel:
+        black_stones = find_stones(img, params, res, 'B', cache, cache_key, debug, hook, planes)
+        white_stones = find_stones(img, params, res, 'W', cache, cache_key, debug, hook, planes)
+        return black_stones, white_stones
+
+    # Board geometry is only read by find_stones, so shallow copies are enough
+    res_b, res_w = dict(res), dict(res)
+    executor = stones_pool()
+    f_b = executor.submit(find_stones, img, params, res_b, 'B', cache, cache_key, debug, hook, planes)
+    f_w = executor.submit(find_stones, img, params, res_w, 'W', cache, cache_key, debug, hook, planes)
+    black_stones, white_stones = f_b.result(), f_w.result()
+
+    res.update(res_b)
+    res.update(res_w)
+    return black_stones, white_stones
+
 # Board image processing main function
-def process_img(img, params):
+def process_img(img, params, f_parallel = False, cache = None, debug = DEBUG_FULL, hook = None):
     """Main image processing function.
 
     Parameters:
-        img    An image to process
-        params Recognition parameters (see grdef.DEF_GR_PARAMS)
+        img         An image to process
+        params      Recognition parameters (see grdef.DEF_GR_PARAMS)
+        f_parallel  If True, black and white stones are detected concurrently
+        cache       Stage cache (GrStageCache). If provided, only stages
+                    affected by parameter changes since last run are recalculated.
+        debug       Debug images generation level:
+                        DEBUG_NONE  debug images (IMG_xxx keys) are not generated
+                        DEBUG_LAZY  functions rendering debug images on demand are stored instead.
+                                    Only drawing is deferred: images made by processing itself
+                                    (filter outputs, edges) are stored as at DEBUG_FULL level,
+                                    so they are kept in memory with the results
+                        DEBUG_FULL  all debug images are generated
+        hook        A function called on start and end of every processing stage
+                    with a stage event (see hooks.GrStageEvent) describing stage name,
+                    stone color, input shape and, on stage end, duration and output count.
+                    A context manager factory could be used by wrapping it into
+                    hooks.GrContextHook. If f_parallel is True, the hook is called
+                    from several threads. Events of stages which output is taken
+                    from the cache are marked as cached. Post-filter stages restored
+                    from the cache produce a single cached event of the post-filter,
+                    CONVERT_XY stage is not reported for them.
+
+    Stones are detected either by image filters and HoughCircles (find_stones())
+    or by sampling board intersections (sample_stones()), as STONES_ENGINE parameter sets.
+
+    If GRID_HOMOGRAPHY parameter is set, board grid is fitted as a homography
+    (see find_grid()), so stones of perspective-distorted boards are placed
+    without transforming the image.
+
+    If WORK_SPACING parameter is set, stones are detected on the board area scaled so
+    board spacing becomes WORK_SPACING pixels (see make_work_area()), with stone radius
+    limits derived from the spacing. Other pixel-sized parameters are applied at working
+    resolution as they are, so detection does not depend on image resolution.
+    Stones are then mapped back to the image, while stones detection debug images
+    stay at working resolution.
 
     Returns results dictionary (see grdef.GR_xxx)"""
 
@@ -575,30 +1496,87 @@ def process_img(img, params):
     try:
         # Apply area mask
         # Offset will be used to shift resulting coordinates
-        img2, offset = apply_area_mask(img, params)
+        key = None
+        if cache is not None:
+            key = cache.stage_key((cache.image_key(img), debug), 'AREA_MASK', params, ['AREA_MASK'])
+        with GrHookStage(hook, 'AREA_MASK', None, img) as st:
+            img2, offset = run_stage(cache, key, res, apply_area_mask, img, params, on_hit = st.cached)
 
         # Find board edges, spacing, size
         if params.get('BOARD_EDGES') is None:
             # Parameter not set, detecting
-            board_edges, board_size = find_board(img2, params, res)
+            if cache is not None:
+                key = cache.stage_key(key, 'FIND_BOARD', params, FIND_BOARD_KEYS)
+            with GrHookStage(hook, 'FIND_BOARD', None, img2) as st:
+                board_edges, board_size = run_stage(cache, key, res, find_board, img2, params, res, debug,
+                                                    on_hit = st.cached)
+                st.done(None, board_size)
             if board_edges is None:
                logging.error('Edges could not be found, processing stopped')
                return None
         else:
-            board_edges, board_size = get_board_from_params(img2, params, res)
+            if cache is not None:
+                key = cache.stage_key(key, 'BOARD_PARAMS', params, BOARD_PARAMS_KEYS)
+            with GrHookStage(hook, 'BOARD_PARAMS', None, img2) as st:
+                board_edges, board_size = run_stage(cache, key, res, get_board_from_params,
+                                                    img2, params, res, debug, on_hit = st.cached)
+                st.done(None, board_size)
+
+        # Fit board grid homography
+        if params.get('GRID_HOMOGRAPHY'):
+            if cache is not None:
+                key = cache.stage_key(key, 'FIND_GRID', params, FIND_GRID_KEYS)
+            with GrHookStage(hook, 'FIND_GRID', None, img2) as st:
+                if run_stage(cache, key, res, find_grid, img2, params, res, debug,
+                             on_hit = st.cached) is not None:
+                    board_edges = res[GR_EDGES]
+
+        # Scale board area to working resolution
+        work_img, work_res, stone_params = img2, res, params
+        if params.get('WORK_SPACING'):
+            if cache is not None:
+                key = cache.stage_key(key, 'WORK_AREA', params, ['WORK_SPACING'])
+            with GrHookStage(hook, 'WORK_AREA', None, img2) as st:
+                work_img, origin, scale = run_stage(cache, key, res, make_work_area, img2, params, res,
+                                                    on_hit = st.cached)
+            work_res = work_results(res, origin, scale)
+            stone_params = work_params(params)
 
         # Find stones
-        black_stones = find_stones(img2, params, res, 'B')
-        white_stones = find_stones(img2, params, res, 'W')
+        if params.get('STONES_ENGINE') == STONES_ENGINE_SAMPLE:
+            if cache is not None:
+                key = cache.stage_key(key, 'SAMPLE_STONES', params, SAMPLE_STONES_KEYS)
+            with GrHookStage(hook, 'SAMPLE_STONES', None, work_img) as st:
+                black_stones, white_stones = run_stage(cache, key, work_res, sample_stones,
+                                                       work_img, stone_params, work_res, debug,
+                                                       on_hit = st.cached)
+                st.done(None, (len(black_stones) if black_stones is not None else 0) + \
+                              (len(white_stones) if white_stones is not None else 0))
+        else:
+            black_stones, white_stones = find_stones_bw(work_img, stone_params, work_res, f_parallel,
+                                                        cache, key, debug, hook)
+
+        # Map stones back from working resolution, keeping debug images
+        if work_res is not res:
+            black_stones = unscale_stones(black_stones, origin, scale)
+            white_stones = unscale_stones(white_stones, origin, scale)
+            res.update({k: work_res[k] for k in work_res if not k in (GR_EDGES, GR_SPACING, GR_GRID)})
 
         # Elminate duplicates
         if not 'QUALITY_CHECK' in params:
-            black_stones, white_stones = eliminate_duplicates(black_stones, white_stones)
+            with GrHookStage(hook, 'DUPLICATES') as st:
+                black_stones, white_stones = eliminate_duplicates(black_stones, white_stones)
+                st.done(None, (len(black_stones) if black_stones is not None else 0) + \
+                              (len(white_stones) if white_stones is not None else 0))
 
         # Apply offset
-        offset_edges(board_edges, offset)
-        offset_stones(black_stones, offset)
-        offset_stones(white_stones, offset)
+        # Stones are copied since they could be shared with stage cache
+        board_edges = offset_edges(deepcopy(board_edges), offset)
+        black_stones = offset_stones(deepcopy(black_stones), offset)
+        white_stones = offset_stones(deepcopy(white_stones), offset)
+        res[GR_EDGES] = board_edges
+        if res.get(GR_GRID) is not None:
+            res[GR_GRID] = move_grid(res[GR_GRID], [-offset[0], -offset[1]])
 
     except:
         logging.exception("Processing error")
@@ -610,6 +1588,45 @@ def process_img(img, params):
 
     return res
 
+# Find stones within an area of a board image
+def find_area_stones(img, params, res, area, f_parallel = False, hook = None):
+    """Detect stones within an image area, board geometry being already known.
+
+    Board is not detected: edges, spacing, size and grid are taken from results
+    of previous processing of an image of the same board, so only stones detection
+    runs on the area. No debug images are generated.
+
+    Parameters:
+        img         An image
+        params      Recognition parameters (see grdef.DEF_GR_PARAMS)
+        res         Results dictionary with board geometry in image coordinates
+        area        Area to process (x0, y0, x1, y1)
+        f_parallel  If True, black and white stones are detected concurrently
+        hook        Stage events hook (see process_img())
+
+    Returns:
+        black and white stones arrays with image coordinates. Duplicates are not eliminated.
+    """
+    x0, y0, x1, y1 = area
+    area_img, scale, stone_params = img[y0:y1, x0:x1], 1.0, params
+    if params.get('WORK_SPACING'):
+        scale = params['WORK_SPACING'] / min(res[GR_SPACING])
+        interp = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        area_img = cv2.resize(area_img, None, fx = scale, fy = scale, interpolation = interp)
+        stone_params = work_params(params)
+    area_res = work_results(res, [x0, y0], scale)
+
+    if params.get('STONES_ENGINE') == STONES_ENGINE_SAMPLE:
+        with GrHookStage(hook, 'SAMPLE_STONES', None, area_img) as st:
+            black_stones, white_stones = sample_stones(area_img, stone_params, area_res, DEBUG_NONE)
+            st.done(None, (len(black_stones) if black_stones is not None else 0) + \
+                          (len(white_stones) if white_stones is not None else 0))
+    else:
+        black_stones, white_stones = find_stones_bw(area_img, stone_params, area_res, f_parallel,
+                                                    debug = DEBUG_NONE, hook = hook)
+
+    return unscale_stones(black_stones, [x0, y0], scale), unscale_stones(white_stones, [x0, y0], scale)
+
 # Detect board parameters
 def detect_board(img, params):
     """Detect board edges, size and spacing.
@@ -640,6 +1657,86 @@ def detect_board(img, params):
         logging.exception("Processing error")
         raise
 
+# Detect board corners
+def find_board_corners(img, margin = CORNERS_MARGIN):
+    """Detect board quadrilateral on an image (such as a photo of a board taken at an angle).
+
+    The board is taken as the largest convex quadrilateral contour found either
+    on edges image or on binarized image. Every side of the quadrilateral has to
+    lie on image edges, so confidence of detection is part of side points
+    supported by edges (weakest side counts) multiplied by ratio of
+    quadrilateral area to area of contour's convex hull.
+    Detection runs on the image downscaled to CORNERS_IMG_SIZE.
+
+    Parameters:
+        img     An image to process
+        margin  Margin corners are moved outwards by (part of board side), so
+                board edges are kept on an image transformed to the corners
+
+    Returns:
+        corners     4x2 array of corners (top-left, top-right, bottom-right, bottom-left)
+                    in image coordinates or None if board was not found
+        confidence  Detection confidence from 0 to 1
+    """
+    scale = min(1.0, CORNERS_IMG_SIZE / max(img.shape[:2]))
+    if scale < 1.0:
+        img = cv2.resize(img, None, fx = scale, fy = scale, interpolation = cv2.INTER_AREA)
+    gray = img if len(img.shape) < 3 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    h, w = gray.shape
+
+    # Otsu threshold separates board from background and gives Canny thresholds
+    thresh, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    edges = cv2.Canny(gray, thresh / 2, thresh)
+    support = cv2.dilate(edges, np.ones((5, 5), np.uint8))
+
+    t = np.linspace(0, 1, CORNERS_SAMPLES)[:, None]
+    best_quad, best_conf = None, 0.0
+    for mask in [cv2.dilate(edges, np.ones((3, 3), np.uint8)), binary, 255 - binary]:
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for c in sorted(contours, key = cv2.contourArea, reverse = True)[:CORNERS_CANDIDATES]:
+            hull = cv2.convexHull(c)
+            hull_area = cv2.contourArea(hull)
+            if hull_area < CORNERS_MIN_AREA * h * w:
+                break
+
+            # Simplify the hull to 4 vertices
+            quad = None
+            for eps in [0.01, 0.02, 0.03, 0.05]:
+                q = cv2.approxPolyDP(hull, eps * cv2.arcLength(hull, True), True)
+                if len(q) <= 4:
+                    quad = q.reshape(-1, 2).astype(np.float32) if len(q) == 4 else None
+                    break
+            if quad is None:
+                continue
+
+            # Side support, sides lying on image borders are not supported
+            sides = quad[:, None] + t * (np.roll(quad, -1, axis = 0) - quad)[:, None]
+            x, y = np.rint(sides[..., 0]).astype(int), np.rint(sides[..., 1]).astype(int)
+            inside = (x > 1) & (x < w - 2) & (y > 1) & (y < h - 2)
+            supported = support[y.clip(0, h - 1), x.clip(0, w - 1)] > 0
+            side_support = np.where(inside.mean(axis = 1) > 0.5, supported.mean(axis = 1), 0.0)
+
+            area = cv2.contourArea(quad)
+            conf = float(side_support.min() * min(area, hull_area) / max(area, hull_area))
+            if conf > best_conf:
+                best_quad, best_conf = quad, conf
+
+    if best_quad is None:
+        return None, 0.0
+
+    # Order corners clockwise starting from top-left
+    q = best_quad
+    d1, d2 = q[1] - q[0], q[2] - q[1]
+    if d1[0] * d2[1] - d1[1] * d2[0] < 0:
+        q = q[::-1]
+    q = np.roll(q, -np.argmin(q.sum(axis = 1)), axis = 0)
+
+    # Add margin in board plane
+    m = cv2.getPerspectiveTransform(np.float32([[0, 0], [1, 0], [1, 1], [0, 1]]), q)
+    unit = np.float64([[-margin, -margin], [1 + margin, -margin], [1 + margin, 1 + margin], [-margin, 1 + margin]])
+    corners = cv2.perspectiveTransform(unit.reshape(-1, 1, 2), m).reshape(-1, 2)
+    return corners / scale, best_conf
 
 # Creates a board image for given image shape and board size
 # If recognition results are provided, plot them on the board
@@ -27,6 +27,54 @@ GR_TO = 1                         # index of line end in lines array
 STONE_BLACK = 'B'                 # key for black stones
 STONE_WHITE = 'W'                 # key for white stones
 STONE_COLORS = {STONE_BLACK: "Black", STONE_WHITE: "White"} # stone color names
+DEBUG_NONE = 0                    # debug level: no debug images generated
+DEBUG_LAZY = 1                    # debug level: debug images rendered on demand
+DEBUG_FULL = 2                    # debug level: all debug images generated
+STONES_ENGINE_FILTERS = 0         # stones detection engine: image filters and HoughCircles
+STONES_ENGINE_SAMPLE = 1          # stones detection engine: sampling of board intersections
+BOARD_ENGINE_HOUGH = 0            # board detection engine: HoughLines
+BOARD_ENGINE_PROFILE = 1          # board detection engine: edges projection profiles
+PROFILE_SIZE_LEVEL = 0.8          # min score of a board size found by projection profiles (part of best score)
+PITCH_PEAK_LEVEL = 0.8            # min autocorrelation peak taken as board grid pitch (part of highest peak)
+PITCH_EDGE_TOLERANCE = 0.35       # max distance of board edge from estimated grid line (part of pitch)
+GRID_MAX_ANGLE = 30               # max deviation of board grid lines from vertical or horizontal (degrees)
+GRID_LINE_LEVEL = 0.3             # min HoughLines votes of a board grid line (part of board side)
+GRID_THETA = 1                    # HoughLines angle resolution for board grid lines (degrees)
+GRID_ANGLE_TOLERANCE = 3          # max difference of board grid line direction from its neighbours (degrees)
+GRID_ANGLE_NEIGHBOURS = 5         # number of neighbours on every side a board grid line direction is compared to
+GRID_EXTRA_LINES = 4              # number of lines taken for board grid fitting in addition to board size
+GRID_LINE_DISTANCE = 0.4          # min distance between board grid lines (part of spacing)
+GRID_LABEL_TOLERANCE = 0.25       # max distance of a lines intersection from its grid position (part of spacing)
+GRID_RANSAC_THRESHOLD = 0.15      # max reprojection error of a grid homography inlier (part of spacing)
+GRID_FIT_PASSES = 2               # number of board grid homography fitting passes over all intersections
+GRID_GROWTH = 1.5                 # growth of area board grid is fitted to on every pass
+GRID_SPACING_RATIO = 1.5          # max ratio of board grid spacing to spacing of board edges
+GRID_MIN_MATCH = 0.4              # min number of lines intersections matched by board grid (part of board intersections)
+GRID_SUPPORT_SAMPLES = 100        # number of points board grid line support is sampled at
+GRID_SEEDS = 5                    # number of board cells board grid fitting starts from
+GRID_SEED_RADIUS = 3              # radius of area a board cell is scored at
+CORNERS_IMG_SIZE = 500            # max image side board corners are detected at (pixels)
+CORNERS_CANDIDATES = 5            # number of largest contours checked for board corners
+CORNERS_MIN_AREA = 0.15           # min area of board quadrilateral (part of image area)
+CORNERS_SAMPLES = 50              # number of points board quadrilateral side support is sampled at
+CORNERS_MARGIN = 0.03             # margin added around board quadrilateral (part of board side)
+CORNERS_MIN_CONFIDENCE = 0.7      # min confidence of board corners to transform image to
+SAMPLE_RADIUS = 0.35              # radius of intersection sampling disc (part of board spacing)
+SAMPLE_BOARD_PART = 0.25          # most saturated part of intersections board color is estimated on
+SAMPLE_BLACK_LEVEL = 0.5          # max brightness of black stones (part of board brightness)
+SAMPLE_WHITE_SATURATION = 0.4     # max saturation of white stones (part of board saturation)
+SAMPLE_MIN_SATURATION = 40        # min board saturation white stones are told by saturation at
+SAMPLE_WHITE_LEVEL = 0.5          # min brightness of white stones on unsaturated boards (part of range from board to max brightness)
+STATE_EMPTY = 0                   # board state: empty intersection
+STATE_BLACK = 1                   # board state: black stone
+STATE_WHITE = 2                   # board state: white stone
+PMF_OFF = 0                       # pyramid filter: off
+PMF_FULL = 1                      # pyramid filter: full image at full resolution
+PMF_FAST = 2                      # pyramid filter: board area at reduced resolution
+PMF_SPATIAL_RADIUS = 21           # pyramid filter spatial window radius (at full resolution)
+PMF_COLOR_RADIUS = 51             # pyramid filter color window radius
+PMF_FAST_SPACING = 24             # board spacing (pixels) fast pyramid filter scales image to
+WORK_MAX_RADIUS = 0.8             # max stone radius at working resolution (part of board spacing)
 
 # Parameters moved to gr.params
 
@@ -46,6 +94,7 @@ GR_IMG_LINES2 = "IMG_LINES2"        # generated lines image for 2nd pass
 GR_IMG_EDGES = "IMG_EDGES"          # edges image
 GR_EDGES = "EDGES"                  # edges array (x,y), (x,y)
 GR_SPACING = "SPACES"               # spacing of board net (x,y)
+GR_GRID = "GRID"                    # board grid homography (column, row) -> (x,y)
 GR_NUM_LINES = "NLIN"               # overall number of lines found
 GR_NUM_CROSS_H = "NCROSS_H"         # Number of crosses on horizontal line
 GR_NUM_CROSS_W = "NCROSS_W"         # Number of crosses on vertical line
@@ -0,0 +1,143 @@
+# Go board recognition project
+# Recognition stages instrumentation hooks
+# (c) kol, 2019-2023
+
+import time
+import threading
+
+STAGE_START = 'start'       # stage start event
+STAGE_END = 'end'           # stage end event
+
+class GrStageEvent(object):
+    """Recognition stage event.
+
+    A hook gets the same object twice: on stage start and on stage end.
+    Attributes:
+        kind        STAGE_START or STAGE_END
+        stage       Stage name (AREA_MASK, FIND_BOARD, THRESH, HOUGH_C, etc)
+        color       Stone color (STONE_BLACK or STONE_WHITE) for stones detection stages, otherwise None
+        shape       Shape of stage input (image or array) or None
+        duration    Stage duration in seconds (set on stage end)
+        count       Number of items stage produced (set on stage end):
+                    number of stones for stones detection stages,
+                    board size for board detection stages,
+                    None for image filters
+        cached      True if stage output was taken from the stage cache (set on stage end)
+    """
+    __slots__ = ('kind', 'stage', 'color', 'shape', 'duration', 'count', 'cached')
+
+    def __init__(self, stage, color = None, shape = None):
+        self.kind = STAGE_START
+        self.stage = stage
+        self.color = color
+        self.shape = shape
+        self.duration = None
+        self.count = None
+        self.cached = False
+
+    def __str__(self):
+        return '{} {}{}: shape {}, duration {}, count {}{}'.format(
+            self.kind, self.stage, '_' + self.color if self.color else '',
+            self.shape, self.duration, self.count, ', cached' if self.cached else '')
+
+class GrHookStage(object):
+    """Context manager wrapping a recognition stage.
+    Sends stage start and end events to a hook. If hook is None, does nothing.
+
+    Usage:
+        with GrHookStage(hook, 'THRESH', 'B', img) as st:
+            img = st.done(cv2.threshold(...))
+
+        with GrHookStage(hook, 'THRESH', 'B', img) as st:
+            img = run_stage(cache, key, res, fn, img, on_hit = st.cached)
+    """
+    __slots__ = ('hook', 'event', 't')
+
+    def __init__(self, hook, stage, color = None, input = None):
+        self.hook = hook
+        self.event = None
+        if hook is not None:
+            self.event = GrStageEvent(stage, color,
+                tuple(input.shape) if hasattr(input, 'shape') else None)
+
+    def __enter__(self):
+        if self.hook is not None:
+            self.hook(self.event)
+            self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.hook is not None:
+            self.event.duration = time.perf_counter() - self.t
+            self.event.kind = STAGE_END
+            self.hook(self.event)
+        return False
+
+    def done(self, out, count = None):
+        """Register stage output count. Returns out"""
+        if self.event is not None:
+            self.event.count = count
+        return out
+
+    def cached(self, out = None):
+        """Mark stage output as taken from the stage cache"""
+        if self.event is not None:
+            self.event.cached = True
+
+def hook_cached(hook, stage, color = None, input = None, count = None):
+    """Send events of a stage which output was taken from the stage cache
+    without the stage being wrapped into GrHookStage"""
+    with GrHookStage(hook, stage, color, input) as st:
+        st.cached()
+        st.done(None, count)
+
+class GrStageTimings(object):
+    """A hook collecting stage durations.
+    Durations are accumulated in timings dictionary where stage name
+    (with color suffix for stones detection stages) is a key.
+    Stages taken from the stage cache are counted in hits dictionary"""
+
+    def __init__(self):
+        self.timings = dict()
+        self.hits = dict()
+        self.__lock = threading.Lock()
+
+    def __call__(self, event):
+        if event.kind == STAGE_END:
+            key = event.stage + '_' + event.color if event.color else event.stage
+            with self.__lock:
+                self.timings[key] = self.timings.get(key, 0.0) + event.duration
+                if event.cached:
+                    self.hits[key] = self.hits.get(key, 0) + 1
+
+class GrContextHook(object):
+    """A hook calling a context manager factory for every stage.
+    The factory gets a stage event and has to return a context manager,
+    which is entered on stage start and exited on stage end.
+    The event is updated with duration and count before the exit.
+
+    Example:
+        @contextmanager
+        def my_stage(event):
+            yield
+            histogram[event.stage].observe(event.duration)
+
+        process_img(img, params, hook = GrContextHook(my_stage))
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.__active = dict()
+        self.__lock = threading.Lock()
+
+    def __call__(self, event):
+        if event.kind == STAGE_START:
+            cm = self.factory(event)
+            cm.__enter__()
+            with self.__lock:
+                self.__active[id(event)] = cm
+        else:
+            with self.__lock:
+                cm = self.__active.pop(id(event), None)
+            if cm is not None:
+                cm.__exit__(None, None, None)
@@ -30,6 +30,7 @@ GR_PARAMS = {
     "HL_RHO2":      {"v": 2, "min_v": 1, "max_v": 5, "no_copy": True},          # HoughLinesP threshold - cannot be changed
     "HC_MINDIST":   {"v": 1, "min_v": 1, "max_v": 5, "no_copy": True},          # HoughCircles min distance - not used
     "HC_MAXRADIUS": {"v": 20, "min_v": 1, "max_v": 40, "no_copy": True},        # HoughCircles max radius - not used
+    "WS_MAXRADIUS": {"v": 20, "min_v": 1, "max_v": 40, "no_copy": True},        # Watershed max radius
 
     # Board params group
     'BOARD_SIZE': {"v": 19, "min_v": 9, "max_v": 21, "g": GROUP_BOARD,
@@ -40,6 +41,16 @@ GR_PARAMS = {
         "title": "Threshold", "n": 3},                                          # HoughLinesP threshold
     'LUM_EQ': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
         "title": "Luminosity filter", "n": 4},                                  # CLAHE filter on/off
+    'STONES_ENGINE': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
+        "title": "Fast stones detection", "n": 5, "no_opt": True},              # Stones detection engine
+    'WORK_SPACING': {"v": 0, "min_v": 0, "max_v": 60, "g": GROUP_BOARD,
+        "title": "Working spacing", "n": 6, "no_opt": True},                    # Stones detection resolution
+    'BOARD_ENGINE': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
+        "title": "Fast board detection", "n": 7, "no_opt": True},               # Board detection engine
+    'HL_AUTO_THRESHOLD': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
+        "title": "Auto threshold", "n": 8, "no_opt": True},                     # HoughLines threshold search
+    'GRID_HOMOGRAPHY': {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BOARD,
+        "title": "Perspective grid", "n": 9, "no_opt": True},                   # Board grid homography fitting
 
     # Black stones detection
     "STONES_THRESHOLD_B": {"v": 84, "min_v": 1, "max_v": 255, "g": GROUP_BLACK,
@@ -58,8 +69,8 @@ GR_PARAMS = {
         "title": "Watershed threshold", "n": 7, "opt_maxv": 150},               # Watershed
     "WS_MORPH_B": {"v": 0, "min_v": 0, "max_v": 5, "g": GROUP_BLACK,
         "title": "Watershed morphing", "n": 8, "opt_maxv": 3},                  # WS morphing
-    "PYRAMID_B": {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_BLACK,
-        "title": "Pyramid filter", "n": 9, "no_opt" : True},                    # Image pyramid filter on/off
+    "PYRAMID_B": {"v": 0, "min_v": 0, "max_v": 2, "g": GROUP_BLACK,
+        "title": "Pyramid filter", "n": 9, "no_opt" : True},                    # Image pyramid filter (off/full/fast)
     "STONES_MAXVAL_B": {"v": 255, "min_v": 0, "max_v": 255,
         "no_copy": True, "no_opt": True},                                       # MaxVal - cannot be changed
 
@@ -80,8 +91,8 @@ GR_PARAMS = {
         "g": GROUP_WHITE, "title": "Watershed threshold", "n": 7},                      # Watershed
     "WS_MORPH_W": {"v": 0, "min_v": 0, "max_v": 5, "g": GROUP_WHITE,
         "title": "Watershed morphing", "n": 8, "opt_maxv": 3},                  # WS morphing
-    "PYRAMID_W": {"v": 0, "min_v": 0, "max_v": 1, "g": GROUP_WHITE,
-        "title": "Pyramid filter", "n": 9, "no_opt": True},                     # Image pyramid filter on/off
+    "PYRAMID_W": {"v": 0, "min_v": 0, "max_v": 2, "g": GROUP_WHITE,
+        "title": "Pyramid filter", "n": 9, "no_opt": True},                     # Image pyramid filter (off/full/fast)
     "STONES_MAXVAL_W": {"v": 255, "min_v": 0, "max_v": 255,
         "no_copy": True, "no_opt": True},                                       # MaxVal - cannot be changed
 
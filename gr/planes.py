@@ -0,0 +1,110 @@
+# Go board recognition project
+# Image planes cache
+# (c) kol, 2019-2023
+
+import cv2
+import threading
+
+from .grdef import *
+
+class GrImagePlanes(object):
+    """Cache of image conversions made while processing a single image.
+
+    Black and white stones detection passes (and watershed post-filter)
+    apply the same conversions (pyramid filtering, luminosity equalization,
+    channel extraction) to the same image. Every conversion is stored
+    under conversion name and identity of its source image, so it runs
+    once per image, whatever number of passes requests it.
+
+    Source images are referenced by the cache, so identities are not reused
+    while it is alive. Conversions are thread-safe, so the cache may be shared
+    by passes running concurrently. Returned images must not be changed.
+    """
+
+    def __init__(self, pool = None):
+        """Constructor
+
+        Parameters:
+            pool    Buffers pool (utils.GrBufferPool) to place conversion results to
+                    or None. Pooled results are valid until the next image is processed.
+        """
+        self.pool = pool
+        self.__planes = dict()
+        self.__locks = dict()
+        self.__slots = dict()
+        self.__lock = threading.Lock()
+
+    def __get(self, name, img, fn, shape, *args):
+        """Returns a conversion result, calling fn(img, dst, *args) if it was not made yet.
+        dst is a pooled buffer of given shape or None"""
+        key = (name, id(img)) + args
+        with self.__lock:
+            lock = self.__locks.get(key)
+            if lock is None:
+                # Pooled buffers are numbered by conversion source in order of requests,
+                # which is the same for every image
+                lock = self.__locks[key] = threading.Lock()
+                slot = (name,) + args
+                self.__slots[slot] = self.__slots.get(slot, -1) + 1
+                slot += (self.__slots[slot],)
+        with lock:
+            if not key in self.__planes:
+                dst = None if self.pool is None else self.pool.get(('PLANES',) + slot, shape, img.dtype)
+                self.__planes[key] = (img, fn(img, dst, *args))
+            return self.__planes[key][1]
+
+    def pmf(self, img):
+        """Pyramid mean shift filtering of an image"""
+        return self.__get('PMF', img,
+            lambda img, dst: cv2.pyrMeanShiftFiltering(img, PMF_SPATIAL_RADIUS, PMF_COLOR_RADIUS,
+                dst = dst), img.shape)
+
+    def pmf_fast(self, img, roi, scale):
+        """Pyramid mean shift filtering of an image area at reduced resolution.
+
+        Area roi = (x0, y0, x1, y1) is downscaled by given factor and filtered
+        with spatial window reduced by the same factor, so filtering covers the
+        same part of the board as at full resolution. The result is upscaled
+        back into a copy of the image, the rest of the image is left unfiltered.
+        """
+        def _pmf(img, dst, roi, scale):
+            x0, y0, x1, y1 = roi
+            area = cv2.resize(img[y0:y1, x0:x1], None, fx = scale, fy = scale,
+                              interpolation = cv2.INTER_AREA)
+            area = cv2.pyrMeanShiftFiltering(area, max(PMF_SPATIAL_RADIUS * scale, 1.0), PMF_COLOR_RADIUS)
+
+            if dst is None:
+                dst = img.copy()
+            else:
+                dst[:] = img
+            dst[y0:y1, x0:x1] = cv2.resize(area, (x1 - x0, y1 - y0), interpolation = cv2.INTER_LINEAR)
+            return dst
+
+        return self.__get('PMF_FAST', img, _pmf, img.shape, tuple(roi), scale)
+
+    def lab(self, img):
+        """An image converted to LAB color space"""
+        return self.__get('LAB', img,
+            lambda img, dst: cv2.cvtColor(img, cv2.COLOR_BGR2LAB, dst = dst), img.shape)
+
+    def equalized(self, img):
+        """An image with luminosity equalized by CLAHE in LAB color space"""
+        def _equalize(img, dst):
+            l, a, b = cv2.split(self.lab(img))
+            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+            merged = cv2.merge((clahe.apply(l), a, b))
+            return cv2.cvtColor(merged, cv2.COLOR_LAB2BGR, dst = dst)
+
+        return self.__get('LUM_EQ', img, _equalize, img.shape)
+
+    def channel(self, img, n):
+        """A single channel of an image"""
+        return self.__get('CHANNEL', img,
+            lambda img, dst, n: cv2.extractChannel(img, n, dst = dst), img.shape[:2], n)
+
+    def clear(self):
+        """Release all conversions"""
+        with self.__lock:
+            self.__planes.clear()
+            self.__locks.clear()
+            self.__slots.clear()
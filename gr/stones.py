@@ -87,11 +87,64 @@ class GrStone(object):
         self.added = f[4] if len(f) > 4 else False
 
 
+# Coordinate index
+class GrCoordIndex(object):
+    """Index of stones by image coordinates.
+
+    The image is split into a grid of square cells about a stone diameter
+    (which is close to board spacing) wide and every stone is registered in
+    the cells its bounding box overlaps, so a hit test checks a couple of
+    stones only, whatever the number of stones is.
+    """
+    __slots__ = ('cell', 'cells', 'boxes')
+
+    def __init__(self, v):
+        """Constructor
+
+        Parameters:
+            v   Array of stones in form of (X, Y, A, B, R)
+        """
+        v = np.asarray(v, dtype = np.int64).reshape(-1, GR_BW)
+        x, y, r = v[:, GR_X], v[:, GR_Y], v[:, GR_R]
+        self.cell = int(2 * r.max()) + 1 if len(v) > 0 else 1
+
+        # Stone bounding boxes (minimum coordinate is 1 as in GrStones.find_coord())
+        self.boxes = np.stack([np.maximum(1, x - r), np.maximum(1, y - r), x + r, y + r], axis = 1)
+        cb = np.maximum(self.boxes, 0) // self.cell
+
+        self.cells = dict()
+        for i, (cx0, cy0, cx1, cy1) in enumerate(cb.tolist()):
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+
+    def find(self, x, y):
+        """Returns index of first stone which bounding box contains (x, y) or None"""
+        for i in self.cells.get((int(x) // self.cell, int(y) // self.cell), []):
+            x0, y0, x1, y1 = self.boxes[i]
+            if x >= x0 and x <= x1 and y >= y0 and y <= y1:
+                return i
+        return None
+
+def nearby_positions(p, d = 1, straight = True):
+    """List of (A, B) positions within d positions from p = (A, B), excluding p itself.
+    If straight is True, only horizontal and vertical positions are listed"""
+    rg_a = range(max(p[0]-d, 1), p[0]+d+1)
+    rg_b = range(max(p[1]-d, 1), p[1]+d+1)
+    if straight:
+        r = [(a, p[1]) for a in rg_a] + [(p[0], b) for b in rg_b]
+    else:
+        r = [(a, b) for a in rg_a for b in rg_b]
+    return [x for x in r if x[0] != p[0] or x[1] != p[1]]
+
 # Stone collection
 class GrStones(object):
     """A collection of stones on board"""
     def __init__(self, stones = None, bw = None):
         self.__stones = dict()
+        self.__version = 0
+        self.__coord_index = None
+        self.__rank = None
         if stones is not None:
             if bw is None:
                 raise ValueError("Stone color not specified")
@@ -107,6 +160,11 @@ class GrStones(object):
         """Assign stones from another collection"""
         self.assign(value, True)
 
+    @property
+    def version(self):
+        """Modification counter, increased on every change of collection"""
+        return self.__version
+
     @property
     def black(self):
         """List of black stones"""
@@ -150,7 +208,7 @@ class GrStones(object):
         if len(self.__stones) == 0:
             return np.array([])
         else:
-            r = np.empty((len(self.__stones), GR_R+1), dtype = np.int)
+            r = np.empty((len(self.__stones), GR_R+1), dtype = int)
             for n, k in enumerate(self.__stones):
                 r[n] = self.__stones[k].v[0:-1]
             return r
@@ -174,6 +232,7 @@ class GrStones(object):
         """Add or replace stones in collection - internal"""
         if new_stones is None:
             return
+        self.__version += 1
 
         if type(new_stones) is GrStones:
             for k in new_stones:
@@ -242,10 +301,13 @@ class GrStones(object):
         else:
             p = str(stone)
 
-        if p in self.__stones: del self.__stones[p]
+        if p in self.__stones:
+            del self.__stones[p]
+            self.__version += 1
 
     def clear(self, with_forced = False):
         """Clear collection. If with_forced is False, forced stones remain"""
+        self.__version += 1
         if with_forced:
             self.__stones.clear()
         else:
@@ -254,6 +316,7 @@ class GrStones(object):
     def reset(self):
         """Reset stone parameters to initial values clearing forced flag
         If stone was added after detection, this stone is removed"""
+        self.__version += 1
         to_remove = []
         for k in self.__stones:
             s = self.__stones[k]
@@ -283,6 +346,7 @@ class GrStones(object):
         """Store forced stones in collection. See forced_tolist for list format"""
         if forced_list is None:
             return
+        self.__version += 1
 
         for f in forced_list:
             new_stone = GrStone()
@@ -316,10 +380,12 @@ class GrStones(object):
     def __setitem__(self, key, value):
         """Setter"""
         self.__stones[key].v = value
+        self.__version += 1
 
     def __delitem__(self, key):
         """Deleter"""
         del self.__stones[key]
+        self.__version += 1
 
     def __contains__(self, item):
         """in operation support"""
@@ -335,18 +401,21 @@ class GrStones(object):
     def __array__(self):
         return self.toarray()
 
+    def __update_index(self):
+        """Rebuild coordinate index and stones order after collection has been changed"""
+        if self.__coord_index is None or self.__coord_index[0] != self.__version:
+            keys = list(self.__stones)
+            v = [self.__stones[k].v[0:GR_BW] for k in keys]
+            self.__coord_index = (self.__version, GrCoordIndex(v), keys)
+            self.__rank = {k: i for i, k in enumerate(keys)}
+
     def find_coord(self, x, y):
         """Find a stone at given (X,Y) coordinates.
         If stone found returns tuple(stone properties (list of ints), stone color) otherwise - None"""
-        for k in self.__stones:
-            s = self.__stones[k].v
-            min_x = max(1, int(s[GR_X]) - int(s[GR_R]))
-            min_y = max(1, int(s[GR_Y]) - int(s[GR_R]))
-            max_x = s[GR_X] + s[GR_R]
-            max_y = s[GR_Y] + s[GR_R]
-            if (x >= min_x and x <= max_x and y >= min_y and y <= max_y):
-                return s
-        return None
+        self.__update_index()
+        _, index, keys = self.__coord_index
+        i = index.find(x, y)
+        return self.__stones[keys[i]].v if i is not None else None
 
     def find_position(self, a, b):
         """Find a stone at given (A,B) position.
@@ -375,21 +444,583 @@ class GrStones(object):
             # Assume it is a string
             p = stone_pos_from_str(str(p))
 
-        r = []
-        rg_a = range(max(p[0]-d,1), p[0]+d+1)
-        rg_b = range(max(p[1]-d,1), p[1]+d+1)
-        stones = self.tolist()
-
-        for s in stones:
-            if s[GR_A] == p[0] and s[GR_B] == p[1]:
-                # This very stone, ignore
-                continue
-            elif not straight and s[GR_A] in rg_a and s[GR_B] in rg_b:
-                # A stone at any direction
-                r.extend([s])
-            elif straight and ((s[GR_A] in rg_a and s[GR_B] == p[1]) or \
-                (s[GR_B] in rg_b and s[GR_A] == p[0])):
-                # A stone at horizontal/vertical directions
-                r.extend([s])
-        return r
+        # Positions around are looked up directly and found stones are
+        # returned in collection order
+        self.__update_index()
+        keys = [format_stone_pos([0, 0, a, b]) for a, b in nearby_positions(p, d, straight)]
+        keys = sorted([k for k in keys if k in self.__stones], key = lambda k: self.__rank[k])
+        return [self.__stones[k].tolist() for k in keys]
+
+
+# Integer position keys used by array-backed stones collection
+POS_KEY_BASE = 32                   # positions are keyed as A * POS_KEY_BASE + B
+MAX_POS_KEY = POS_KEY_BASE ** 2     # size of position index (key 0 is for invalid positions)
+
+# Array-backed stones collection record
+STONE_DTYPE = np.dtype([
+    ('v', np.int32, (GR_BW,)),      # current stone parameters (X, Y, A, B, R)
+    ('bw', 'U1'),                   # current color
+    ('def_v', np.int32, (GR_BW,)),  # parameters at detection
+    ('def_bw', 'U1'),               # color at detection
+    ('forced', np.bool_),           # forced flag
+    ('added', np.bool_)             # added flag
+])
+
+def pos_keys(v):
+    """Integer keys of stone positions for (N, 5) array of stones.
+    Key 0 stands for positions which cannot be formatted (see format_stone_pos)"""
+    a, b = v[:, GR_A], v[:, GR_B]
+    valid = (a > 0) & (a <= 30) & (b > 0) & (b <= 30)
+    return np.where(valid, a * POS_KEY_BASE + b, 0)
+
+def _str_key(pos):
+    """Integer key of a position string (A10, B2, etc)"""
+    try:
+        a, b = stone_pos_from_str(pos)
+    except ValueError:
+        return 0
+    return a * POS_KEY_BASE + b if 0 < a <= 30 and 0 < b <= 30 else 0
+
+def _key_str(key):
+    """Position string of an integer key"""
+    return format_stone_pos([0, 0, int(key) // POS_KEY_BASE, int(key) % POS_KEY_BASE])
+
+class GrStoneView(object):
+    """A stone stored in GrArrayStones collection.
+    Provides the same interface as GrStone, but holds only a reference
+    to the collection and stone position, while data remain in collection arrays"""
+    __slots__ = ('_owner', '_key')
+
+    def __init__(self, owner, key):
+        self._owner = owner
+        self._key = key
+
+    @property
+    def _rec(self):
+        return self._owner._record(self._key)
+
+    @property
+    def v(self):
+        rec = self._rec
+        return rec['v'].tolist() + [str(rec['bw'])]
+
+    @v.setter
+    def v(self, value):
+        self._owner._set_record(self._key, value)
+
+    @property
+    def def_v(self):
+        rec = self._rec
+        return rec['def_v'].tolist() + [str(rec['def_bw'])]
+
+    @property
+    def forced(self):
+        return bool(self._rec['forced'])
+
+    @forced.setter
+    def forced(self, value):
+        self._rec['forced'] = value
+
+    @property
+    def added(self):
+        return bool(self._rec['added'])
+
+    @added.setter
+    def added(self, value):
+        self._rec['added'] = value
+
+    @property
+    def pos(self):
+        """Stone position in text format (A10, B2, etc)"""
+        return _key_str(self._key)
+
+    def __str__(self):
+        return self.pos
+
+    def __iter__(self):
+        yield from self.v
+
+    def __getitem__(self, index):
+        return self.v[index]
+
+    def set(self, stone, bw = None):
+        """Assign stone params"""
+        if stone is not None:
+            self._owner._set_record(self._key, stone.v if isinstance(stone, (GrStone, GrStoneView)) else stone, bw)
+
+    def tolist(self):
+        return self.v
+
+    def to_fulllist(self):
+        rec = self._rec
+        return [rec['v'].tolist(), str(rec['bw']), rec['def_v'].tolist(), str(rec['def_bw']), bool(rec['added'])]
+
+# Array-backed stone collection
+class GrArrayStones(object):
+    """A collection of stones on board stored in a structured NumPy array.
+
+    It provides the same interface as GrStones, but stones are kept in
+    a single array of STONE_DTYPE records in order of addition and indexed
+    by integer position keys, so no per-stone objects are created
+    unless requested (see get_stone()). Position strings are used in
+    the interface only.
+    """
+    def __init__(self, stones = None, bw = None):
+        self.__data = np.zeros(16, dtype = STONE_DTYPE)
+        self.__n = 0
+        self.__index = np.full(MAX_POS_KEY, -1, dtype = np.int32)
+        self.__version = 0
+        self.__coord_index = None
+        if stones is not None:
+            if bw is None:
+                raise ValueError("Stone color not specified")
+            self.assign(stones, bw)
+
+    # Internal functions
+    @property
+    def _rows(self):
+        return self.__data[:self.__n]
+
+    def _record(self, key):
+        row = self.__index[key]
+        if row < 0:
+            raise KeyError(_key_str(key))
+        return self.__data[row]
+
+    def _set_record(self, key, stone, bw = None):
+        v, bw = self._stone_v(stone, bw)
+        rec = self._record(key)
+        rec['v'], rec['bw'] = v, bw
+        self.__version += 1
+
+    @staticmethod
+    def _stone_v(stone, bw):
+        """Split a stone list into integer parameters and color"""
+        if len(stone) <= GR_BW and bw is None:
+            raise Exception('Color has to be provided')
+        return [int(x) for x in stone[0:GR_BW]], stone[GR_BW] if len(stone) > GR_BW else bw
+
+    def _reindex(self, start = 0):
+        """Rebuild position index for rows starting from given one"""
+        if start == 0:
+            self.__index[:] = -1
+        rows = self._rows[start:]
+        self.__index[pos_keys(rows['v'])] = np.arange(start, self.__n, dtype = np.int32)
+
+    def _append(self, recs):
+        """Append records"""
+        n = self.__n + len(recs)
+        if n > len(self.__data):
+            data = np.zeros(max(n, len(self.__data) * 2), dtype = STONE_DTYPE)
+            data[:self.__n] = self._rows
+            self.__data = data
+        self.__data[self.__n:n] = recs
+        self.__index[pos_keys(recs['v'])] = np.arange(self.__n, n, dtype = np.int32)
+        self.__n = n
+
+    def _delete(self, keep):
+        """Keep only rows set in boolean mask"""
+        rows = self._rows[keep]
+        self.__n = len(rows)
+        self.__data[:self.__n] = rows
+        self._reindex()
+
+    def _put(self, v, bw, with_forced, mark_forced, mark_added, def_v = None, def_bw = None,
+             forced = False, added = False):
+        """Add or replace a single stone"""
+        row = self.__index[pos_keys(np.array([v]))[0]]
+        if row < 0:
+            rec = np.zeros(1, dtype = STONE_DTYPE)
+            rec['v'], rec['bw'] = v, bw
+            rec['def_v'] = v if def_v is None else def_v
+            rec['def_bw'] = bw if def_bw is None else def_bw
+            rec['forced'], rec['added'] = forced or mark_forced, added or mark_added
+            self._append(rec)
+        elif with_forced or not self.__data[row]['forced']:
+            self.__data[row]['v'], self.__data[row]['bw'] = v, bw
+            if mark_forced: self.__data[row]['forced'] = True
+
+    def _add_array(self, v, bw, with_forced, mark_forced, mark_added):
+        """Add or replace stones from (N, 5) array with unique positions"""
+        rows = self.__index[pos_keys(v)]
+        new = rows < 0
+
+        upd, v_upd = rows[~new], v[~new]
+        if not with_forced:
+            f = ~self.__data['forced'][upd]
+            upd, v_upd = upd[f], v_upd[f]
+        self.__data['v'][upd] = v_upd
+        self.__data['bw'][upd] = bw
+        if mark_forced: self.__data['forced'][upd] = True
+
+        recs = np.zeros(np.count_nonzero(new), dtype = STONE_DTYPE)
+        recs['v'] = recs['def_v'] = v[new]
+        recs['bw'] = recs['def_bw'] = bw
+        recs['forced'], recs['added'] = mark_forced, mark_added
+        self._append(recs)
+
+    # Properties
+    @property
+    def stones(self):
+        """Stones collection (dictionary with position as a key)"""
+        return {k: self.get_stone(k) for k in self}
+
+    @stones.setter
+    def stones(self, value):
+        """Assign stones from another collection"""
+        self.assign(value, True)
+
+    @property
+    def version(self):
+        """Modification counter, increased on every change of collection"""
+        return self.__version
+
+    @property
+    def black(self):
+        """List of black stones"""
+        return self.__color_list(STONE_BLACK)
+
+    @property
+    def white(self):
+        """List of white stones"""
+        return self.__color_list(STONE_WHITE)
+
+    def __color_list(self, bw):
+        rows = self._rows
+        return [v + [bw] for v in rows['v'][rows['bw'] == bw].tolist()]
+
+    def __keys_where(self, mask):
+        return [_key_str(k) for k in pos_keys(self._rows['v'][mask])]
+
+    def keys(self):
+        """List of stone positions on board"""
+        return [_key_str(k) for k in pos_keys(self._rows['v'])]
+
+    def forced_stones(self):
+        """Positions of stones with parameters forcefully changed or stone added"""
+        return self.__keys_where(self._rows['forced'])
+
+    def unforced_stones(self):
+        """Positions of stone which were not forced"""
+        return self.__keys_where(~self._rows['forced'])
+
+    def changed_stones(self):
+        """Positions of stone with parameters changed since detection"""
+        rows = self._rows
+        return self.__keys_where((rows['bw'] != rows['def_bw']) | np.any(rows['v'] != rows['def_v'], axis = 1))
+
+    def relocated_stones(self):
+        """List of stones which had changed color """
+        rows = self._rows
+        return self.__keys_where(rows['bw'] != rows['def_bw'])
+
+    def added_stones(self):
+        """Positions of stone added after detection"""
+        return self.__keys_where(self._rows['added'])
+
+    def toarray(self, bw = None):
+        """Represent stone collection as numpy array.
+        Only integer properties (GR_X:GR_R) are returned, color flags are ommitted.
+        If bw is provided, only stones of this color are returned"""
+        rows = self._rows
+        if bw is not None:
+            rows = rows[rows['bw'] == bw]
+        return rows['v'].copy() if len(rows) > 0 else np.array([])
+
+    def tolist(self):
+        """List of all stones in collection"""
+        rows = self._rows
+        return [v + [bw] for v, bw in zip(rows['v'].tolist(), rows['bw'].tolist())]
+
+    def todict(self):
+        """Represent all stones as a dictonary"""
+        return dict(zip(self.keys(), self.tolist()))
+
+    def add_ext(self, new_stones, bw = None, with_forced = True, mark_forced = False, mark_added = False):
+        """Add or replace stones in collection - internal"""
+        if new_stones is None:
+            return
+        self.__version += 1
+
+        if type(new_stones) is GrArrayStones or type(new_stones) is GrStones:
+            for k in new_stones:
+                s = new_stones.get_stone(k)
+                v, c = self._stone_v(s.v, None)
+                d, dc = self._stone_v(s.def_v, None)
+                self._put(v, c, with_forced, mark_forced, mark_added, d, dc, s.forced, s.added)
+
+        elif type(new_stones) is dict:
+            for k in new_stones:
+                v, c = self._stone_v(new_stones[k], bw)
+                self._put(v, c, with_forced, mark_forced, mark_added)
+
+        elif type(new_stones) is np.ndarray and new_stones.ndim == 2 and \
+            new_stones.shape[1] == GR_BW and bw is not None and \
+            np.issubdtype(new_stones.dtype, np.number):
+            # Detection results, processed at once unless positions repeat
+            v = new_stones.astype(np.int32)
+            keys = pos_keys(v)
+            if len(np.unique(keys)) == len(keys):
+                self._add_array(v, bw, with_forced, mark_forced, mark_added)
+            else:
+                for s in v:
+                    self._put(s.tolist(), bw, with_forced, mark_forced, mark_added)
+
+        elif type(new_stones) is list or type(new_stones) is np.ndarray:
+            for s in new_stones:
+                if type(s) is not list and type(s) is not tuple and type(s) is not np.ndarray:
+                    raise Exception("Invalid record type " + str(type(s)))
+                v, c = self._stone_v(s, bw)
+                self._put(v, c, with_forced, mark_forced, mark_added)
+        else:
+            raise Exception("Invalid stone list type " + str(type(new_stones)))
+
+    def add(self, new_stones, bw = None, with_forced = True):
+        """Add or replace stones in collection - internal"""
+        return self.add_ext(new_stones, bw, with_forced, mark_forced = True, mark_added = True)
+
+    def assign(self, new_stones, bw = None, with_forced = False):
+        """Store new stones in collection (see GrStones.assign())"""
+        self.clear(with_forced)
+        if not new_stones is None:
+            self.add_ext(new_stones, bw, with_forced = with_forced, mark_forced = False, mark_added = False)
+
+    def remove(self, stone):
+        """Remove a stone from collection"""
+        if isinstance(stone, (GrStone, GrStoneView)):
+            key = _str_key(stone.pos)
+        elif type(stone) is list or type(stone) is np.ndarray:
+            key = pos_keys(np.array([stone[0:GR_BW]]))[0]
+        else:
+            key = _str_key(str(stone))
+
+        if self.__index[key] >= 0:
+            keep = np.ones(self.__n, dtype = np.bool_)
+            keep[self.__index[key]] = False
+            self._delete(keep)
+            self.__version += 1
+
+    def clear(self, with_forced = False):
+        """Clear collection. If with_forced is False, forced stones remain"""
+        self.__version += 1
+        if with_forced:
+            self.__n = 0
+            self.__index[:] = -1
+        else:
+            self._delete(self._rows['forced'].copy())
+
+    def reset(self):
+        """Reset stone parameters to initial values clearing forced flag
+        If stone was added after detection, this stone is removed"""
+        self.__version += 1
+        self._delete(~self._rows['added'])
+        rows = self._rows
+        rows['v'], rows['bw'], rows['forced'] = rows['def_v'], rows['def_bw'], False
+        self._reindex()
+
+    def forced_tolist(self):
+        """Get a list of forced stones (all parameters), see GrStones.forced_tolist()"""
+        rows = self._rows[self._rows['forced']]
+        return [[v, bw, d, dbw, a] for v, bw, d, dbw, a in zip(rows['v'].tolist(), rows['bw'].tolist(),
+                rows['def_v'].tolist(), rows['def_bw'].tolist(), rows['added'].tolist())]
+
+    def forced_fromlist(self, forced_list):
+        """Store forced stones in collection. See forced_tolist for list format"""
+        if forced_list is None:
+            return
+        self.__version += 1
+
+        for f in forced_list:
+            if len(f) < 4:
+                raise ValueError("Invalid forced stone list format")
+            v = [int(x) for x in f[0]]
+            if self.__index[pos_keys(np.array([v]))[0]] < 0:
+                self._put(v, f[1], True, True, False, [int(x) for x in f[2]], f[3], True,
+                          f[4] if len(f) > 4 else False)
+
+    def get(self, key):
+        """Returns a stone data for given position of None if it doesn't exist"""
+        return self[key] if key in self else None
+
+    def get_stone(self, key = None, stone = None):
+        """Returns a stone object for given position of None if it doesn't exist"""
+        if key is None:
+            if stone is None:
+                raise ValueError("Eiher stone or position has to be provided")
+            key = format_stone_pos(stone)
+        k = _str_key(key)
+        return GrStoneView(self, k) if self.__index[k] >= 0 else None
 
+    def get_stone_list(self, keys):
+        """Returns a list of stones for given position keys"""
+        return [self[k] for k in keys if k in self]
+
+    def __iter__(self):
+        """Iterator"""
+        yield from self.keys()
+
+    def __getitem__(self, key):
+        """Getter"""
+        return GrStoneView(self, _str_key(key)).v
+
+    def __setitem__(self, key, value):
+        """Setter"""
+        self._set_record(_str_key(key), value)
+
+    def __delitem__(self, key):
+        """Deleter"""
+        if not key in self:
+            raise KeyError(key)
+        self.remove(key)
+
+    def __contains__(self, item):
+        """in operation support"""
+        return self.__index[_str_key(str(item))] >= 0
+
+    def __str__(self):
+        """Printing support"""
+        return str(self.todict())
+
+    def __len__(self):
+        return self.__n
+
+    def __array__(self):
+        return self.toarray()
+
+    def find_coord(self, x, y):
+        """Find a stone at given (X,Y) coordinates.
+        If stone found returns stone properties (list of ints and color) otherwise - None"""
+        if self.__coord_index is None or self.__coord_index[0] != self.__version:
+            self.__coord_index = (self.__version, GrCoordIndex(self._rows['v']))
+        row = self.__coord_index[1].find(x, y)
+        return self.__row_list(row) if row is not None else None
+
+    def __row_list(self, row):
+        rec = self.__data[row]
+        return rec['v'].tolist() + [str(rec['bw'])]
+
+    def find_position(self, a, b):
+        """Find a stone at given (A,B) position.
+        If stone found returns stone properties (list of ints and color) otherwise - None"""
+        row = self.__index[pos_keys(np.array([[0, 0, a, b, 0]]))[0]]
+        return self.__row_list(row) if row >= 0 else None
+
+    def find(self, key):
+        """Returns a stone at position specified by key.
+        If stone found returns stone properties (list of ints and color) otherwise - None"""
+        return self.get(key)
+
+    def find_nearby(self, p, d = 1, straight = True):
+        """Finds all stones near specified position (see GrStones.find_nearby())"""
+        if p is None:
+            return None
+        elif type(p) is not tuple and type(p) is not list and type(p) is not np.ndarray:
+            # Assume it is a string
+            p = stone_pos_from_str(str(p))
+
+        pos = np.array([[0, 0, a, b, 0] for a, b in nearby_positions(p, d, straight)]).reshape(-1, GR_BW)
+        rows = self.__index[pos_keys(pos)]
+        return [self.__row_list(row) for row in np.unique(rows[rows >= 0])]
+
+
+# Dense board state
+class GrBoardState(object):
+    """Board state as a dense array.
+
+    state is a (size, size) int8 array holding STATE_EMPTY, STATE_BLACK or
+    STATE_WHITE for every intersection. Arrays are indexed by [row, col] in
+    image orientation, where col = A - 1 and row = size - B.
+    x, y and r are int32 side arrays of the same shape holding stone
+    coordinates and radius (-1 for empty intersections).
+    """
+    __slots__ = ('size', 'state', 'x', 'y', 'r')
+
+    COLORS = {STONE_BLACK: STATE_BLACK, STONE_WHITE: STATE_WHITE}
+
+    def __init__(self, size = DEF_BOARD_SIZE):
+        self.size = size
+        self.state = np.zeros((size, size), dtype = np.int8)
+        self.x = np.full((size, size), -1, dtype = np.int32)
+        self.y = np.full((size, size), -1, dtype = np.int32)
+        self.r = np.full((size, size), -1, dtype = np.int32)
+
+    @classmethod
+    def from_arrays(cls, size, black_stones, white_stones):
+        """Make a state from black and white stones arrays in form of (X, Y, A, B, R).
+        White stones take priority if both are at the same position"""
+        st = cls(size)
+        st.set_stones(black_stones, STONE_BLACK)
+        st.set_stones(white_stones, STONE_WHITE)
+        return st
+
+    @classmethod
+    def from_stones(cls, size, stones):
+        """Make a state from GrStones or GrArrayStones collection or a list of [x, y, a, b, r, bw] stones"""
+        st = cls(size)
+        if isinstance(stones, GrArrayStones):
+            st.set_stones(stones.toarray(STONE_BLACK), STONE_BLACK)
+            st.set_stones(stones.toarray(STONE_WHITE), STONE_WHITE)
+            return st
+        if isinstance(stones, GrStones):
+            stones = stones.tolist()
+        for bw in (STONE_BLACK, STONE_WHITE):
+            st.set_stones([s[0:GR_BW] for s in stones if s[GR_BW] == bw], bw)
+        return st
+
+    def set_stones(self, stones, bw):
+        """Put stones from an array in form of (X, Y, A, B, R) on the board.
+        Stones outside the board are ignored"""
+        if stones is None or len(stones) == 0:
+            return
+        stones = np.asarray(stones, dtype = np.int32).reshape(-1, GR_BW)
+        a, b = stones[:, GR_A], stones[:, GR_B]
+        inside = (a > 0) & (a <= self.size) & (b > 0) & (b <= self.size)
+        stones = stones[inside]
+
+        rows, cols = self.size - stones[:, GR_B], stones[:, GR_A] - 1
+        self.state[rows, cols] = self.COLORS[bw]
+        self.x[rows, cols] = stones[:, GR_X]
+        self.y[rows, cols] = stones[:, GR_Y]
+        self.r[rows, cols] = stones[:, GR_R]
+
+    def stones(self, bw):
+        """Stones of given color as an array in form of (X, Y, A, B, R) ordered by A"""
+        cols, rows = np.nonzero(self.state.T == self.COLORS[bw])
+        return np.stack([self.x[rows, cols], self.y[rows, cols],
+                         cols + 1, self.size - rows, self.r[rows, cols]], axis = 1)
+
+    def get(self, a, b):
+        """Returns STONE_BLACK, STONE_WHITE or None for given (A, B) position"""
+        v = self.state[self.size - b, a - 1]
+        return STONE_BLACK if v == STATE_BLACK else STONE_WHITE if v == STATE_WHITE else None
+
+    def count(self, bw = None):
+        """Number of stones of given color or all stones"""
+        if bw is None:
+            return int(np.count_nonzero(self.state))
+        return int(np.count_nonzero(self.state == self.COLORS[bw]))
+
+    def diff(self, other):
+        """Positions where two states differ as an array of (A, B)"""
+        if self.size != other.size:
+            raise ValueError('Board sizes differ: {} and {}'.format(self.size, other.size))
+        rows, cols = np.nonzero(self.state != other.state)
+        return np.stack([cols + 1, self.size - rows], axis = 1)
+
+    def key(self):
+        """Hashable board position key (coordinates ignored)"""
+        return (self.size, self.state.tobytes())
+
+    def copy(self):
+        st = GrBoardState(self.size)
+        st.state[:], st.x[:], st.y[:], st.r[:] = self.state, self.x, self.y, self.r
+        return st
+
+    def __eq__(self, other):
+        return isinstance(other, GrBoardState) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __str__(self):
+        return '\n'.join(''.join('.XO'[v] for v in row) for row in self.state)
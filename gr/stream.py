@@ -0,0 +1,353 @@
+# Go board recognition project
+# Recognition of video or camera streams
+# (c) kol, 2019-2023
+
+import cv2
+import logging
+import numpy as np
+
+from .grdef import *
+from .gr import process_img, detect_board, eliminate_duplicates, find_area_stones, \
+    grid_from_edges, grid_to_image
+from .params import GrParams
+from .utils import board_spacing
+from .hooks import GrHookStage
+from .transform import warp_image
+
+DRIFT_WIDTH = 320           # width of downscaled frames used to check for board drift
+DEF_DRIFT_THRESHOLD = 0.3   # default board shift (in board spacings) triggering detection
+DEF_CHANGE_THRESHOLD = 12   # default mean absolute difference of a cell treated as a change
+MAX_CHANGED_PART = 0.5      # part of board area to be reprocessed above which the whole frame is processed
+
+def cell_boxes(edges, size, shape, grid = None):
+    """Pixel boxes of cells around board intersections.
+
+    Every cell is one board spacing wide, centered at an intersection.
+    If board grid is given, cells are placed with it (see gr.find_grid()),
+    so every box bounds a perspective-distorted cell.
+
+    Parameters:
+        edges       Board edges
+        size        Board size
+        shape       Image shape, boxes are clipped to it
+        grid        Board grid homography or None
+
+    Returns:
+        x0, y0, x1, y1 integer arrays of (size, size) shape indexed by [row, col].
+        Column corresponds to A position - 1, row corresponds to size - B position.
+    """
+    if grid is None:
+        grid = grid_from_edges(edges, size)
+
+    # Cell corners lie half a spacing away from intersections
+    n = np.arange(size + 1) - 0.5
+    cols, rows = np.meshgrid(n, n)
+    corners = grid_to_image(grid, np.stack([cols.ravel(), rows.ravel()], axis = 1))
+    xs = corners[:, 0].reshape(size + 1, size + 1)
+    ys = corners[:, 1].reshape(size + 1, size + 1)
+
+    def _bounds(v, limit):
+        quad = np.stack([v[:-1, :-1], v[:-1, 1:], v[1:, :-1], v[1:, 1:]])
+        return np.clip(np.round(quad.min(axis = 0)), 0, limit).astype(np.intp), \
+               np.clip(np.round(quad.max(axis = 0)), 0, limit).astype(np.intp)
+
+    h, w = shape[:2]
+    x0, x1 = _bounds(xs, w)
+    y0, y1 = _bounds(ys, h)
+    return x0, y0, x1, y1
+
+def changed_cells(gray, ref, boxes, threshold):
+    """Detect board intersections which have changed.
+
+    Mean absolute difference of gray images within the cell around every
+    intersection is calculated with an integral image, so the cost does not
+    depend on the cell size.
+
+    Parameters:
+        gray        Gray image
+        ref         Reference gray image of the same shape
+        boxes       Cell boxes (see cell_boxes())
+        threshold   Mean absolute difference of a cell treated as a change
+
+    Returns:
+        Boolean array of (size, size) shape where [row, col] are set for changed cells.
+        Column corresponds to A position - 1, row corresponds to size - B position.
+    """
+    x0, y0, x1, y1 = boxes
+    sums = cv2.integral(cv2.absdiff(gray, ref))
+    total = sums[y1, x1] - sums[y0, x1] - sums[y1, x0] + sums[y0, x0]
+    area = np.maximum((x1 - x0) * (y1 - y0), 1)
+    return total > threshold * area
+
+def _merge_stones(stones, new_stones, mask, size):
+    """Replace stones at positions set in mask by new stones at these positions"""
+    def _in_mask(st):
+        return mask[size - st[:, GR_B], st[:, GR_A] - 1]
+
+    parts = []
+    if stones is not None and len(stones) > 0:
+        parts.append(stones[~_in_mask(stones)])
+    if new_stones is not None and len(new_stones) > 0:
+        parts.append(new_stones[_in_mask(new_stones)])
+
+    parts = [p for p in parts if len(p) > 0]
+    return np.concatenate(parts) if len(parts) > 0 else None
+
+class GrStream(object):
+    """Board recognition on a stream of frames.
+
+    Board edges and size are detected on first frame only and then reused for
+    every frame, so only stones detection runs per frame. Each frame is
+    compared with the frame the board was detected on (phase correlation of
+    downscaled gray images); if the board has moved by more than given part of
+    board spacing, the board is detected again.
+
+    If BOARD_EDGES parameter is set, the board is never detected.
+
+    Between frames, most of intersections usually stay the same. Each frame
+    is compared cell by cell with the image stones were last detected on,
+    and only stones detection (without board detection) runs on areas around
+    changed cells, while stones on other intersections are taken from previous
+    results. Reference image is updated only for cells stones were taken on,
+    so slow changes of other cells add up until they are detected.
+    Debug images are kept from the last frame processed as a whole.
+
+    Usage:
+        stream = GrStream(0)    # first camera
+        for frame, res in stream:
+            if res is not None:
+                print(res[GR_STONES_B], res[GR_STONES_W])
+    """
+
+    def __init__(self, source, params = None, drift_threshold = DEF_DRIFT_THRESHOLD,
+                 change_threshold = DEF_CHANGE_THRESHOLD,
+                 f_parallel = False, debug = DEBUG_NONE, hook = None):
+        """Constructor
+
+        Parameters:
+            source          Frames source: cv2.VideoCapture object, camera index or
+                            video file name / URL, or any iterable of images
+            params          Recognition parameters (dictionary or GrParams)
+            drift_threshold Board shift (as a part of board spacing) which triggers board detection.
+                            If None, no drift check is performed.
+            change_threshold Mean absolute difference of gray levels within a cell around
+                            an intersection treated as a change (see changed_cells()).
+                            If None, every frame is processed as a whole.
+            f_parallel      If True, black and white stones are detected concurrently
+            debug           Debug images generation level (see gr.process_img())
+            hook            Stage events hook (see gr.process_img()). Besides recognition stages,
+                            DETECT_BOARD, DRIFT_CHECK and CHANGE_CHECK events are sent.
+        """
+        if isinstance(source, (int, str)):
+            source = cv2.VideoCapture(source)
+            if not source.isOpened():
+                raise Exception('Cannot open video source {}'.format(source))
+
+        self.source = source
+        self.params = GrParams()
+        if params is not None:
+            self.params.assign(params, copy_all = True)
+        self.drift_threshold = drift_threshold
+        self.change_threshold = change_threshold
+        self.f_parallel = f_parallel
+        self.debug = debug
+        self.hook = hook
+
+        self.frame_count = 0
+        self.detect_count = 0
+        self.reset()
+
+    def reset(self):
+        """Forget board geometry, so the board is detected on next frame"""
+        self._edges = None
+        self._size = None
+        self._spacing = None
+        self._ref = None
+        self._window = None
+        self._last_res = None
+        self._ref_gray = None
+        self._boxes = None
+
+    @property
+    def board_edges(self):
+        """Board edges currently used"""
+        return self._edges
+
+    @property
+    def board_size(self):
+        """Board size currently used"""
+        return self._size
+
+    def frames(self):
+        """Iterate over source frames"""
+        if isinstance(self.source, cv2.VideoCapture):
+            while True:
+                ok, frame = self.source.read()
+                if not ok: break
+                yield frame
+        else:
+            yield from self.source
+
+    def __iter__(self):
+        """Process all source frames, yielding (frame, results) tuples.
+        Results are None if the board cannot be found on a frame"""
+        for frame in self.frames():
+            yield frame, self.process_frame(frame)
+
+    def close(self):
+        """Release video source"""
+        if isinstance(self.source, cv2.VideoCapture):
+            self.source.release()
+
+    def _small_gray(self, img):
+        """Downscaled gray image for drift check"""
+        scale = DRIFT_WIDTH / img.shape[CV_WIDTH]
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx = scale, fy = scale, interpolation = cv2.INTER_AREA)
+        return np.float32(gray), min(scale, 1.0)
+
+    def _check_drift(self, img):
+        """Returns True if the board has moved since it was detected"""
+        with GrHookStage(self.hook, 'DRIFT_CHECK', None, img) as st:
+            gray, scale = self._small_gray(img)
+            if gray.shape != self._ref.shape:
+                return st.done(True)
+
+            (dx, dy), _ = cv2.phaseCorrelate(self._ref, gray, self._window)
+            shift = np.hypot(dx, dy) / scale
+            limit = self.drift_threshold * min(self._spacing)
+            if shift > limit:
+                logging.info('Board shift {:.1f} exceeds {:.1f}, detecting board'.format(shift, limit))
+                return st.done(True)
+            return st.done(False)
+
+    def _detect(self, img):
+        """Detect the board and store frame for drift check"""
+        with GrHookStage(self.hook, 'DETECT_BOARD', None, img) as st:
+            try:
+                edges, size = detect_board(img, self.params)
+            except Exception:
+                # Detection fails on frames without a board, which must not stop the stream
+                logging.exception('Board detection failed on frame {}'.format(self.frame_count))
+                edges, size = None, None
+            st.done(None, size)
+
+        self.detect_count += 1
+        if edges is None:
+            logging.error('Board not found on frame {}'.format(self.frame_count))
+            self.reset()
+            return False
+
+        self._edges = edges
+        self._size = size
+        self._last_res = None
+        self._spacing = board_spacing(edges, size)
+        self._ref, _ = self._small_gray(img)
+        self._window = cv2.createHanningWindow(self._ref.shape[::-1], cv2.CV_32F)
+        return True
+
+    def process_frame(self, frame):
+        """Recognize a single frame.
+
+        Parameters:
+            frame   An image
+
+        Returns:
+            Results dictionary (see gr.process_img()) or None
+        """
+        self.frame_count += 1
+
+        transform = self.params.get('TRANSFORM')
+        if transform is not None and len(transform) == 4:
+            frame = warp_image(frame, transform)
+
+        if self.params.get('BOARD_EDGES') is None:
+            if self._edges is None or (self.drift_threshold is not None and self._check_drift(frame)):
+                if not self._detect(frame):
+                    return None
+
+            # Board is already known, so only stones are to be detected
+            params = self.params.todict()
+            params['BOARD_EDGES'] = self._edges
+            params['BOARD_SIZE'] = self._size
+
+            # Edges are offset by area mask, so default mask has to be set explicitly
+            if not type(params.get('AREA_MASK')) is list:
+                d = MIN_EDGE_DIST
+                params['AREA_MASK'] = [[d, d], [frame.shape[CV_WIDTH]-d, frame.shape[CV_HEIGTH]-d]]
+        else:
+            params = self.params
+
+        if self._last_res is None or self.change_threshold is None:
+            return self._process_full(frame, params)
+        else:
+            return self._process_changed(frame, params)
+
+    def _process_full(self, frame, params, gray = None):
+        """Process a frame as a whole"""
+        res = process_img(frame, params, f_parallel = self.f_parallel,
+                          debug = self.debug, hook = self.hook)
+        if self.change_threshold is not None:
+            self._last_res = res
+            self._ref_gray = gray if gray is not None else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if res is not None:
+                self._boxes = cell_boxes(res[GR_EDGES], res[GR_BOARD_SIZE], frame.shape, res.get(GR_GRID))
+        return res
+
+    def _process_changed(self, frame, params):
+        """Process areas of a frame where intersections have changed"""
+        last = self._last_res
+        size = last[GR_BOARD_SIZE]
+        x0, y0, x1, y1 = self._boxes
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if gray.shape != self._ref_gray.shape:
+            return self._process_full(frame, params, gray)
+
+        with GrHookStage(self.hook, 'CHANGE_CHECK', None, gray) as st:
+            changed = changed_cells(gray, self._ref_gray, self._boxes, self.change_threshold)
+            n_changed = st.done(np.count_nonzero(changed), np.count_nonzero(changed))
+
+        if n_changed == 0:
+            return last
+        logging.info('{} changed cells'.format(n_changed))
+
+        # Every changed cell is processed with an area one cell wider to let stones
+        # on its border be found. Cells which areas touch are grouped, so every
+        # part of the image is processed once.
+        ring = cv2.dilate(changed.view(np.uint8), np.ones((3, 3), np.uint8))
+        n, labels, stats, _ = cv2.connectedComponentsWithStats(ring, connectivity = 8)
+        areas = []
+        for i in range(1, n):
+            col, row, n_cols, n_rows = stats[i][:4]
+            rows, cols = slice(row, row + n_rows), slice(col, col + n_cols)
+            areas.append([x0[rows, cols].min(), y0[rows, cols].min(),
+                          x1[rows, cols].max(), y1[rows, cols].max()])
+
+        # Many scattered changes are faster to process in a single pass
+        board = [x0.min(), y0.min(), x1.max(), y1.max()]
+        covered = sum((a[2] - a[0]) * (a[3] - a[1]) for a in areas)
+        if covered > MAX_CHANGED_PART * (board[2] - board[0]) * (board[3] - board[1]):
+            return self._process_full(frame, params, gray)
+
+        black_stones, white_stones = last[GR_STONES_B], last[GR_STONES_W]
+        for i, area in enumerate(areas):
+            black, white = find_area_stones(frame, params, last, area, self.f_parallel, self.hook)
+            mask = changed & (labels == i + 1)
+            black_stones = _merge_stones(black_stones, black, mask, size)
+            white_stones = _merge_stones(white_stones, white, mask, size)
+
+        # Reference is updated only where stones have been taken from the frame
+        for row, col in zip(*np.nonzero(changed)):
+            cell = (slice(y0[row, col], y1[row, col]), slice(x0[row, col], x1[row, col]))
+            self._ref_gray[cell] = gray[cell]
+
+        if not 'QUALITY_CHECK' in params:
+            black_stones, white_stones = eliminate_duplicates(black_stones, white_stones)
+
+        res = dict(last)
+        res[GR_STONES_B] = black_stones
+        res[GR_STONES_W] = white_stones
+        self._last_res = res
+        return res
@@ -0,0 +1,147 @@
+# Go board recognition project
+# Cached perspective transformation
+# (c) kol, 2019-2023
+
+import cv2
+import threading
+import numpy as np
+from collections import OrderedDict
+from imutils.perspective import order_points
+
+from .grdef import *
+
+DEF_TRANSFORM_CACHE_SIZE = 8    # default number of transformations kept in cache
+
+class GrTransform(object):
+    """Perspective transformation of an image to a 4-point rectangle.
+
+    Geometry is the same as imutils.perspective.four_point_transform() uses,
+    but source coordinates of every target pixel are precomputed as cv2.remap()
+    maps in fixed-point format, so repeated transformations only do the remapping.
+    """
+
+    def __init__(self, rect, shape):
+        """Constructor
+
+        Parameters:
+            rect    Transformation rectangle (4 points in any order)
+            shape   Shape of images to be transformed
+        """
+        self.rect = order_points(np.array(rect, dtype = np.float32))
+        self.shape = tuple(shape[:2])
+
+        tl, tr, br, bl = self.rect
+        width = max(int(np.linalg.norm(br - bl)), int(np.linalg.norm(tr - tl)))
+        height = max(int(np.linalg.norm(tr - br)), int(np.linalg.norm(tl - bl)))
+        self.size = (width, height)
+
+        dst = np.float32([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+        self.matrix = cv2.getPerspectiveTransform(self.rect, dst)
+        self.inv_matrix = cv2.getPerspectiveTransform(dst, self.rect)
+
+        # Source coordinates of target pixels
+        ys, xs = np.mgrid[0:height, 0:width]
+        pts = cv2.perspectiveTransform(np.float32(np.dstack([xs, ys])), self.inv_matrix)
+        self.map1, self.map2 = cv2.convertMaps(pts, None, cv2.CV_16SC2)
+
+    @property
+    def nbytes(self):
+        """Memory taken by remap tables"""
+        return self.map1.nbytes + self.map2.nbytes
+
+    def warp(self, img):
+        """Transforms an image"""
+        return cv2.remap(img, self.map1, self.map2, cv2.INTER_LINEAR,
+                         borderMode = cv2.BORDER_CONSTANT)
+
+    def to_source(self, stones):
+        """Maps stones found on transformed image back to source image.
+
+        Parameters:
+            stones  Stones array in form of (X, Y, A, B, R) or None
+
+        Returns:
+            Stones array with coordinates and radiuses in source image or None
+        """
+        if stones is None or len(stones) == 0:
+            return stones
+
+        stones = np.array(stones)
+        xy = np.float64(stones[:, GR_X:GR_Y+1])
+        src = cv2.perspectiveTransform(xy.reshape(-1, 1, 2), self.inv_matrix).reshape(-1, 2)
+
+        # Radius is scaled by local scale of the transformation (square root of Jacobian determinant)
+        m = self.inv_matrix
+        w = m[2, 0] * xy[:, 0] + m[2, 1] * xy[:, 1] + m[2, 2]
+        jx = (m[:2, 0] - src * m[2, 0]) / w[:, None]
+        jy = (m[:2, 1] - src * m[2, 1]) / w[:, None]
+        scale = np.sqrt(np.abs(jx[:, 0] * jy[:, 1] - jx[:, 1] * jy[:, 0]))
+
+        result = stones.copy()
+        result[:, GR_X:GR_Y+1] = np.rint(src)
+        result[:, GR_R] = np.rint(stones[:, GR_R] * scale)
+        return result
+
+class GrTransformCache(object):
+    """Cache of perspective transformations.
+
+    A fixed camera gives every frame the same transformation rectangle, so
+    transformations are stored under the rectangle and image shape and
+    reused by all images of that shape, whatever board or stream processes them.
+    Least recently used transformations are dropped when cache is full.
+    Cache is thread-safe.
+    """
+
+    def __init__(self, max_size = DEF_TRANSFORM_CACHE_SIZE):
+        """Constructor
+
+        Parameters:
+            max_size    Max number of transformations kept
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__transforms = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, rect, shape):
+        """Returns a transformation (GrTransform) for given rectangle and image shape"""
+        rect = order_points(np.array(rect, dtype = np.float32))
+        key = (tuple(rect.ravel().tolist()), tuple(shape[:2]))
+        with self.__lock:
+            t = self.__transforms.get(key)
+            if t is not None:
+                self.__transforms.move_to_end(key)
+                self.hits += 1
+                return t
+            self.misses += 1
+
+        t = GrTransform(rect, shape)
+        with self.__lock:
+            self.__transforms[key] = t
+            while len(self.__transforms) > self.max_size:
+                self.__transforms.popitem(last = False)
+        return t
+
+    def __len__(self):
+        return len(self.__transforms)
+
+    def clear(self):
+        """Drop all transformations"""
+        with self.__lock:
+            self.__transforms.clear()
+            self.hits = 0
+            self.misses = 0
+
+# Transformations shared by all boards and streams
+transform_cache = GrTransformCache()
+
+def warp_image(img, rect):
+    """Perspective transformation of an image to a 4-point rectangle
+    (a cached equivalent of imutils.perspective.four_point_transform())"""
+    return transform_cache.get(rect, img.shape).warp(img)
+
+def unwarp_stones(stones, rect, shape):
+    """Maps stones found on an image transformed with warp_image()
+    back to source image of given shape"""
+    return transform_cache.get(rect, shape).to_source(stones)
@@ -5,6 +5,8 @@
 import cv2
 import numpy as np
 import string as ss
+import threading
+from functools import lru_cache
 from PIL import Image, ImageTk
 from random import randint
 
@@ -379,6 +381,47 @@ def board_spacing(edges, size):
     space_y = (edges[1][1] - edges[0][1]) / float(size-1)
     return space_x, space_y
 
+# Morphology kernel
+@lru_cache(maxsize = 64)
+def morph_kernel(shape, size, base_size = None):
+    """Returns a structuring element of given shape (cv2.MORPH_xxx) and size.
+    If base_size is set, a kernel of that size is made and then resized to size.
+    Kernels are cached, so returned arrays are read-only"""
+    if base_size is None:
+        kernel = cv2.getStructuringElement(shape, (size, size))
+    else:
+        kernel = cv2.getStructuringElement(shape, (base_size, base_size))
+        kernel = cv2.resize(kernel, (size, size))
+    kernel.setflags(write = False)
+    return kernel
+
+# Image buffers pool
+class GrBufferPool(threading.local):
+    """Pool of reusable image buffers to pass as dst arguments of OpenCV functions.
+
+    A buffer is allocated on first request for a key and then returned for
+    every request with the same key while image shape and type stay the same.
+    Buffer contents are overwritten by next user of the key, so they must not
+    be retained. Pools are thread-local, so every thread has its own buffers.
+    """
+    def __init__(self):
+        self.buffers = dict()
+
+    def get(self, key, shape, dtype = np.uint8):
+        """Returns a buffer of given shape and type for a key"""
+        buf = self.buffers.get(key)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype = dtype)
+            self.buffers[key] = buf
+        return buf
+
+    def like(self, key, img):
+        """Returns a buffer of the same shape and type as given image"""
+        return self.get(key, img.shape, img.dtype)
+
+    def clear(self):
+        """Release all buffers"""
+        self.buffers.clear()
 
 # Origin: imutils.rotate_bound
 # author:    Adrian Rosebrock
@@ -0,0 +1,40 @@
+import sys
+sys.path.append('../')
+
+import json
+import shutil
+import logging
+from pathlib import Path
+
+from gr.grdef import *
+from gr.board import GrBoard
+from gr.batch import run_batch, RESULTS_FILE
+
+IMG_DIR = Path(__file__).resolve().parent.parent.joinpath('img')
+IMAGES = ['go_board_1.png', 'go_board_2.png']
+
+def test_run_batch(tmp_path):
+    src = tmp_path.joinpath('src')
+    src.mkdir()
+    for f in IMAGES:
+        shutil.copy(IMG_DIR.joinpath(f), src)
+        shutil.copy(IMG_DIR.joinpath(f).with_suffix('.gpar'), src)
+
+    out = tmp_path.joinpath('out')
+    summary = run_batch(src, out, workers = 2, log_level = logging.ERROR)
+    assert summary['images'] == 2 and summary['errors'] == 0 and summary['workers'] == 2
+
+    with open(str(out.joinpath(RESULTS_FILE))) as f:
+        results = [json.loads(line) for line in f]
+    assert [Path(r['file']).name for r in results] == IMAGES
+
+    # Results are the same as of a board processed in this process
+    for f, r in zip(IMAGES, results):
+        board = GrBoard(f_compact = True)
+        assert board.load_image(src.joinpath(f), f_with_params = True, f_process = False) == r['params']
+        board.process(f_cache = False, debug = DEBUG_NONE)
+        assert r['board_size'] == board.board_size
+        assert r['edges'] == [[int(x) for x in e] for e in board.board_edges]
+        assert r['black'] == [[int(x) for x in s[0:GR_BW]] for s in board.black_stones]
+        assert r['white'] == [[int(x) for x in s[0:GR_BW]] for s in board.white_stones]
+        assert Path(r['sgf']).is_file()
@@ -0,0 +1,42 @@
+import sys
+sys.path.append('../')
+
+import logging
+from pathlib import Path
+
+from gr.grdef import *
+from gr.bench import run_bench, save_report, load_report, compare_reports
+
+logging.disable(logging.CRITICAL)
+
+IMG_DIR = Path(__file__).resolve().parent.parent.joinpath('img')
+
+def test_run_bench(tmp_path):
+    files = [IMG_DIR.joinpath('go_board_16.png'), tmp_path.joinpath('missing.png')]
+    report = run_bench(files, repeat = 2)
+
+    assert report.keys() == {'info', 'summary', 'images'}
+    assert report['info']['repeat'] == 2 and report['info']['debug'] == DEBUG_NONE
+
+    r, missing = report['images']
+    assert r['file'] == str(files[0]) and 'error' not in r and 'error' in missing
+    assert r['board_size'] == 19 and r['black'] > 0 and r['white'] > 0
+    assert r['time'] > 0 and r['peak_mem'] > 0
+    assert {'AREA_MASK', 'BOARD_PARAMS', 'THRESH_B', 'HOUGH_C_W', 'DUPLICATES'} <= r['stages'].keys()
+
+    s = report['summary']
+    assert s['images'] == 2 and s['errors'] == 1
+    assert s['black'] == r['black'] and s['white'] == r['white'] and s['time'] == r['time']
+    assert s['stages']['AREA_MASK']['count'] == 1
+
+    # Saved report compares to itself with no regressions
+    save_report(report, tmp_path.joinpath('bench.json'))
+    loaded = load_report(tmp_path.joinpath('bench.json'))
+    diff = compare_reports(loaded, report)
+    assert {d['stage'] for d in diff} == set(r['stages']) | {'TOTAL'}
+    assert not any(d['regression'] for d in diff)
+
+    # Slower stages are reported
+    slow = load_report(tmp_path.joinpath('bench.json'))
+    slow['images'][0]['stages']['THRESH_B'] += 1.0
+    assert [d['stage'] for d in compare_reports(loaded, slow) if d['regression']] == ['THRESH_B']
@@ -0,0 +1,158 @@
+import sys
+sys.path.append('../')
+
+import cv2
+import numpy as np
+
+from gr.grdef import *
+from gr.gr import hough_axis_lines, profile_grid, grid_pitch, find_board, find_grid, grid_to_image, convert_xy, board_spacing, \
+    find_board_corners
+
+def _axis_lines(lines):
+    """Vertical and horizontal lines as find_board() selects them"""
+    p = round(np.pi/2 * 100, 0)
+    return sorted((float(l[0][0]), float(l[0][1])) for l in lines
+                  if l[0][1] == 0.0 or round(float(l[0][1])*100, 0) == p)
+
+def test_hough_axis_lines():
+    # Board-like grid with some noise
+    rng = np.random.default_rng(6)
+    img = np.zeros((300, 340), dtype = np.uint8)
+    for i in range(19):
+        cv2.line(img, (12 + i * 17, 10), (12 + i * 17, 290), 255, 1)
+        cv2.line(img, (12, 10 + i * 15), (318, 10 + i * 15), 255, 1)
+    cv2.line(img, (0, 0), (339, 299), 255, 1)
+    img[rng.random(img.shape) > 0.97] = 255
+
+    for rho, theta, threshold in [(1, 1, 100), (1, 6, 40), (2, 1, 150), (3, 7, 60), (1, 90, 30)]:
+        expected = cv2.HoughLines(img, rho, theta * np.pi / 180, threshold)
+        lines = hough_axis_lines(img.shape, rho, theta * np.pi / 180, threshold, np.nonzero(img))
+        assert _axis_lines(lines) == _axis_lines(expected)
+
+    assert hough_axis_lines(img.shape, 1, np.pi / 180, 1000, np.nonzero(img)) is None
+
+def _board_img(size, spacing, origin, shape, width = 1):
+    """Board grid with stones-like circles and noise"""
+    rng = np.random.default_rng(size)
+    img = np.full(shape + (3,), DEF_IMG_COLOR, dtype = np.uint8)
+    x0, y0 = origin
+    x1, y1 = x0 + (size - 1) * spacing, y0 + (size - 1) * spacing
+    for i in range(size):
+        cv2.line(img, (x0 + i * spacing, y0), (x0 + i * spacing, y1), COLOR_BLACK, width)
+        cv2.line(img, (x0, y0 + i * spacing), (x1, y0 + i * spacing), COLOR_BLACK, width)
+    for a, b in rng.integers(0, size, (size * 3, 2)):
+        cv2.circle(img, (x0 + a * spacing, y0 + b * spacing), spacing // 2 - 1,
+                   COLOR_WHITE if a % 2 else COLOR_BLACK, -1)
+    img[rng.random(shape) > 0.99] = COLOR_WHITE
+    return img
+
+def test_profile_grid():
+    for size, spacing, origin in [(19, 22, (15, 25)), (13, 31, (40, 20)), (9, 45, (20, 30))]:
+        img = _board_img(size, spacing, origin, (450, 470))
+        edges = cv2.Canny(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), 50, 100)
+        for n in [size, None]:
+            xs, ys = profile_grid(edges, n)
+            assert len(xs) == len(ys) == size
+            assert np.abs(xs - (origin[0] + np.arange(size) * spacing)).max() <= 1
+            assert np.abs(ys - (origin[1] + np.arange(size) * spacing)).max() <= 1
+
+        params = {'CANNY_MINVAL': 50, 'CANNY_MAXVAL': 100, 'CANNY_APERTURE': 3, 'HL_RHO': 1,
+                  'HL_THETA': 90, 'HL_THRESHOLD': 0, 'HL_MINLEN': 0, 'BOARD_SIZE': None,
+                  'BOARD_ENGINE': BOARD_ENGINE_PROFILE}
+        res = {}
+        edges, board_size = find_board(img, params, res, DEBUG_NONE)
+        assert board_size == size and res[GR_NUM_CROSS_H] == res[GR_NUM_CROSS_W] == size
+        assert np.abs(np.array(res[GR_SPACING]) - spacing).max() <= 0.2
+
+    assert profile_grid(np.zeros((100, 100), dtype = np.uint8), 19) == (None, None)
+
+def test_grid_pitch():
+    rng = np.random.default_rng(7)
+    for pitch, phase in [(23.0, 5.0), (17.4, 12.3), (41.25, 30.0)]:
+        profile = rng.integers(0, 40, 600)
+        lines = np.rint(phase + np.arange(13) * pitch).astype(int)
+        profile[lines] += 300
+        profile[lines[4:7]] -= 250      # lines covered by stones
+
+        p, ph = grid_pitch(profile)
+        assert abs(p - pitch) < 0.2
+        assert abs((ph - phase + pitch / 2) % pitch - pitch / 2) < 1.5
+
+    assert grid_pitch(np.zeros(500)) == (None, None)
+    assert grid_pitch(np.ones(80)) == (None, None)
+
+def test_find_board_pitch():
+    # Both edges of thick lines are detected as lines, so lines count doesn't
+    # match any board size and size is taken from grid pitch
+    img = _board_img(13, 33, (30, 25), (450, 470), width = 13)
+    params = {'CANNY_MINVAL': 50, 'CANNY_MAXVAL': 100, 'CANNY_APERTURE': 3, 'HL_RHO': 1,
+              'HL_THETA': 90, 'HL_THRESHOLD': 0, 'HL_MINLEN': 0, 'HL_RHO2': 1, 'HL_THETA2': 1,
+              'HL_THRESHOLD2': 120, 'BOARD_SIZE': None}
+    res = {}
+    edges, board_size = find_board(img, params, res, DEBUG_NONE)
+    assert res[GR_NUM_CROSS_W] > 15 and board_size == 13
+
+def test_hough_auto_threshold():
+    # Thresholds are found for any starting threshold, known or unknown board size
+    img = _board_img(13, 31, (40, 20), (450, 470))
+    params = {'CANNY_MINVAL': 50, 'CANNY_MAXVAL': 100, 'CANNY_APERTURE': 3, 'HL_RHO': 1,
+              'HL_THETA': 90, 'HL_THRESHOLD': 0, 'HL_MINLEN': 0, 'HL_RHO2': 1, 'HL_THETA2': 1,
+              'HL_AUTO_THRESHOLD': 1}
+    for size, thresh in [(13, 20), (13, 1000), (None, 20), (None, 1000)]:
+        res = {}
+        params.update({'BOARD_SIZE': size, 'HL_THRESHOLD2': thresh})
+        edges, board_size = find_board(img, params, res, DEBUG_NONE)
+        assert board_size == 13 and res[GR_NUM_CROSS_H] == res[GR_NUM_CROSS_W] == 13
+        assert np.abs(np.array(edges) - [[40, 20], [413, 393]]).max() <= 2
+
+def test_find_grid():
+    # Perspective-distorted board, initial edges are bounding box of the board
+    size, spacing, origin = 19, 22, (35, 30)
+    img = _board_img(size, spacing, origin, (470, 470))
+    src = np.float32([[0, 0], [470, 0], [470, 470], [0, 470]])
+    m = cv2.getPerspectiveTransform(src, np.float32([[40, 20], [430, 50], [460, 440], [10, 460]]))
+    img = cv2.warpPerspective(img, m, (470, 470), borderValue = DEF_IMG_COLOR)
+
+    rows, cols = np.mgrid[0:size, 0:size]
+    pos = np.stack([cols.ravel(), rows.ravel()], axis = 1)
+    truth = cv2.perspectiveTransform(np.float64(origin + pos * spacing).reshape(-1, 1, 2), m).reshape(-1, 2)
+
+    edges = [truth.min(axis = 0).tolist(), truth.max(axis = 0).tolist()]
+    res = {GR_EDGES: edges, GR_BOARD_SIZE: size, GR_SPACING: list(board_spacing(edges, size))}
+    params = {'CANNY_MINVAL': 50, 'CANNY_MAXVAL': 100, 'CANNY_APERTURE': 3, 'HL_RHO2': 1}
+    grid = find_grid(img, params, res, DEBUG_NONE)
+    assert grid is not None and res[GR_GRID] is grid
+    assert np.abs(grid_to_image(grid, pos) - truth).max() <= 3
+
+    # Stones at intersections get their positions
+    stones = convert_xy(np.column_stack([truth, np.full(len(truth), 10)]), res)
+    assert len(stones) == size * size
+    assert np.array_equal(stones[:, GR_A] - 1, np.sort(cols.ravel()))
+
+    # No lines
+    res = {GR_EDGES: edges, GR_BOARD_SIZE: size, GR_SPACING: list(board_spacing(edges, size))}
+    assert find_grid(np.full((470, 470, 3), DEF_IMG_COLOR, dtype = np.uint8), params, res, DEBUG_NONE) is None
+    assert not GR_GRID in res
+
+def test_find_board_corners():
+    # Board on a table photographed at an angle
+    board = _board_img(19, 22, (35, 30), (470, 470))
+    img = np.full((600, 640, 3), (60, 70, 50), dtype = np.uint8)
+    img[np.random.default_rng(8).random(img.shape[:2]) > 0.9] = (90, 90, 90)
+    img[60:530, 80:550] = board
+    src = np.float32([[80, 60], [550, 60], [550, 530], [80, 530]])
+    dst = np.float32([[120, 40], [590, 90], [560, 560], [50, 510]])
+    img = cv2.warpPerspective(img, cv2.getPerspectiveTransform(src, dst), (640, 600),
+                              borderValue = (60, 70, 50))
+
+    corners, confidence = find_board_corners(img, margin = 0)
+    assert confidence >= CORNERS_MIN_CONFIDENCE
+    assert np.abs(corners - dst).max() <= 3
+
+    # Margin moves corners outwards
+    corners2, _ = find_board_corners(img)
+    assert np.all(np.linalg.norm(corners2 - dst.mean(axis = 0), axis = 1) >
+                  np.linalg.norm(corners - dst.mean(axis = 0), axis = 1))
+
+    # No board
+    assert find_board_corners(np.full((300, 300, 3), DEF_IMG_COLOR, dtype = np.uint8)) == (None, 0.0)
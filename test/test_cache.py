@@ -0,0 +1,98 @@
+import sys
+sys.path.append('../')
+
+import numpy as np
+import logging
+from pathlib import Path
+
+from gr.grdef import *
+from gr.board import GrBoard
+from gr.cache import GrStageCache
+
+logging.disable(logging.CRITICAL)
+
+IMG_DIR = Path(__file__).resolve().parent.parent.joinpath('img')
+
+# Parameter values to change to, if adding 1 to a value does not fit
+NEW_VALUES = {'CANNY_APERTURE': 5, 'BOARD_SIZE': 13, 'HL_THETA': 45, 'AREA_MASK': [[5, 5], [430, 430]],
+              'BOARD_EDGES': [[12, 11], [488, 487]]}
+
+def _board(name, params):
+    board = GrBoard()
+    board.load_image(IMG_DIR.joinpath(name), f_process = False)
+    for k in params: board._params[k] = params[k]
+    return board
+
+def _results(board):
+    r = board.results
+    return None if r is None else \
+        [np.asarray(r[GR_STONES_B]).tolist(), np.asarray(r[GR_STONES_W]).tolist(),
+         np.asarray(r[GR_EDGES]).tolist(), r[GR_BOARD_SIZE], np.asarray(r[GR_SPACING]).tolist()]
+
+def _new_value(board, key):
+    if key in NEW_VALUES:
+        return NEW_VALUES[key]
+    p = board._params.params[key]
+    return p.v + 1 if p.max_v is None or p.v < p.max_v else p.v - 1
+
+def _check_keys(name, params, keys):
+    """Changing any of parameters stages depend on reruns some stages and
+    gives the same results as uncached run"""
+    board = _board(name, params)
+    board.process(debug = DEBUG_NONE)
+    for key in keys:
+        v = _new_value(board, key)
+        board._params[key] = v
+        misses = board._cache.misses
+        board.process(debug = DEBUG_NONE)
+        assert board._cache.misses > misses, key
+
+        params[key] = v
+        ref = _board(name, params)
+        ref.process(f_cache = False, debug = DEBUG_NONE)
+        assert _results(board) == _results(ref), key
+
+def test_cached_results():
+    for name in ['go_board_1.png', 'go_board_2.png', 'go_board_16.png', 'go_board_38.png']:
+        for params in [{}, {'STONES_ENGINE': STONES_ENGINE_SAMPLE}, {'WORK_SPACING': 20}]:
+            board = _board(name, params)
+            board.process(f_cache = False, debug = DEBUG_NONE)
+            expected = _results(board)
+
+            # Second run is taken from the cache entirely
+            for n in range(2):
+                board.process(debug = DEBUG_NONE)
+                assert _results(board) == expected
+            assert board._cache.hits >= board._cache.misses > 0
+
+            # Debug level is a part of the key
+            misses = board._cache.misses
+            board.process(debug = DEBUG_FULL)
+            assert _results(board) == expected and board._cache.misses > misses
+
+def test_board_keys():
+    _check_keys('go_board_2.png', {'BOARD_EDGES': None}, ['AREA_MASK', 'CANNY_MINVAL', 'CANNY_MAXVAL',
+        'CANNY_APERTURE', 'HL_RHO', 'HL_THETA', 'HL_THRESHOLD', 'HL_MINLEN', 'HL_RHO2', 'HL_THETA2',
+        'HL_THRESHOLD2', 'BOARD_SIZE', 'BOARD_ENGINE', 'HL_AUTO_THRESHOLD'])
+    _check_keys('go_board_16.png', {}, ['BOARD_EDGES', 'BOARD_SIZE'])
+
+def test_grid_keys():
+    _check_keys('go_board_16.png', {'GRID_HOMOGRAPHY': 1}, ['CANNY_MINVAL', 'CANNY_MAXVAL', 'CANNY_APERTURE',
+        'HL_RHO2', 'BOARD_SIZE'])
+
+def test_stones_keys():
+    _check_keys('go_board_16.png', {'STONES_ENGINE': STONES_ENGINE_SAMPLE},
+                ['WORK_SPACING'])
+    _check_keys('go_board_16.png', {'WORK_SPACING': 20}, ['WORK_SPACING', 'WS_MORPH_B', 'BLUR_MASK_W'])
+    _check_keys('go_board_16.png', {}, ['WATERSHED_B', 'WATERSHED_W', 'WS_MORPH_B', 'WS_MORPH_W', 'WS_MAXRADIUS',
+        'STONES_THRESHOLD_B', 'HC_MASK_W', 'HC_SENSITIVITY_B', 'HC_MAXRADIUS', 'HC_MINDIST',
+        'STONES_DILATE_B', 'STONES_ERODE_W', 'BLUR_MASK_B', 'LUM_EQ'])
+
+def test_cache_size():
+    cache = GrStageCache(max_size = 1)
+    res = {}
+    assert cache.run('A', res, lambda: np.zeros(10)).shape == (10,)
+    cache.run('B', res, lambda: np.zeros(10))
+    assert len(cache) == 1 and cache.misses == 2
+    out = cache.run('B', res, lambda: None)
+    assert out is not None and not out.flags.writeable and cache.hits == 1
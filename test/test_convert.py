@@ -0,0 +1,100 @@
+import sys
+sys.path.append('../')
+
+import numpy as np
+import logging
+
+from gr.grdef import *
+from gr.gr import convert_xy, eliminate_duplicates, offset_stones, make_work_area, work_results, unscale_stones, \
+    grid_from_edges
+
+logging.disable(logging.CRITICAL)
+
+RES = {GR_EDGES: [[14, 12], [470, 468]], GR_BOARD_SIZE: 19, GR_SPACING: [456 / 18.0, 456 / 18.0]}
+
+# Reference implementations (loop-based versions convert_xy and eliminate_duplicates replaced)
+def convert_xy_ref(coord, res):
+    edges = res[GR_EDGES]
+    size = res[GR_BOARD_SIZE]
+    space_x, space_y = res[GR_SPACING]
+
+    stones = []
+    for c in coord:
+        x = int(round(c[0],0))
+        y = int(round(c[1],0))
+        r = int(round(c[2], 0))
+        a = int(round((c[0] - edges[0][0]) / space_x, 0)) + 1
+        b = size - int(round((c[1] - edges[0][1]) / space_y, 0))
+        if not (a <= 0 or a > size or b <= 0 or b > size):
+            stones.extend([[x, y, a, b, r]])
+
+    if len(stones) == 0:
+        return None
+
+    s = np.array(sorted(stones, key = lambda x: [x[2], x[3]]))
+    u, c = np.unique(np.take(s, [2, 3], axis = 1), axis = 0, return_counts = True)
+    g = np.split(s, np.cumsum(c)[:-1])
+    return np.array([np.max(x, axis = 0) for x in g])
+
+def eliminate_duplicates_ref(bs, ws):
+    for st in ws:
+        for i in range(len(bs)):
+            if st[GR_A] == bs[i,GR_A] and st[GR_B] == bs[i, GR_B]:
+                bs = np.delete(bs, i, axis = 0)
+                break;
+    return bs, ws
+
+def random_circles(rng, n):
+    """HoughCircles-like output: float32 (X, Y, R), some of them outside the board"""
+    return np.float32(np.column_stack([rng.uniform(0, 490, n), rng.uniform(0, 490, n), rng.uniform(3, 20, n)]))
+
+def test_convert_xy():
+    rng = np.random.default_rng(1)
+    for n in [1, 5, 50, 500, 2000]:
+        coord = random_circles(rng, n)
+        assert np.array_equal(convert_xy(coord, RES), convert_xy_ref(coord, RES))
+
+    assert convert_xy(np.zeros((0, 3), dtype = np.float32), RES) is None
+    assert convert_xy([[0, 0, 10]], RES) is None
+    assert np.array_equal(convert_xy([[100, 100, 10]], RES), convert_xy_ref([[100, 100, 10]], RES))
+
+def test_eliminate_duplicates():
+    rng = np.random.default_rng(2)
+    for n in [1, 10, 300]:
+        bs = convert_xy(random_circles(rng, n), RES)
+        ws = convert_xy(random_circles(rng, n), RES)
+        b1, w1 = eliminate_duplicates(bs, ws)
+        b2, w2 = eliminate_duplicates_ref(bs, ws)
+        assert np.array_equal(b1, b2) and w1 is ws
+
+def test_offset_stones():
+    stones = np.array([[10, 20, 1, 1, 5], [30, 40, 2, 2, 5]])
+    assert offset_stones(stones, [3, 4]).tolist() == [[13, 24, 1, 1, 5], [33, 44, 2, 2, 5]]
+    assert offset_stones(None, [3, 4]) is None
+
+def test_work_area():
+    img = np.zeros((500, 600, 3), dtype = np.uint8)
+    img2, origin, scale = make_work_area(img, {'WORK_SPACING': 19}, RES)
+    assert origin == [0, 0] and scale == 0.75 and img2.shape[1] == 372
+
+    work_res = work_results(RES, origin, scale)
+    assert work_res[GR_EDGES] == [[10.5, 9], [352.5, 351]] and work_res[GR_SPACING] == [19, 19]
+
+    # Stones found at working resolution are at the same positions in source image
+    coord = random_circles(np.random.default_rng(3), 100)
+    stones = convert_xy(coord, RES)
+    work_stones = convert_xy(coord * np.float32(scale), work_res)
+    assert np.array_equal(work_stones[:, GR_A:GR_B+1], stones[:, GR_A:GR_B+1])
+    assert np.abs(unscale_stones(work_stones, origin, scale) - stones).max() <= 2
+
+def test_convert_xy_grid():
+    # Grid made from board edges gives the same positions, also at working resolution
+    coord = random_circles(np.random.default_rng(4), 500)
+    res = dict(RES)
+    res[GR_GRID] = grid_from_edges(RES[GR_EDGES], RES[GR_BOARD_SIZE])
+    assert np.array_equal(convert_xy(coord, res), convert_xy(coord, RES))
+
+    work_res = work_results(res, [5, 7], 0.75)
+    work_coord = (coord - np.float32([5, 7, 0])) * np.float32(0.75)
+    assert np.array_equal(convert_xy(work_coord, work_res)[:, GR_A:GR_B+1],
+                          convert_xy(work_coord, work_results(RES, [5, 7], 0.75))[:, GR_A:GR_B+1])
@@ -0,0 +1,83 @@
+import sys
+sys.path.append('../')
+
+import logging
+from pathlib import Path
+from contextlib import contextmanager
+
+from gr.grdef import *
+from gr.board import GrBoard
+from gr.hooks import GrHookStage, GrStageTimings, GrContextHook, STAGE_START, STAGE_END
+
+logging.disable(logging.CRITICAL)
+
+IMG_DIR = Path(__file__).resolve().parent.parent.joinpath('img')
+
+class Recorder(object):
+    """A hook recording stage events"""
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append((event.kind, event.stage, event.color, event.cached))
+
+    def stages(self, kind = STAGE_END):
+        return [(e[1], e[2]) for e in self.events if e[0] == kind]
+
+def test_hook_stage():
+    rec = Recorder()
+    with GrHookStage(rec, 'THRESH', 'B') as st:
+        assert st.done(5, 1) == 5
+    assert rec.events == [(STAGE_START, 'THRESH', 'B', False), (STAGE_END, 'THRESH', 'B', False)]
+
+    with GrHookStage(None, 'THRESH', 'B') as st:
+        assert st.done(5, 1) == 5
+        st.cached()
+
+def test_process_stages():
+    board = GrBoard()
+    board.load_image(IMG_DIR.joinpath('go_board_16.png'), f_process = False)
+
+    # Cold run: every stage is run
+    rec, timings = Recorder(), GrStageTimings()
+    board.process(debug = DEBUG_NONE, hook = lambda e: (rec(e), timings(e)))
+    cold = rec.stages()
+    filters = ['PMF', 'LUM_EQ', 'CHANNEL', 'THRESH', 'STONES_DILATE', 'STONES_ERODE', 'BLUR_MASK',
+               'HOUGH_C', 'CONVERT_XY', 'WATERSHED', 'CONVERT_XY']
+    assert cold == [('AREA_MASK', None), ('BOARD_PARAMS', None)] + \
+                   [(f, 'B') for f in filters] + [(f, 'W') for f in filters] + [('DUPLICATES', None)]
+    assert rec.stages(STAGE_START) == cold
+    assert not any(e[3] for e in rec.events) and len(timings.hits) == 0
+    assert set(timings.timings) == {s + '_' + c if c else s for s, c in cold}
+
+    # Cached run: all stages but duplicates elimination are taken from cache,
+    # post-filters send a single event
+    rec, timings = Recorder(), GrStageTimings()
+    board.process(debug = DEBUG_NONE, hook = lambda e: (rec(e), timings(e)))
+    assert rec.stages() == [s for s in cold if s[0] != 'CONVERT_XY']
+    assert [e[1] for e in rec.events if e[0] == STAGE_END and not e[3]] == ['DUPLICATES']
+    assert timings.hits['HOUGH_C_W'] == 1 and timings.hits['AREA_MASK'] == 1 and not 'DUPLICATES' in timings.hits
+
+    # A parameter change reruns stones detection of one color only
+    board._params['STONES_THRESHOLD_W'] = board._params['STONES_THRESHOLD_W'] + 1
+    rec = Recorder()
+    board.process(debug = DEBUG_NONE, hook = rec)
+    run = [(e[1], e[2]) for e in rec.events if e[0] == STAGE_END and not e[3]]
+    assert run == [(f, 'W') for f in filters[3:]] + [('DUPLICATES', None)]
+
+def test_context_hook():
+    log = []
+
+    @contextmanager
+    def _stage(event):
+        log.append(('enter', event.stage, event.duration))
+        yield
+        log.append(('exit', event.stage, event.count, event.duration is not None))
+
+    hook = GrContextHook(_stage)
+    with GrHookStage(hook, 'FIND_BOARD') as st:
+        with GrHookStage(hook, 'AREA_MASK'):
+            pass
+        st.done(None, 19)
+    assert log == [('enter', 'FIND_BOARD', None), ('enter', 'AREA_MASK', None),
+                   ('exit', 'AREA_MASK', None, True), ('exit', 'FIND_BOARD', 19, True)]
@@ -0,0 +1,122 @@
+import sys
+sys.path.append('../')
+
+import cv2
+import numpy as np
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from gr.grdef import *
+from gr.board import GrBoard
+from gr.gr import stones_pool
+
+logging.disable(logging.CRITICAL)
+
+IMG_DIR = Path(__file__).resolve().parent.parent.joinpath('img')
+IMAGES = ['go_board_1.png', 'go_board_16.png', 'go_board_38.png']
+
+def _board(name):
+    board = GrBoard()
+    board.load_image(IMG_DIR.joinpath(name), f_process = False)
+    return board
+
+def _stones(res):
+    return [np.asarray(res[GR_STONES_B]).tolist(), np.asarray(res[GR_STONES_W]).tolist()]
+
+def _process(name, **kwargs):
+    board = _board(name)
+    board.process(f_cache = False, **kwargs)
+    return board.results
+
+def test_parallel():
+    for name in IMAGES:
+        res = _process(name, debug = DEBUG_NONE)
+        res_p = _process(name, f_parallel = True, debug = DEBUG_NONE)
+        assert _stones(res_p) == _stones(res) and res_p[GR_EDGES] == res[GR_EDGES]
+
+    # Boards processed concurrently share one pool
+    with ThreadPoolExecutor(max_workers = 3) as executor:
+        pools = list(executor.map(lambda _: stones_pool(), range(6)))
+        results = list(executor.map(lambda name: _process(name, f_parallel = True, debug = DEBUG_NONE),
+                                    IMAGES * 2))
+    assert all(p is pools[0] for p in pools)
+    for name, res in zip(IMAGES * 2, results):
+        assert _stones(res) == _stones(_process(name, debug = DEBUG_NONE))
+
+def test_debug_levels():
+    for name, params in [('go_board_16.png', {}), ('go_board_2.png', {'HL_THRESHOLD': 50, 'HL_MINLEN': 10}),
+                         ('go_board_16.png', {'STONES_ENGINE': STONES_ENGINE_SAMPLE, 'GRID_HOMOGRAPHY': 1})]:
+        images = dict()
+        for debug in [DEBUG_NONE, DEBUG_LAZY, DEBUG_FULL]:
+            board = _board(name)
+            for k in params: board._params[k] = params[k]
+            board.process(f_cache = False, debug = debug)
+            images[debug] = {k: v for k, v in board.results.items() if k.find('IMG_') >= 0}
+            assert board.debug_images.keys() == images[debug].keys()
+            images[debug] = board.debug_images
+
+        assert len(images[DEBUG_NONE]) == 0
+        assert images[DEBUG_LAZY].keys() == images[DEBUG_FULL].keys() and len(images[DEBUG_FULL]) > 0
+        for k in images[DEBUG_FULL]:
+            assert isinstance(images[DEBUG_FULL][k], np.ndarray) and isinstance(images[DEBUG_LAZY][k], np.ndarray)
+            assert np.array_equal(images[DEBUG_FULL][k], images[DEBUG_LAZY][k]), k
+
+    # Lazy images are rendered on demand, while images made by processing are stored as is
+    board = _board('go_board_16.png')
+    board.process(f_cache = False, debug = DEBUG_LAZY)
+    assert callable(board.results[GR_IMG_LINES2]) and callable(board.results['IMG_WATERSHED_B'])
+    assert isinstance(board.results['IMG_THRESH_B'], np.ndarray)
+
+def test_sample_stones():
+    for name in ['go_board_16.png', 'go_board_27.png', 'go_board_41.png', 'go_board_46.png']:
+        ref = _process(name, debug = DEBUG_NONE)
+        board = _board(name)
+        board._params['STONES_ENGINE'] = STONES_ENGINE_SAMPLE
+        board.process(f_cache = False, debug = DEBUG_NONE)
+        res = board.results
+
+        # Sampling finds the same stones as filters
+        for k in (GR_STONES_B, GR_STONES_W):
+            pos = {(s[GR_A], s[GR_B]): s[GR_R] for s in ref[k]}
+            sample_pos = {(s[GR_A], s[GR_B]): s[GR_R] for s in res[k]}
+            assert len(pos.keys() ^ sample_pos.keys()) <= max(0.03 * len(pos), 1), (name, k)
+
+            # Radiuses are measured close to radiuses of circles found
+            common = pos.keys() & sample_pos.keys()
+            r, sample_r = [np.mean([d[p] for p in common]) for d in (pos, sample_pos)]
+            assert abs(sample_r - r) <= 0.15 * r, (name, k)
+
+def test_pmf_fast():
+    name = 'go_board_8.png'
+    ref = _process(name, debug = DEBUG_NONE)
+
+    board = _board(name)
+    board._params['PYRAMID_B'] = board._params['PYRAMID_W'] = PMF_FAST
+    board.process(f_cache = False, debug = DEBUG_LAZY)
+    res = board.results
+
+    # Both colors share one filtered image
+    assert res['IMG_PMF_B'] is res['IMG_PMF_W'] and not 'IMG_PMF_B' in ref
+
+    for k in (GR_STONES_B, GR_STONES_W):
+        assert abs(len(res[k]) - len(ref[k])) <= 0.05 * len(ref[k]), k
+
+def test_work_spacing():
+    board = _board('go_board_16.png')
+    board._params['WORK_SPACING'] = 20
+    board.process(f_cache = False, debug = DEBUG_NONE)
+    res = board.results
+
+    # Same parameters give nearly the same stones on an image of twice the resolution
+    big = _board('go_board_16.png')
+    big.image = cv2.resize(big.image, None, fx = 2, fy = 2, interpolation = cv2.INTER_LINEAR)
+    big._params['WORK_SPACING'] = 20
+    big._params['BOARD_EDGES'] = (np.array(big._params['BOARD_EDGES']) * 2).tolist()
+    big.process(f_cache = False, debug = DEBUG_NONE)
+    res_big = big.results
+
+    for k in (GR_STONES_B, GR_STONES_W):
+        pos = {(s[GR_A], s[GR_B]) for s in res[k]}
+        pos_big = {(s[GR_A], s[GR_B]) for s in res_big[k]}
+        assert len(pos ^ pos_big) <= max(0.05 * len(pos), 1), k
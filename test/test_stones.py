@@ -0,0 +1,98 @@
+import sys
+sys.path.append('../')
+
+import numpy as np
+
+from gr.grdef import *
+from gr.stones import GrStones, GrArrayStones, GrBoardState
+from gr.utils import format_stone_pos
+
+BLACK = np.array([[40, 440, 1, 1, 10], [60, 440, 2, 1, 10], [440, 40, 19, 19, 11]])
+WHITE = np.array([[60, 420, 2, 2, 9], [60, 440, 2, 1, 9]])
+
+def test_board_state():
+    st = GrBoardState.from_arrays(19, BLACK, WHITE)
+    assert st.count() == 4
+    assert st.count(STONE_BLACK) == 2 and st.count(STONE_WHITE) == 2
+    assert st.get(1, 1) == STONE_BLACK and st.get(2, 1) == STONE_WHITE and st.get(3, 3) is None
+    assert st.state[0, 18] == STATE_BLACK and st.r[0, 18] == 11
+    assert st.stones(STONE_BLACK).tolist() == [[40, 440, 1, 1, 10], [440, 40, 19, 19, 11]]
+
+    stones = GrStones(BLACK, STONE_BLACK)
+    stones.add_ext(WHITE, STONE_WHITE)
+    assert GrBoardState.from_stones(19, stones) == st
+
+    st2 = st.copy()
+    st2.set_stones([[100, 100, 5, 5, 10]], STONE_WHITE)
+    assert st2 != st and hash(st.copy()) == hash(st)
+    assert st2.diff(st).tolist() == [[5, 5]]
+
+def _fill(stones):
+    stones.add_ext(BLACK, STONE_BLACK)
+    stones.add_ext(WHITE, STONE_WHITE)
+    stones.add([[100, 100, 5, 5, 10]], STONE_WHITE)
+    stones.forced_fromlist([[[120, 120, 6, 6, 10], 'W', [118, 119, 6, 6, 10], 'B', False]])
+    stones['A1'] = [41, 441, 1, 1, 12, 'B']
+    return stones
+
+def test_array_stones():
+    s1, s2 = _fill(GrStones()), _fill(GrArrayStones())
+
+    assert list(s1) == list(s2) and len(s1) == len(s2)
+    assert s1.tolist() == s2.tolist() and s1.todict() == s2.todict()
+    assert s1.black == s2.black and s1.white == s2.white
+    assert np.array_equal(s1.toarray(), s2.toarray())
+    assert s1.forced_tolist() == s2.forced_tolist()
+    assert s1.forced_stones() == s2.forced_stones() and s1.added_stones() == s2.added_stones()
+    assert s1.find_coord(62, 418) == s2.find_coord(62, 418)
+    assert s1.find_position(2, 1) == s2.find_position(2, 1) == [60, 440, 2, 1, 9, STONE_WHITE]
+    assert s1.find_nearby('B2', straight = False) == s2.find_nearby('B2', straight = False)
+    assert s1.find_nearby((2, 2)) == s2.find_nearby((2, 2))
+    assert s2.get_stone('E5').forced and s2.get_stone('E5').added
+    assert s2.relocated_stones() == ['B1', 'F6'] and s2.get_stone('F6').def_v == [118, 119, 6, 6, 10, 'B']
+
+    s1.add_ext(BLACK, STONE_BLACK, with_forced = False)
+    s2.add_ext(BLACK, STONE_BLACK, with_forced = False)
+    assert s1.tolist() == s2.tolist()
+
+    for s in (s1, s2):
+        s.remove('B2')
+        del s['S19']
+        s.clear()
+    assert s1.tolist() == s2.tolist()
+
+    s1.reset()
+    s2.reset()
+    assert s1.tolist() == s2.tolist() == [[118, 119, 6, 6, 10, STONE_BLACK]]
+    assert GrBoardState.from_stones(19, s1) == GrBoardState.from_stones(19, s2)
+
+def test_find_index():
+    rng = np.random.default_rng(3)
+    pos = rng.permutation([(a, b) for a in range(1, 20) for b in range(1, 20)])[:150]
+    v = np.column_stack([pos[:, 0] * 25 + rng.integers(-5, 5, len(pos)),
+                         (20 - pos[:, 1]) * 25 + rng.integers(-5, 5, len(pos)),
+                         pos, rng.integers(5, 14, len(pos))])
+    s1, s2 = GrStones(v[:75], STONE_BLACK), GrArrayStones(v[:75], STONE_BLACK)
+    s1.add_ext(v[75:], STONE_WHITE)
+    s2.add_ext(v[75:], STONE_WHITE)
+    stones = s1.tolist()
+
+    def _coord_ref(x, y):
+        for s in stones:
+            if x >= max(1, s[GR_X] - s[GR_R]) and x <= s[GR_X] + s[GR_R] and \
+               y >= max(1, s[GR_Y] - s[GR_R]) and y <= s[GR_Y] + s[GR_R]:
+                return s
+        return None
+
+    for x, y in rng.integers(0, 520, (500, 2)):
+        assert s1.find_coord(x, y) == s2.find_coord(x, y) == _coord_ref(x, y)
+
+    for a, b in [(1, 1), (10, 10), (19, 5), (3, 18)]:
+        for d, straight in [(1, True), (2, False), (3, True)]:
+            ref = [s for s in stones if (s[GR_A], s[GR_B]) != (a, b) and
+                   abs(s[GR_A] - a) <= d and abs(s[GR_B] - b) <= d and
+                   (not straight or s[GR_A] == a or s[GR_B] == b)]
+            assert s1.find_nearby((a, b), d, straight) == s2.find_nearby((a, b), d, straight) == ref
+
+    s1.remove(format_stone_pos(stones[0]))
+    assert s1.find_coord(stones[0][GR_X], stones[0][GR_Y]) != stones[0]
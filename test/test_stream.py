@@ -0,0 +1,140 @@
+import sys
+sys.path.append('../')
+
+import cv2
+import json
+import numpy as np
+import logging
+from pathlib import Path
+
+from gr.grdef import *
+from gr.gr import process_img
+from gr.params import GrParams
+from gr.stream import GrStream, cell_boxes
+
+logging.disable(logging.CRITICAL)
+
+IMG_DIR = Path(__file__).resolve().parent.parent.joinpath('img')
+
+def _frame(name = 'go_board_2.png'):
+    return cv2.imread(str(IMG_DIR.joinpath(name)))
+
+def _shift(img, dx, dy):
+    m = np.float32([[1, 0, dx], [0, 1, dy]])
+    return cv2.warpAffine(img, m, (img.shape[CV_WIDTH], img.shape[CV_HEIGTH]),
+                          borderMode = cv2.BORDER_REPLICATE)
+
+def _stones(res):
+    return [np.asarray(res[GR_STONES_B]).tolist(), np.asarray(res[GR_STONES_W]).tolist()]
+
+def test_same_frame():
+    img = _frame()
+    stream = GrStream([img, img.copy()])
+    results = [res for _, res in stream]
+
+    # Board is detected on first frame only
+    assert stream.detect_count == 1
+    assert stream.board_size == 19
+    assert _stones(results[1]) == _stones(results[0])
+
+def test_shifted_frame():
+    img = _frame()
+    stream = GrStream([img, _shift(img, 12, 9)])
+    results = [res for _, res in stream]
+
+    # Shift exceeds drift threshold, so the board is detected again
+    assert stream.detect_count == 2
+    assert results[1] is not None
+    assert results[1][GR_EDGES] != results[0][GR_EDGES]
+
+def test_small_shift():
+    img = _frame()
+    stream = GrStream([img, _shift(img, 2, 1)])
+    for _ in stream: pass
+    assert stream.detect_count == 1
+
+    # No drift check at all
+    stream = GrStream([img, _shift(img, 12, 9)], drift_threshold = None)
+    for _ in stream: pass
+    assert stream.detect_count == 1
+
+def test_no_board():
+    img = np.zeros((300, 300, 3), dtype = np.uint8)
+    stream = GrStream([img, _frame()])
+    results = [res for _, res in stream]
+
+    # Failed detection is retried on next frame
+    assert results[0] is None
+    assert results[1] is not None
+    assert stream.detect_count == 2
+
+def _params(name = 'go_board_2.gpar'):
+    params = GrParams()
+    with open(IMG_DIR.joinpath(name)) as f:
+        params.assign(json.load(f), copy_all = True)
+    return params.todict()
+
+def _positions(res):
+    return [sorted((int(s[GR_A]), int(s[GR_B])) for s in res[k]) for k in (GR_STONES_B, GR_STONES_W)]
+
+def _paste(img, res, src, dst, alpha = 1.0):
+    """Copies a cell from src position to dst one, blending it with given weight"""
+    edges, (space_x, space_y), size = res[GR_EDGES], res[GR_SPACING], res[GR_BOARD_SIZE]
+    def _cell(a, b):
+        x = int(round(edges[0][0] + (a - 1) * space_x))
+        y = int(round(edges[0][1] + (size - b) * space_y))
+        h = int(space_x / 2)
+        return slice(y - h, y + h + 1), slice(x - h, x + h + 1)
+
+    img = img.copy()
+    cell = _cell(*dst)
+    img[cell] = np.uint8(np.round(alpha * img[_cell(*src)] + (1 - alpha) * np.float32(img[cell])))
+    return img
+
+def _process(img, params, res):
+    p = dict(params, BOARD_EDGES = res[GR_EDGES], BOARD_SIZE = res[GR_BOARD_SIZE])
+    return process_img(img, p, debug = DEBUG_NONE)
+
+def test_no_change():
+    img, params = _frame(), _params()
+    stages = []
+    stream = GrStream([img, img.copy()], params, hook = lambda e: stages.append(e.stage))
+    results = [res for _, res in stream]
+
+    # Nothing is processed, previous results are returned
+    assert results[1] is results[0]
+    assert stages[-2:] == ['CHANGE_CHECK', 'CHANGE_CHECK']
+
+def test_changed_stone():
+    img, params = _frame(), _params()
+    res = GrStream([img], params).process_frame(img)
+
+    # A black stone put on an empty intersection
+    frame = _paste(img, res, (10, 11), (7, 10))
+    stages = []
+    stream = GrStream([img, frame], params, hook = lambda e: stages.append(e.stage))
+    results = [res for _, res in stream]
+
+    assert stages.count('AREA_MASK') == 2     # only stones are detected on second frame
+    assert (7, 10) in _positions(results[1])[0] and not (7, 10) in _positions(results[0])[0]
+    assert _positions(results[1]) == _positions(_process(frame, params, res))
+
+def test_changed_ring():
+    img, params = _frame(), _params()
+    res = GrStream([img], params).process_frame(img)
+
+    # A stone is put next to a changed cell in two steps, each below change threshold
+    frame1 = _paste(img, res, (10, 11), (7, 10))
+    half = _paste(frame1, res, (10, 11), (8, 10), 0.5)
+    frame2 = _paste(frame1, res, (10, 11), (8, 10))
+
+    x0, y0, x1, y1 = [b[19 - 10, 8 - 1] for b in cell_boxes(res[GR_EDGES], 19, img.shape)]
+    diff = cv2.absdiff(cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY), cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY))
+    threshold = 0.9 * np.mean(diff[y0:y1, x0:x1])
+
+    stream = GrStream([img, half, frame2], params, change_threshold = threshold)
+    results = [res for _, res in stream]
+
+    assert not (8, 10) in _positions(results[1])[0]
+    assert (8, 10) in _positions(results[2])[0]
+    assert _positions(results[2]) == _positions(_process(frame2, params, res))
@@ -0,0 +1,58 @@
+import sys
+sys.path.append('../')
+
+import cv2
+import numpy as np
+from imutils.perspective import four_point_transform
+
+from gr.grdef import *
+from gr.transform import GrTransformCache, warp_image, unwarp_stones, transform_cache
+
+RECT = [[60, 30], [420, 50], [440, 380], [20, 400]]
+
+def _img():
+    rng = np.random.default_rng(9)
+    img = cv2.resize(rng.integers(0, 255, (45, 48, 3), dtype = np.uint8), (480, 450))
+    return cv2.GaussianBlur(img, (5, 5), 0)
+
+def test_warp_image():
+    img = _img()
+    expected = four_point_transform(img, np.array(RECT))
+    warped = warp_image(img, RECT)
+    assert warped.shape == expected.shape
+    assert np.abs(np.int16(warped) - expected).max() <= 2
+
+    # Transformation is reused for any image of the same shape
+    hits = transform_cache.hits
+    warp_image(255 - img, RECT[::-1])
+    warp_image(img, RECT)
+    assert transform_cache.hits == hits + 2
+
+def test_transform_cache():
+    cache = GrTransformCache(max_size = 2)
+    t = cache.get(RECT, (450, 480, 3))
+    assert cache.get(RECT, (450, 480)) is t and cache.get(RECT, (451, 480)) is not t
+    cache.get(np.array(RECT) + 1, (450, 480))
+    assert len(cache) == 2 and cache.get(RECT, (450, 480)) is not t
+    assert cache.hits == 1 and cache.misses == 4
+
+def test_unwarp_stones():
+    # Grid of stones on transformed image maps back to the source points
+    t = transform_cache.get(RECT, (450, 480))
+    w, h = t.size
+    xy = np.array([[x, y] for x in np.linspace(0, w - 1, 5) for y in np.linspace(0, h - 1, 5)])
+    stones = np.column_stack([np.rint(xy), np.ones((len(xy), 2)), np.full(len(xy), 10)]).astype(int)
+    src = unwarp_stones(stones, RECT, (450, 480))
+
+    expected = cv2.perspectiveTransform(np.float64(stones[:, :2]).reshape(-1, 1, 2), t.inv_matrix).reshape(-1, 2)
+    assert np.abs(src[:, :2] - expected).max() <= 0.5
+    assert np.array_equal(src[:, GR_A:GR_B+1], stones[:, GR_A:GR_B+1])
+    assert np.abs(src[[0, 4, 20, 24], :2] - [RECT[0], RECT[3], RECT[1], RECT[2]]).max() <= 1
+
+    # Radiuses are scaled by area of a transformed pixel
+    d = np.array([[0, 0], [1, 0], [0, 1]])
+    p = cv2.perspectiveTransform(np.float64(stones[:, None, :2] + d), t.inv_matrix)
+    u, v = p[:, 1] - p[:, 0], p[:, 2] - p[:, 0]
+    scale = np.sqrt(np.abs(u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]))
+    assert np.abs(src[:, GR_R] - 10 * scale).max() <= 0.6
+    assert unwarp_stones(None, RECT, (450, 480)) is None
@@ -0,0 +1,38 @@
+import sys
+sys.path.append('../')
+
+import cv2
+import numpy as np
+
+from gr.utils import morph_kernel, GrBufferPool
+
+def test_morph_kernel():
+    k = morph_kernel(cv2.MORPH_ELLIPSE, 7, base_size = 100)
+    assert np.array_equal(k, cv2.resize(cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (100, 100)), (7, 7)))
+    assert morph_kernel(cv2.MORPH_ELLIPSE, 7, base_size = 100) is k and not k.flags.writeable
+    assert np.array_equal(morph_kernel(cv2.MORPH_RECT, 3), np.ones((3, 3), dtype = np.uint8))
+
+def test_buffer_pool():
+    pool = GrBufferPool()
+    img = np.zeros((20, 30), dtype = np.uint8)
+    buf = pool.like('A', img)
+    assert buf.shape == img.shape and pool.like('A', img) is buf
+    assert pool.get('A', (20, 30), np.float32) is not buf and pool.like('B', img) is not buf
+    _, thresh = cv2.threshold(img, 10, 255, cv2.THRESH_BINARY_INV, dst = pool.like('T', img))
+    assert thresh is pool.like('T', img) and np.all(thresh == 255)
+
+def test_image_planes():
+    from gr.planes import GrImagePlanes
+
+    rng = np.random.default_rng(5)
+    img = np.uint8(rng.integers(0, 256, (40, 60, 3)))
+    for planes in (GrImagePlanes(), GrImagePlanes(GrBufferPool())):
+        eq = planes.equalized(img)
+        assert planes.equalized(img) is eq and planes.channel(img, 2) is planes.channel(img, 2)
+        assert np.array_equal(planes.channel(img, 2), cv2.split(img)[2])
+        assert np.array_equal(planes.channel(eq, 0), cv2.split(eq)[0])
+        assert not np.shares_memory(planes.channel(img, 0), planes.channel(eq, 0))
+
+        l, a, b = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2LAB))
+        l = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8)).apply(l)
+        assert np.array_equal(eq, cv2.cvtColor(cv2.merge((l, a, b)), cv2.COLOR_LAB2BGR))
@@ -0,0 +1,43 @@
+import sys
+sys.path.append('../')
+
+import numpy as np
+import logging
+
+from gr.cv2_watershed import _find_peaks, apply_watershed
+
+logging.disable(logging.CRITICAL)
+
+def find_peaks_ref(thresh, stones):
+    """Loop-based peaks search _find_peaks() replaced"""
+    peaks = np.zeros(thresh.shape, dtype = np.int32)
+    for i in range(len(stones)):
+        x, y = int(stones[i,0]), int(stones[i,1])
+        for vy, vx in [(y, x)] + [(y+5-dy, x+5-dx) for dy in range(11) for dx in range(11)]:
+            if vx >= 0 and vy >= 0 and vx < thresh.shape[1] and vy < thresh.shape[0] and thresh[vy, vx] > 0:
+                peaks[vy, vx] = i + 1
+                break
+    return peaks
+
+def test_find_peaks():
+    rng = np.random.default_rng(4)
+    thresh = np.uint8(rng.random((120, 160)) > 0.97) * 255
+    stones = np.column_stack([rng.uniform(-8, 168, 150), rng.uniform(-8, 128, 150), rng.uniform(5, 10, 150)])
+    stones = np.concatenate([stones, stones[:10]])
+    assert np.array_equal(_find_peaks(thresh, stones), find_peaks_ref(thresh, stones))
+    assert not _find_peaks(thresh, np.zeros((0, 3))).any()
+
+def test_many_stones():
+    # More stones than 8-bit markers could label
+    thresh = np.zeros((300, 400), dtype = np.uint8)
+    stones = np.array([[10 + 20 * (i % 20), 10 + 20 * (i // 20), 6] for i in range(300)])
+    for x, y, r in stones:
+        thresh[y-r:y+r+1, x-r:x+r+1] = 255
+
+    peaks = _find_peaks(thresh, stones)
+    assert peaks.dtype == np.int32 and peaks.max() == 300
+    assert np.array_equal(peaks, find_peaks_ref(thresh, stones))
+
+    # First marker floods the flat background, so it is ignored for its size
+    found, _ = apply_watershed(thresh, stones, 127, 'W', f_img = False, max_r = 20)
+    assert sorted(map(tuple, found[:, 0:2].tolist())) == sorted(map(tuple, stones[1:, 0:2].tolist()))